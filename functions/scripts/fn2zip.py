@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Create a zip file for an Azure Functions (Python) deployment.
+
+The dependency layer (`.python_packages/lib/site-packages`) is installed,
+stripped and precompiled once per (requirements.txt, target interpreter,
+platform), and cached as a ready-made zip. A build with unchanged
+dependencies only compiles and appends the project files.
+
+Zips are reproducible: entries are sorted, timestamps and permissions are
+fixed (SOURCE_DATE_EPOCH is honoured), and `.pyc` files are hash-based, so
+they don't depend on file modification times.
+
+Usage:
+    ./scripts/fn2zip.py v2-blueprints
+    ./scripts/fn2zip.py -o dist/app.zip -e "docs/*" v2-blueprints
+    ./scripts/fn2zip.py --python python3.11 --platform manylinux2014_x86_64 v2-blueprints
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Iterable, List, Optional
+import zipfile
+
+
+SITE_PACKAGES = ".python_packages/lib/site-packages"
+LAYER_FORMAT = 2  # bump when the layer layout or stripping rules change
+EXCLUSIONS = [
+    ".pytest_cache/*",
+    "__pycache__/*",
+    "*.pyc",
+    "requirements*",
+    "tests/*",
+    "benchmarks/*",
+    "pytest*",
+    "*.sh",
+    "package.zip",
+    ".python_packages/*",
+]
+# Removed from the installed dependencies
+STRIP_DIRS = {"tests", "test", "__pycache__", "docs", "examples", "benchmarks"}
+STRIP_FILES = ["*.pyi", "py.typed", "*.c", "*.h", "*.pyx", "*.pxd", "*.md", "*.rst", "*.exe"]
+# What `importlib.metadata` (version lookups, entry points) still needs
+KEEP_DIST_INFO = {"METADATA", "entry_points.txt", "top_level.txt"}
+# License notices ship with the code they cover, wherever they are
+KEEP_FILES = ["license*", "licence*", "copying*", "notice*"]
+
+
+def log(message: str):
+    print(f"[fn2zip] {message}", flush=True)
+
+
+def interpreter_tag(python: str) -> dict:
+    code = (
+        "import json, sys, sysconfig; "
+        "print(json.dumps(dict(version=sys.version, impl=sys.implementation.cache_tag, "
+        "platform=sysconfig.get_platform())))"
+    )
+    return json.loads(subprocess.check_output([python, "-c", code], text=True))
+
+
+def layer_key(requirements: bytes, python: dict, platform: Optional[str], pip_args: List[str]) -> str:
+    h = hashlib.sha256()
+    parts = (
+        requirements,
+        json.dumps(python, sort_keys=True).encode(),
+        str(platform).encode(),
+        " ".join(pip_args).encode(),
+        str(LAYER_FORMAT).encode(),
+    )
+    for part in parts:
+        h.update(part)
+        h.update(b"\0")
+    return h.hexdigest()[:24]
+
+
+def is_notice(rel: Path) -> bool:
+    if rel.parts[0].endswith(".dist-info") and len(rel.parts) > 2 and rel.parts[1] == "licenses":
+        return True
+    return any(fnmatch.fnmatch(rel.name.lower(), pattern) for pattern in KEEP_FILES)
+
+
+def strip_layer(root: Path) -> int:
+    """Remove tests, sources of compiled extensions, stubs and dist-info bloat.
+
+    License notices (`KEEP_FILES`, `*.dist-info/licenses/`) are kept.
+    """
+    removed = 0
+    for path in sorted(root.rglob("*"), key=lambda p: len(p.parts), reverse=True):
+        if not path.exists():
+            continue
+        rel = path.relative_to(root)
+        top = rel.parts[0]
+        if path.is_dir():
+            if (top == "bin" and len(rel.parts) == 1) or (path.name in STRIP_DIRS and len(rel.parts) > 1):
+                removed += remove_tree(root, path)
+            continue
+        if is_notice(rel):
+            continue
+        if top.endswith(".dist-info"):
+            if len(rel.parts) > 2 or path.name not in KEEP_DIST_INFO:
+                removed += path.stat().st_size
+                path.unlink()
+        elif any(fnmatch.fnmatch(path.name, pattern) for pattern in STRIP_FILES):
+            removed += path.stat().st_size
+            path.unlink()
+    for path in sorted(root.rglob("*"), key=lambda p: len(p.parts), reverse=True):
+        if path.is_dir() and not any(path.iterdir()):
+            path.rmdir()
+    return removed
+
+
+def remove_tree(root: Path, path: Path) -> int:
+    """Delete the files under `path` except license notices (empty dirs go later)."""
+    removed = 0
+    for file in path.rglob("*"):
+        if file.is_file() and not is_notice(file.relative_to(root)):
+            removed += file.stat().st_size
+            file.unlink()
+    return removed
+
+
+def compile_pyc(python: str, root: Path, invalidation_mode: str, install_dir: str):
+    """Hash-based .pyc, with source paths as they will be on the host."""
+    subprocess.check_call([
+        python, "-m", "compileall", "-q", "-j", "0",
+        "--invalidation-mode", invalidation_mode,
+        "-s", str(root), "-p", install_dir,
+        str(root),
+    ])
+
+
+def zip_date_time() -> tuple:
+    epoch = int(os.environ.get("SOURCE_DATE_EPOCH", 315532800))  # 1980-01-01
+    return time.gmtime(max(epoch, 315532800))[:6]
+
+
+def add_files(zf: zipfile.ZipFile, root: Path, files: Iterable[Path], prefix: str = ""):
+    date_time = zip_date_time()
+    for path in sorted(files, key=lambda p: p.relative_to(root).as_posix()):
+        info = zipfile.ZipInfo(prefix + path.relative_to(root).as_posix(), date_time)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        mode = 0o755 if os.access(path, os.X_OK) else 0o644
+        info.external_attr = (0o100000 | mode) << 16
+        zf.writestr(info, path.read_bytes(), compresslevel=9)
+
+
+def build_layer(args, requirements: Path, layer_zip: Path, python: str):
+    with tempfile.TemporaryDirectory() as tmp:
+        target = Path(tmp) / "site-packages"
+        cmd = [
+            python, "-m", "pip", "install", "-q",
+            "--disable-pip-version-check", "--no-compile",
+            "--target", str(target), "-r", str(requirements),
+        ]
+        if args.platform:
+            cmd += ["--platform", args.platform, "--only-binary=:all:", "--implementation", "cp"]
+        cmd += args.pip_arg
+        log("Installing dependencies...")
+        subprocess.check_call(cmd)
+        removed = strip_layer(target)
+        log(f"Stripped {removed / 1e6:.1f} MB from the dependency layer")
+        # Dependencies are immutable once deployed: skip the hash check on import
+        compile_pyc(python, target, "unchecked-hash", f"{args.site_root}/{SITE_PACKAGES}")
+        partial = layer_zip.with_suffix(".partial")
+        with zipfile.ZipFile(partial, "w") as zf:
+            add_files(zf, target, [p for p in target.rglob("*") if p.is_file()], SITE_PACKAGES + "/")
+        partial.replace(layer_zip)
+
+
+def excluded(rel: str, patterns: List[str]) -> bool:
+    parts = rel.split("/")
+    for pattern in patterns:
+        pattern = pattern.rstrip("/")
+        if fnmatch.fnmatch(rel, pattern) or any(fnmatch.fnmatch(part, pattern) for part in parts):
+            return True
+        # "dir/*" also excludes dir itself and anything below it
+        if pattern.endswith("/*") and (rel == pattern[:-2] or rel.startswith(pattern[:-1])):
+            return True
+    return False
+
+
+def funcignore(project_dir: Path) -> List[str]:
+    path = project_dir / ".funcignore"
+    if not path.exists():
+        return []
+    lines = (line.strip() for line in path.read_text().splitlines())
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("project_dir")
+    parser.add_argument("-o", "--output", help="output zip (default: <project_dir>/package.zip)")
+    parser.add_argument(
+        "-e", "--exclude", action="append", default=[], help="glob to exclude, can be repeated or comma-separated"
+    )
+    parser.add_argument("--python", default=sys.executable, help="target interpreter, used for pip and .pyc")
+    parser.add_argument("--platform", help="pip --platform, to build for another OS/architecture")
+    parser.add_argument("--pip-arg", action="append", default=[], help="extra argument for pip install")
+    parser.add_argument("--site-root", default="/home/site/wwwroot", help="where the package is extracted on the host")
+    parser.add_argument("--cache-dir", default=os.environ.get("FN2ZIP_CACHE", Path.home() / ".cache" / "fn2zip"))
+    parser.add_argument("--no-cache", action="store_true", help="rebuild the dependency layer")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    project_dir = Path(args.project_dir).resolve()
+    output = Path(args.output).resolve() if args.output else project_dir / "package.zip"
+    requirements = project_dir / "requirements.txt"
+    patterns = EXCLUSIONS + funcignore(project_dir) + [p for e in args.exclude for p in e.split(",") if p]
+
+    python = interpreter_tag(args.python)
+    key = layer_key(requirements.read_bytes(), python, args.platform, args.pip_arg + [args.site_root])
+    cache_dir = Path(args.cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    layer_zip = cache_dir / f"layer-{python['impl']}-{key}.zip"
+    if args.no_cache or not layer_zip.exists():
+        build_layer(args, requirements, layer_zip, args.python)
+    else:
+        log(f"Using cached dependency layer {layer_zip.name}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Path(tmp) / "app"
+        shutil.copytree(
+            project_dir,
+            app,
+            ignore=lambda d, names: [
+                n for n in names
+                if excluded((Path(d) / n).relative_to(project_dir).as_posix(), patterns)
+            ],
+        )
+        compile_pyc(args.python, app, "checked-hash", args.site_root)
+        partial = Path(tmp) / "package.zip"
+        shutil.copyfile(layer_zip, partial)
+        with zipfile.ZipFile(partial, "a") as zf:
+            add_files(zf, app, [p for p in app.rglob("*") if p.is_file()])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(partial), output)
+
+    digest = hashlib.sha256(output.read_bytes()).hexdigest()[:16]
+    elapsed = time.perf_counter() - started
+    log(f"Created {output} ({output.stat().st_size / 1e6:.1f} MB, sha256 {digest}) in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
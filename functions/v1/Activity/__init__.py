@@ -1,13 +1,23 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import os
 import random
 import time
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def main(name: str):
+# Blocking work runs here rather than on the worker's own threads or event loop
+executor = ThreadPoolExecutor(int(os.environ.get("EXECUTOR_THREADS", 32)), thread_name_prefix="activity")
+
+
+def hello(name: str, i: int):
+  time.sleep(i)
+  return "Hello, " + name
+
+
+async def main(name: str):
   i = random.randint(1, 2)
   logger.warning(f"Sleeping for {i}s...")
-  time.sleep(i)
-  return "Hello, " + name
\ No newline at end of file
+  return await asyncio.get_running_loop().run_in_executor(executor, hello, name, i)
\ No newline at end of file
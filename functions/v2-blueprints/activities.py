@@ -1,45 +1,149 @@
-import asyncio
-import logging
+from datetime import datetime, timedelta, timezone
+import os
+import time
 
 import azure.durable_functions as df
 import aiohttp
 
+from cache import SqliteStore, TTLCache, normalize_key
+import executors
+from gazetteer import Gazetteer
+from http_pool import http_pool
+import logs
+import metrics
 from models import *
+import ratelimit
+import resilience
+from singleflight import SingleFlight
 
 
 bp = df.Blueprint()
+log = logs.get_logger(__name__)
 
-_session_mutex = asyncio.Lock()
-http_client = None
+geocoding_cache = TTLCache(
+    maxsize=int(os.environ.get("GEOCODING_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("GEOCODING_CACHE_TTL", 7 * 24 * 3600)),
+    store=(
+        SqliteStore(
+            os.environ["GEOCODING_CACHE_PATH"],
+            table="geocoding",
+            maxrows=int(os.environ.get("GEOCODING_CACHE_ROWS", 100_000)),
+        )
+        if os.environ.get("GEOCODING_CACHE_PATH")
+        else None
+    ),
+)
+# Offline index built with `python -m gazetteer build`, tried before the API
+gazetteer = Gazetteer(os.environ["GAZETTEER_PATH"]) if os.environ.get("GAZETTEER_PATH") else None
+weather_cache = TTLCache(
+    maxsize=int(os.environ.get("WEATHER_CACHE_SIZE", 4096)),
+    ttl=float(os.environ.get("WEATHER_CACHE_TTL", 900)),
+)
+# Concurrent activities for the same key share one upstream request
+geocoding_flight = SingleFlight(timeout=float(os.environ.get("SINGLEFLIGHT_TIMEOUT", 60)))
+weather_flight = SingleFlight(timeout=float(os.environ.get("SINGLEFLIGHT_TIMEOUT", 60)))
+metrics.registry.register_stats("cache", {"name": "geocoding"}, geocoding_cache.stats)
+metrics.registry.register_stats("cache", {"name": "weather"}, weather_cache.stats)
+if gazetteer is not None:
+    metrics.registry.register_stats("gazetteer", {}, gazetteer.stats)
+metrics.registry.register_stats("singleflight", {"name": "geocoding"}, geocoding_flight.stats)
+metrics.registry.register_stats("singleflight", {"name": "weather"}, weather_flight.stats)
+RATE_LIMIT_RETRIES = int(os.environ.get("RATE_LIMIT_RETRIES", 2))
+# Overridable to point at a stand-in, see benchmarks/fake_upstream.py
+GEOCODING_BASE_URL = os.environ.get("GEOCODING_BASE_URL", "https://geocode.maps.co").rstrip("/")
+WEATHER_BASE_URL = os.environ.get("WEATHER_BASE_URL", "https://api.open-meteo.com").rstrip("/")
 
 
-async def create_session_if_required():
-    # https://stackoverflow.com/a/66197605
-    global http_client
-    if http_client is None:
-        async with _session_mutex:
-            if http_client is None:
-                http_client = aiohttp.ClientSession()
+async def get_json(url: str, params: dict):
+    """GET through the host's rate limiter and resilience policy.
+
+    Each attempt waits for a token first, then goes through the upstream
+    policy: the deadline, breaker and latency samples only see the request
+    itself. A 429 slows the host's limiter down and is retried (up to
+    RATE_LIMIT_RETRIES times).
+    """
+    limiter = ratelimit.limiter(url)
+    upstream = resilience.upstream(url)
+
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        retry = attempt < RATE_LIMIT_RETRIES
+
+        async def request():
+            http_client = await http_pool.session()
+            async with http_client.get(url=url, params=params) as rsp:
+                if rsp.status == 429 and retry:
+                    raise resilience.Throttled(ratelimit.retry_after(rsp.headers.get("Retry-After")))
+                rsp.raise_for_status()
+                return await rsp.json()
+
+        await limiter.acquire()
+        try:
+            out = await upstream.call(request, may_hedge=limiter.try_acquire)
+        except resilience.Throttled as e:
+            limiter.on_throttled(e.retry_after)
+            log.warning("throttled", url=url, limiter=limiter.stats)
+            continue
+        limiter.on_success()
+        return out
 
 
 @bp.activity_trigger(input_name="name")
+@metrics.instrument("activity")
 async def get_geocoding(name: str) -> GeocodingOut:
+    key = normalize_key(name)
+    if key in geocoding_cache or (geocoding_cache.store is None and gazetteer is None):
+        cached = geocoding_cache.get(key)
+    else:
+        cached = await lookup_geocoding(name, key)
+    if cached is None:
+        cached = await geocoding_flight.do(key, lambda: fetch_geocoding(name, key))
+    return GeocodingOut.model_validate(cached)
+
+
+@executors.offload("threads")
+def lookup_geocoding(name: str, key: str):
+    """The persistent cache tier, then the gazetteer: both read from disk."""
+    cached = geocoding_cache.get(key)
+    if cached is None and gazetteer is not None:
+        cached = gazetteer.lookup(name)
+    return cached
+
+
+async def fetch_geocoding(name: str, key: str) -> dict:
     try:
-        await create_session_if_required()
-        async with http_client.get(url="https://geocode.maps.co/search", params=dict(city=name)) as rsp:
-            rsp.raise_for_status()
-            rsp_payload = await rsp.json()
+        rsp_payload = await get_json(f"{GEOCODING_BASE_URL}/search", params=dict(city=name))
     except aiohttp.ClientConnectionError as e:
-        logging.error(f"ClientConnectionError: {e}")
+        log.error("geocoding_connection_error", name=name, error=e)
         raise e
     if len(rsp_payload) == 0:
         raise RuntimeError(f"Could not fetch geocoding for {name}")
     resp = rsp_payload[0]
-    logging.warning(f"{name} geocoding: {resp}")
-    return GeocodingOut.model_validate(resp)
-    
+    log.warning("geocoding", name=name, response=resp)
+    out = GeocodingOut.model_validate(resp).model_dump()
+    geocoding_cache.set(key, out)
+    log.info("geocoding_cache", cache=geocoding_cache.stats, single_flight=geocoding_flight.stats)
+    return out
+
+
+def weather_expiry(out: WeatherOut, now: float) -> float:
+    """Start of the next `current` interval reported by open-meteo."""
+    interval = out.current.interval
+    if interval <= 0:
+        return now
+    try:
+        started = datetime.fromisoformat(out.current.time)
+    except ValueError:
+        return (now // interval + 1) * interval
+    if started.tzinfo is None:
+        started = started.replace(tzinfo=timezone.utc) - timedelta(seconds=out.utc_offset_seconds)
+    boundary = started.timestamp() + interval
+    if boundary <= now:
+        return (now // interval + 1) * interval
+    return boundary
+
 
 @bp.activity_trigger(input_name="latlon")
+@metrics.instrument("activity")
 async def get_city_weather(latlon: dict) -> WeatherOut:
     latlon = WeatherIn.model_validate(latlon)
     query_params = dict(
@@ -47,21 +151,42 @@ async def get_city_weather(latlon: dict) -> WeatherOut:
         longitude=round(float(latlon.lon), 3),
         current="temperature",
     )
+    key = (query_params["latitude"], query_params["longitude"])
+    cached = weather_cache.get(key)
+    if cached is None:
+        cached = await weather_flight.do(key, lambda: fetch_weather(query_params, key))
+    return WeatherOut.model_validate(cached)
+
+
+async def fetch_weather(query_params: dict, key: tuple) -> dict:
     try:
-        await create_session_if_required()
-        async with http_client.get(url="https://api.open-meteo.com/v1/forecast", params=query_params) as rsp:
-            rsp.raise_for_status()
-            rsp_content = await rsp.json()
+        rsp_content = await get_json(f"{WEATHER_BASE_URL}/v1/forecast", params=query_params)
     except aiohttp.ClientConnectionError as e:
-        logging.error(f"ClientConnectionError: {e}")
+        log.error("weather_connection_error", params=query_params, error=e)
         raise e
-    logging.warning(f"Weather: {rsp_content}")
+    log.warning("weather", response=rsp_content)
     out = WeatherOut.model_validate(rsp_content)
-    return out
+    now = time.time()
+    ttl = min(weather_expiry(out, now) - now, weather_cache.ttl)
+    if ttl > 0:
+        weather_cache.set(key, out.model_dump(), ttl=ttl)
+    return out.model_dump()
 
 
 @bp.activity_trigger(input_name="req")
+@metrics.instrument("activity")
 async def ask_for_feedback(req: dict) -> bool:
     req = FeedbackReq.model_validate(req)
-    logging.warning(f"Asking for feedback for instance_id: {req}")
+    log.warning("feedback_request", request=req)
     return "ok"
+
+
+@bp.activity_trigger(input_name="changes")
+@metrics.instrument("activity")
+async def notify_weather_changes(changes: list) -> int:
+    for change in changes:
+        change = WeatherChange.model_validate(change)
+        log.warning(
+            "weather_change", destination=change.destination, previous=change.previous, current=change.current, time=change.time
+        )
+    return len(changes)
@@ -0,0 +1,71 @@
+"""Approvals delivered before the feedback timer: one by one vs the bulk route.
+
+A stand-in client takes `--raise-ms` per `raise_event` call. "serial" is an
+approver POSTing each event and waiting for the answer; "bulk" is one
+`workflow-events/bulk` request at `--concurrency`. An approval counts as in
+time if it is delivered within `--timer-s` of the first one being sent.
+
+Usage (from v2-blueprints):
+    python -m benchmarks.bulk_events --approvals 500 --raise-ms 20 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import azure.functions as func
+
+from triggers import http_bulk_raise_event
+
+
+class Client:
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.delivered = []
+
+    async def raise_event(self, instance_id, event_name, event_data=None):
+        await asyncio.sleep(self.latency)
+        self.delivered.append(time.perf_counter())
+
+
+def report(label: str, started: float, client: Client, timer: float):
+    in_time = sum(1 for t in client.delivered if t - started <= timer)
+    elapsed = max(client.delivered) - started
+    print(f"{label:<28} delivered={len(client.delivered):>5} in_time={in_time:>5} last_ms={elapsed * 1000:9.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--approvals", type=int, default=500)
+    parser.add_argument("--raise-ms", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timer-s", type=float, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    items = [dict(instance_id=f"trip-{i}", payload={"feedback": "ok"}) for i in range(args.approvals)]
+
+    client = Client(args.raise_ms / 1000)
+    started = time.perf_counter()
+    for item in items:
+        await client.raise_event(item["instance_id"], "Approval", item["payload"])
+    report("serial", started, client, args.timer_s)
+
+    route = http_bulk_raise_event.build().get_user_function().client_function
+    client = Client(args.raise_ms / 1000)
+    req = func.HttpRequest(
+        method="POST",
+        url="http://localhost:7071/api/workflow-events/bulk",
+        params={"concurrency": str(args.concurrency)},
+        body=json.dumps(items).encode(),
+    )
+    started = time.perf_counter()
+    rsp = await route(req, client=client)
+    report(f"bulk concurrency={args.concurrency}", started, client, args.timer_s)
+    raise_ms = sorted(json.loads(line)["raise_ms"] for line in rsp.get_body().decode().splitlines())
+    print(f"{'':<28} raise_ms p50={raise_ms[len(raise_ms) // 2]:.1f} max={raise_ms[-1]:.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
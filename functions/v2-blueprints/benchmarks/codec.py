@@ -0,0 +1,64 @@
+"""Payload codec microbenchmark.
+
+Compares the plain `model_dump_json`/`model_validate_json` path with the
+pluggable codecs of `models.JsonSerializable` and the decode memo, which
+matters on replay when the same history payloads are decoded again.
+
+Usage (from v2-blueprints):
+    python -m benchmarks.codec --number 20000
+"""
+import argparse
+import timeit
+
+import models
+from models import *
+from tests.test_activities import GeocodingOutFactory, WeatherOutFactory
+
+
+def bench(label: str, fn, number: int):
+    seconds = min(timeit.repeat(fn, number=number, repeat=3))
+    print(f"{label:<40} {seconds / number * 1e6:8.2f} us/op")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--replays", type=int, default=50)
+    args = parser.parse_args()
+
+    payloads = {
+        "GeocodingOut": (GeocodingOut, GeocodingOutFactory.build()),
+        "WeatherOut": (WeatherOut, WeatherOutFactory.build()),
+    }
+    codecs = [PydanticCodec()]
+    if models.orjson is not None:
+        codecs.append(OrjsonCodec())
+
+    for name, (cls, model) in payloads.items():
+        data = model.model_dump_json()
+        bench(f"{name} model_dump_json", model.model_dump_json, args.number)
+        bench(f"{name} model_validate_json", lambda: cls.model_validate_json(data), args.number)
+        for codec in codecs:
+            models.set_codec(codec, memo_size=0)
+            bench(f"{name} {codec.name} to_json", model.to_json, args.number)
+            bench(f"{name} {codec.name} from_json", lambda: cls.from_json(data), args.number)
+        models.set_codec(PydanticCodec(), memo_size=1024)
+        cls.from_json(data)
+        bench(f"{name} memoized from_json", lambda: cls.from_json(data), args.number)
+
+    # A history of distinct payloads decoded once per replay
+    history = [WeatherOutFactory.build().model_dump_json() for _ in range(20)]
+
+    def replay():
+        for _ in range(args.replays):
+            for data in history:
+                WeatherOut.from_json(data)
+
+    for memo_size in (0, 1024):
+        models.set_codec(PydanticCodec(), memo_size=memo_size)
+        seconds = min(timeit.repeat(replay, number=10, repeat=3)) / 10
+        print(f"{'replay x' + str(args.replays) + ' memo=' + str(memo_size):<40} {seconds * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
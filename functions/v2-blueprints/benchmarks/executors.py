@@ -0,0 +1,97 @@
+"""Concurrent sync activity invocations per worker, inline vs. offloaded.
+
+"sync" is today's sync activity, run by the Python worker on its own thread
+pool (PYTHON_THREADPOOL_THREAD_COUNT, `--worker-threads`). "inline" calls the
+blocking body from an async activity, as happens when a sync call sneaks
+into `async def`: invocations serialize and the event loop stalls.
+"offload[...]" runs it through `executors.offload`. Loop lag is the worst
+delay seen by a 10ms ticker on the event loop, i.e. how long async
+activities such as `get_geocoding` would have been stalled.
+
+Usage (from v2-blueprints):
+    python -m benchmarks.executors --invocations 64 --work sleep --work-ms 100
+    python -m benchmarks.executors --invocations 16 --work cpu --work-ms 50
+"""
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import time
+
+import executors
+
+
+def blocking_io(ms: float) -> float:
+    time.sleep(ms / 1000)
+    return ms
+
+
+def cpu_bound(ms: float) -> float:
+    end = time.thread_time() + ms / 1000
+    n = 0
+    while time.thread_time() < end:
+        n += 1
+    return ms
+
+
+async def ticker(stop: asyncio.Event, lags: list, interval: float = 0.01):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def bench(label: str, call, invocations: int, work_ms: float):
+    stop, lags = asyncio.Event(), []
+    tick = asyncio.ensure_future(ticker(stop, lags))
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await asyncio.gather(*(call(work_ms) for _ in range(invocations)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+    print(
+        f"{label:<26} invocations={invocations:>5} wall_s={elapsed:7.3f} "
+        f"throughput={invocations / elapsed:8.1f}/s loop_lag_max_ms={max(lags, default=elapsed) * 1000:8.1f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invocations", type=int, default=64)
+    parser.add_argument("--work", choices=("sleep", "cpu"), default="sleep")
+    parser.add_argument("--work-ms", type=float, default=100)
+    parser.add_argument("--worker-threads", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    body = blocking_io if args.work == "sleep" else cpu_bound
+
+    async def inline(ms):
+        return body(ms)
+
+    worker_pool = ThreadPoolExecutor(args.worker_threads)
+
+    async def sync(ms):
+        return await asyncio.get_running_loop().run_in_executor(worker_pool, body, ms)
+
+    pools = [
+        executors.ManagedExecutor(f"threads[{args.threads}]", "threads", args.threads),
+        executors.ManagedExecutor(f"processes[{args.processes}]", "processes", args.processes),
+    ]
+    await bench(f"sync worker[{args.worker_threads}]", sync, args.invocations, args.work_ms)
+    worker_pool.shutdown()
+    await bench("inline", inline, args.invocations, args.work_ms)
+    for pool in pools:
+        call = executors.offload(pool)(body)
+        await call(0)  # start the workers
+        await bench(f"offload {pool.name}", call, args.invocations, args.work_ms)
+        stats = pool.stats()
+        print(f"{'':<26} queue_time_max_ms={stats['queue_time_max'] * 1000:8.1f} completed={stats['completed']}")
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,175 @@
+"""Local stand-in for the geocoding and weather APIs.
+
+Serves `/search` (geocode.maps.co) and `/v1/forecast` (open-meteo) with
+schema-valid payloads, with configurable latency, errors and throttling, so
+the app can be load tested offline. Point the activities at it with:
+
+    GEOCODING_BASE_URL=http://localhost:8081 WEATHER_BASE_URL=http://localhost:8081
+
+Usage (from v2-blueprints):
+    python -m benchmarks.fake_upstream --port 8081 --latency exp:80 --error-rate 0.01 --quota 20
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import logging
+import math
+import random
+import time
+from typing import Callable, Optional
+import zlib
+
+from aiohttp import web
+
+
+STATS = web.AppKey("stats", dict)
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Latency sampler in seconds from `fixed:MS`, `uniform:LO:HI`, `exp:MEAN` or `lognormal:MEDIAN:SIGMA`."""
+    kind, *args = spec.split(":")
+    values = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda rnd: values[0] / 1000
+    if kind == "uniform":
+        return lambda rnd: rnd.uniform(values[0], values[1]) / 1000
+    if kind == "exp":
+        return lambda rnd: rnd.expovariate(1 / values[0]) / 1000 if values[0] > 0 else 0.0
+    if kind == "lognormal":
+        return lambda rnd: rnd.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+@dataclass
+class Behaviour:
+    latency: Callable[[random.Random], float] = parse_latency("fixed:0")
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    # Requests per second per endpoint before answering 429 (0: unlimited)
+    quota: float = 0.0
+    retry_after: float = 1.0
+
+
+class Quota:
+    """Fixed one-second windows, like most public API quotas."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.window = 0
+        self.count = 0
+
+    def exceeded(self) -> bool:
+        if self.rate <= 0:
+            return False
+        window = int(time.monotonic())
+        if window != self.window:
+            self.window, self.count = window, 0
+        self.count += 1
+        return self.count > self.rate
+
+
+def place(name: str) -> dict:
+    """A deterministic `GeocodingOut` payload for a city name."""
+    seed = zlib.crc32(" ".join(name.lower().split()).encode())
+    lat = (seed % 17_000) / 100 - 85
+    lon = (seed // 17_000 % 36_000) / 100 - 180
+    return dict(
+        place_id=seed,
+        licence="Data © OpenStreetMap contributors, ODbL 1.0. https://osm.org/copyright",
+        powered_by="fake_upstream",
+        osm_type="relation",
+        osm_id=seed // 7,
+        boundingbox=[f"{lat - 0.2:.7f}", f"{lat + 0.2:.7f}", f"{lon - 0.2:.7f}", f"{lon + 0.2:.7f}"],
+        lat=f"{lat:.7f}",
+        lon=f"{lon:.7f}",
+        display_name=f"{name.title()}, Fakeland",
+        type="city",
+        importance=0.7,
+    )
+
+
+def forecast(latitude: float, longitude: float, now: Optional[datetime] = None) -> dict:
+    """A `WeatherOut` payload for the current 15 minute interval."""
+    now = now or datetime.now(timezone.utc)
+    interval = 900
+    started = datetime.fromtimestamp(now.timestamp() // interval * interval, timezone.utc)
+    temperature = round(30 - abs(latitude) / 3 + (zlib.crc32(started.isoformat().encode()) % 50) / 10, 1)
+    return dict(
+        latitude=latitude,
+        longitude=longitude,
+        generationtime_ms=0.02,
+        utc_offset_seconds=0,
+        timezone="GMT",
+        timezone_abbreviation="GMT",
+        elevation=42.0,
+        current_units=dict(time="iso8601", interval="seconds", temperature="°C"),
+        current=dict(time=started.strftime("%Y-%m-%dT%H:%M"), interval=interval, temperature=temperature),
+    )
+
+
+def create_app(behaviour: Behaviour, seed: Optional[int] = None) -> web.Application:
+    rnd = random.Random(seed)
+    stats = dict(requests=0, errors=0, throttled=0)
+    quotas = {}
+
+    async def respond(request: web.Request, payload: Callable[[], object]) -> web.Response:
+        stats["requests"] += 1
+        await asyncio.sleep(behaviour.latency(rnd))
+        quota = quotas.setdefault(request.path, Quota(behaviour.quota))
+        if quota.exceeded() or rnd.random() < behaviour.throttle_rate:
+            stats["throttled"] += 1
+            return web.json_response(
+                {"error": "Too Many Requests"}, status=429, headers={"Retry-After": f"{behaviour.retry_after:g}"}
+            )
+        if rnd.random() < behaviour.error_rate:
+            stats["errors"] += 1
+            return web.json_response({"error": "Injected failure"}, status=503)
+        return web.json_response(payload())
+
+    async def search(request: web.Request) -> web.Response:
+        name = request.query.get("city") or request.query.get("q", "")
+        return await respond(request, lambda: [place(name)] if name.strip() else [])
+
+    async def weather(request: web.Request) -> web.Response:
+        try:
+            latitude, longitude = float(request.query["latitude"]), float(request.query["longitude"])
+        except (KeyError, ValueError):
+            return web.json_response({"error": True, "reason": "latitude and longitude required"}, status=400)
+        return await respond(request, lambda: forecast(latitude, longitude))
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app[STATS] = stats
+    app.router.add_get("/search", search)
+    app.router.add_get("/v1/forecast", weather)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default="fixed:50", help="fixed:MS, uniform:LO:HI, exp:MEAN or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of random 429 responses")
+    parser.add_argument("--quota", type=float, default=0.0, help="requests/s per endpoint before 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    behaviour = Behaviour(
+        latency=parse_latency(args.latency),
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        quota=args.quota,
+        retry_after=args.retry_after,
+    )
+    web.run_app(create_app(behaviour, args.seed), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Build time, size, lookup latency and resident memory of the gazetteer index.
+
+Without `--source`, a synthetic GeoNames dump of `--places` rows is written
+first (a real `cities15000.txt` has about 30k). Memory is the growth of this
+process's resident set, and of its private part (the mapped index pages are
+file-backed and reclaimable), compared with loading the places into a dict.
+
+Usage (from v2-blueprints):
+    python -m benchmarks.gazetteer --places 200000 --lookups 20000
+    python -m benchmarks.gazetteer --source cities15000.txt --names Chicago Paris "Sao Paulo"
+"""
+import argparse
+import gc
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+
+from gazetteer import Gazetteer, build, normalize_name, read_geonames
+
+
+def rss_mb() -> tuple:
+    """(resident, private) MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident, shared = (int(v) * os.sysconf("SC_PAGE_SIZE") / 2**20 for v in f.read().split()[1:3])
+    except OSError:
+        return float("nan"), float("nan")
+    return resident, resident - shared
+
+
+def growth(label: str, before: tuple):
+    after = rss_mb()
+    print(f"{label:<24} rss +{after[0] - before[0]:6.1f} MB, private +{after[1] - before[1]:6.1f} MB")
+
+
+def synthetic(path: str, places: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    names = []
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(places):
+            name = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12))).title()
+            names.append(name)
+            population = int(rng.paretovariate(1.2) * 1000)
+            row = [str(i), name, name, "", f"{rng.uniform(-60, 70):.5f}", f"{rng.uniform(-180, 180):.5f}", "P", "PPL",
+                   rng.choice(("US", "FR", "BR", "IN", "DE")), "", f"{rng.randint(1, 50):02d}", "", "", "", str(population),
+                   "", "", "UTC", "2024-01-01"]
+            f.write("\t".join(row) + "\n")
+    return names
+
+
+def percentiles(label: str, samples: list):
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"{label:<24} p50={statistics.median(samples) * 1e6:8.1f} us p99={p99 * 1e6:8.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", help="GeoNames dump (default: synthetic)")
+    parser.add_argument("--places", type=int, default=200000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--names", nargs="*", default=[])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        source = args.source
+        names = args.names
+        if source is None:
+            source = os.path.join(root, "cities.txt")
+            names = names or synthetic(source, args.places)
+        names = names or [p["name"] for _, p in read_geonames(source)]
+        path = os.path.join(root, "gazetteer.idx")
+        started = time.perf_counter()
+        info = build(read_geonames(source), path)
+        print(f"build {info} in {time.perf_counter() - started:.2f}s")
+
+        gc.collect()
+        before = rss_mb()
+        started = time.perf_counter()
+        gazetteer = Gazetteer(path)
+        print(f"open                     {(time.perf_counter() - started) * 1e6:8.1f} us")
+        rng = random.Random(2)
+        queries = [rng.choice(names) for _ in range(args.lookups)]
+        hits = []
+        for name in queries:
+            started = time.perf_counter()
+            gazetteer.lookup(name)
+            hits.append(time.perf_counter() - started)
+        misses = []
+        for name in queries[: args.lookups // 10]:
+            started = time.perf_counter()
+            gazetteer.lookup(name + "zz")
+            misses.append(time.perf_counter() - started)
+        prefixes = []
+        for name in queries[: args.lookups // 10]:
+            started = time.perf_counter()
+            gazetteer.prefix(name[:3])
+            prefixes.append(time.perf_counter() - started)
+        percentiles("lookup (hit)", hits)
+        percentiles("lookup (miss)", misses)
+        percentiles("prefix (3 chars)", prefixes)
+        growth("mmap index", before)
+        print(f"{'':<24} after {len(queries)} lookups, {info['bytes'] / 2**20:.1f} MB file")
+        gazetteer.close()
+
+        gc.collect()
+        before = rss_mb()
+        in_memory = {}
+        for row_names, place in read_geonames(source):
+            for key in {normalize_name(n) for n in row_names}:
+                in_memory.setdefault(key, place)
+        growth("dict", before)
+
+
+if __name__ == "__main__":
+    main()
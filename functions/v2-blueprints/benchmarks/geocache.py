@@ -0,0 +1,68 @@
+"""GeoCache hit vs. miss cost for `trip` on the in-process replay engine.
+
+A miss calls `get_geocoding`, simulated as `--upstream-ms` of latency; a hit
+is answered by the `geo_cache` entity.
+
+Usage (from v2-blueprints):
+    python -m benchmarks.geocache --runs 50 --upstream-ms 150
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+import logging
+import statistics
+import time
+
+import activities
+import entities
+import orchestrators
+from models import *
+from tests.replay import ReplayEngine
+from tests.test_activities import GeocodingOutFactory, WeatherOutFactory
+
+
+async def run_trip(engine: ReplayEngine, instance_id: str):
+    engine.raise_event(instance_id, "Approval", {"feedback": "ok"}, at=timedelta(seconds=1))
+    input_ = OrchestratorIn(callback_uri_template="http://localhost/{eventName}", client_input={"destination": "Chicago"})
+    started = time.perf_counter()
+    result = await engine.run("trip", input_.model_dump(), instance_id=instance_id)
+    return time.perf_counter() - started, result
+
+
+async def bench(runs: int, upstream_ms: float):
+    geocoding, weather = GeocodingOutFactory.build(), WeatherOutFactory.build()
+
+    async def get_geocoding(name):
+        await asyncio.sleep(upstream_ms / 1000)
+        return geocoding
+
+    engine = ReplayEngine.from_modules(activities, orchestrators, entities)
+    engine.activities["get_geocoding"] = get_geocoding
+    engine.activities["get_city_weather"] = lambda latlon: weather
+    misses, hits = [], []
+    for i in range(runs):
+        entity_id = entities.geocache_id(orchestrators.normalize_key("Chicago"))
+        engine.entity_states.pop((entity_id.name, entity_id.key), None)
+        misses.append(await run_trip(engine, f"miss-{i}"))
+        hits.append(await run_trip(engine, f"hit-{i}"))
+    for label, samples in (("miss", misses), ("hit", hits)):
+        walls = [wall * 1000 for wall, _ in samples]
+        last = samples[-1][1]
+        print(
+            f"trip geocache {label:<5} history_events={last.history_events:>4} "
+            f"history_bytes={last.history_bytes:>6} "
+            f"wall_ms p50={statistics.median(walls):8.3f} max={max(walls):8.3f}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--upstream-ms", type=float, default=150)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    await bench(args.runs, args.upstream_ms)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
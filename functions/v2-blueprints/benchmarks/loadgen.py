@@ -0,0 +1,176 @@
+"""Load generator for `workflow/{workflow_name}`.
+
+Starts orchestrations at a fixed rate (open loop) or with a fixed number of
+concurrent clients (closed loop), optionally approves them and waits for them
+to finish, and reports throughput and latency percentiles of the start
+requests and of the orchestrations end to end.
+
+Usage (from v2-blueprints, with the app and benchmarks.fake_upstream running):
+    python -m benchmarks.loadgen --workflow trip --rate 20 --duration 60 --approve --wait
+    python -m benchmarks.loadgen --workflow itinerary --concurrency 8 --requests 200 \\
+        --input '{"destinations": ["Chicago", "Milan"]}'
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import itertools
+import json
+import logging
+import time
+from typing import List, Optional
+
+import aiohttp
+
+
+TERMINAL_STATUSES = {"Completed", "Failed", "Canceled", "Terminated"}
+
+
+@dataclass
+class Results:
+    started: List[float] = field(default_factory=list)
+    completed: List[float] = field(default_factory=list)
+    statuses: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+    def error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def summary(label: str, values: List[float], elapsed: float) -> str:
+    ms = [v * 1000 for v in values]
+    return (
+        f"{label:<10} n={len(values):>6} throughput={len(values) / elapsed:8.2f}/s "
+        f"p50={percentile(ms, 0.5):9.1f}ms p90={percentile(ms, 0.9):9.1f}ms "
+        f"p99={percentile(ms, 0.99):9.1f}ms max={max(ms, default=float('nan')):9.1f}ms"
+    )
+
+
+class LoadGenerator:
+
+    def __init__(
+        self,
+        base_url: str,
+        workflow: str,
+        inputs: List[dict],
+        approve: bool = False,
+        wait: bool = False,
+        poll_interval: float = 0.5,
+        timeout: float = 120,
+    ):
+        self.url = f"{base_url.rstrip('/')}/api/workflow/{workflow}"
+        self.inputs = itertools.cycle(inputs)
+        self.approve = approve
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.results = Results()
+
+    async def one(self, session: aiohttp.ClientSession):
+        started = time.perf_counter()
+        try:
+            async with session.post(self.url, json=next(self.inputs)) as rsp:
+                if rsp.status >= 400:
+                    self.results.error(f"start_{rsp.status}")
+                    return
+                mgmt = await rsp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.results.error(type(e).__name__)
+            return
+        self.results.started.append(time.perf_counter() - started)
+        if self.approve:
+            uri = mgmt["sendEventPostUri"].replace("{eventName}", "Approval")
+            async with session.post(uri, json={"feedback": "ok"}) as rsp:
+                if rsp.status >= 400:
+                    self.results.error(f"approve_{rsp.status}")
+        if self.wait:
+            status = await self.wait_for(session, mgmt["statusQueryGetUri"])
+            self.results.statuses[status] = self.results.statuses.get(status, 0) + 1
+            if status in TERMINAL_STATUSES:
+                self.results.completed.append(time.perf_counter() - started)
+
+    async def wait_for(self, session: aiohttp.ClientSession, status_uri: str) -> str:
+        deadline = time.monotonic() + self.timeout
+        status = "Unknown"
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(status_uri) as rsp:
+                    if rsp.status < 500:
+                        status = (await rsp.json(content_type=None) or {}).get("runtimeStatus", status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.results.error(f"status_{type(e).__name__}")
+            if status in TERMINAL_STATUSES:
+                return status
+            await asyncio.sleep(self.poll_interval)
+        return "TimedOut"
+
+    async def open_loop(self, session: aiohttp.ClientSession, rate: float, duration: float, requests: Optional[int]):
+        """Start `rate` orchestrations per second, whatever the response times."""
+        tasks = []
+        begin = time.perf_counter()
+        for i in itertools.count():
+            if requests is not None and i >= requests:
+                break
+            at = begin + i / rate
+            if at - begin >= duration:
+                break
+            await asyncio.sleep(max(at - time.perf_counter(), 0))
+            tasks.append(asyncio.ensure_future(self.one(session)))
+        await asyncio.gather(*tasks)
+
+    async def closed_loop(self, session: aiohttp.ClientSession, concurrency: int, duration: float, requests: Optional[int]):
+        """`concurrency` clients, each starting the next orchestration when done."""
+        counter = itertools.count()
+        end = time.perf_counter() + duration
+
+        async def client():
+            while time.perf_counter() < end and (requests is None or next(counter) < requests):
+                await self.one(session)
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:7071")
+    parser.add_argument("--workflow", default="trip")
+    parser.add_argument("--input", action="append", help="JSON client input, may be repeated (default: a few destinations)")
+    parser.add_argument("--rate", type=float, help="open loop: orchestrations started per second")
+    parser.add_argument("--concurrency", type=int, default=8, help="closed loop: concurrent clients")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--requests", type=int, help="stop after this many starts")
+    parser.add_argument("--approve", action="store_true", help="raise the Approval event right after starting")
+    parser.add_argument("--wait", action="store_true", help="poll until the orchestrations finish")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    inputs = [json.loads(i) for i in args.input] if args.input else [
+        {"destination": d} for d in ("Chicago", "Milan", "Tokyo", "Lima", "Nairobi")
+    ]
+    gen = LoadGenerator(args.base_url, args.workflow, inputs, args.approve, args.wait, args.poll_interval, args.timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=args.timeout)) as session:
+        began = time.perf_counter()
+        if args.rate:
+            await gen.open_loop(session, args.rate, args.duration, args.requests)
+        else:
+            await gen.closed_loop(session, args.concurrency, args.duration, args.requests)
+        elapsed = time.perf_counter() - began
+    results = gen.results
+    print(summary("start", results.started, elapsed))
+    if args.wait:
+        print(summary("end2end", results.completed, elapsed))
+        print(f"statuses: {results.statuses}")
+    if results.errors:
+        print(f"errors: {results.errors}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
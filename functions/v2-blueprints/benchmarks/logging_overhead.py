@@ -0,0 +1,106 @@
+"""Caller-side cost of logging a payload, before and after `logs`.
+
+"before" is the f-string `logging.warning` the activities used to do, "after"
+is `logs.EventLogger` directly on the handler, behind the queue, sampled, and
+suppressed during replay. The handler writes to a file and then sleeps
+`--handler-us` to stand in for the host's log transport.
+
+Usage (from v2-blueprints):
+    python -m benchmarks.logging_overhead --number 5000 --handler-us 50
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+import timeit
+
+import logs
+from models import *
+from tests.test_activities import GeocodingOutFactory, WeatherOutFactory
+
+
+class SlowFileHandler(logging.FileHandler):
+
+    def __init__(self, path: str, delay: float):
+        super().__init__(path)
+        self.delay = delay
+
+    def emit(self, record):
+        super().emit(record)
+        time.sleep(self.delay)  # I/O: releases the GIL
+
+
+class Context:
+
+    def __init__(self, is_replaying: bool):
+        self.is_replaying = is_replaying
+
+
+def bench(label: str, fn, number: int) -> float:
+    seconds = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    print(f"{label:<44} {seconds * 1e6:8.2f} us/call")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=5000)
+    parser.add_argument("--handler-us", type=float, default=50)
+    parser.add_argument("--sample-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    geocoding = GeocodingOutFactory.build().model_dump()
+    weather = WeatherOutFactory.build()
+    logger = logging.getLogger("benchmarks.logging_overhead")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    log = logs.EventLogger(logger)
+    replaying = Context(True)
+
+    with tempfile.TemporaryDirectory() as root:
+        handler = SlowFileHandler(os.path.join(root, "log.txt"), args.handler_us / 1e6)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+
+        def before():
+            logger.warning(f"Chicago geocoding: {geocoding}")
+            logger.warning(f"Weather: {weather}")
+
+        def before_disabled():
+            logger.debug(f"Chicago geocoding: {geocoding}")
+            logger.debug(f"Weather: {weather}")
+
+        def after():
+            log.warning("geocoding", name="Chicago", response=geocoding)
+            log.warning("weather", response=weather)
+
+        def after_disabled():
+            log.debug("geocoding", name="Chicago", response=geocoding)
+            log.debug("weather", response=weather)
+
+        def after_replaying():
+            log.warning("geocoding", context=replaying, name="Chicago", response=geocoding)
+            log.warning("weather", context=replaying, response=weather)
+
+        base = bench("before: f-string, handler inline", before, args.number)
+        bench("before: f-string, level disabled", before_disabled, args.number)
+        bench("after: fields, handler inline", after, args.number)
+        bench("after: fields, level disabled", after_disabled, args.number)
+        bench("after: fields, replaying", after_replaying, args.number)
+
+        # Large enough for every record of a run, so nothing is dropped
+        logs.install(logger, maxsize=args.number * 2 * 3 + 1)
+        queued = bench("after: fields, queued", after, args.number)
+        logs.SAMPLING.update(geocoding=args.sample_rate, weather=args.sample_rate)
+        sampled = bench(f"after: fields, queued, sampled {args.sample_rate:g}", after, args.number)
+        started = time.perf_counter()
+        logs.uninstall()
+        print(f"{'listener drain after the runs':<44} {(time.perf_counter() - started) * 1000:8.2f} ms")
+        print(f"queued: {base / queued:.1f}x less caller time, sampled: {base / sampled:.1f}x; {logs.stats.as_dict()}")
+        logger.removeHandler(handler)
+        handler.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Overhead of `metrics.instrument` on trivial functions.
+
+Usage (from v2-blueprints):
+    python -m benchmarks.metrics_overhead --number 20000
+"""
+import argparse
+import asyncio
+import timeit
+
+import metrics
+from models import *
+from tests.test_activities import WeatherOutFactory
+
+
+def bench(label: str, fn, number: int) -> float:
+    seconds = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    print(f"{label:<52} {seconds * 1e6:8.2f} us/op")
+    return seconds
+
+
+class Context:
+    is_replaying = False
+
+
+def orchestrator(context):
+    a = yield "a"
+    b = yield "b"
+    return [a, b]
+
+
+def drive(orchestrator_fn):
+    gen = orchestrator_fn(Context())
+    value = None
+    try:
+        while True:
+            value = gen.send(value)
+    except StopIteration as e:
+        return e.value
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    weather = WeatherOutFactory.build()
+
+    def activity(latlon):
+        return weather
+
+    async def async_activity(latlon):
+        return weather
+
+    loop = asyncio.new_event_loop()
+
+    def run_async(fn):
+        return lambda: loop.run_until_complete(fn("41.88,-87.63"))
+
+    for sizes in (True, False):
+        metrics.PAYLOAD_SIZES = sizes
+        suffix = "" if sizes else " (no payload sizes)"
+        raw = bench("sync activity raw", lambda: activity("41.88,-87.63"), args.number)
+        inst = metrics.instrument("activity")(activity)
+        wrapped = bench(f"sync activity instrumented{suffix}", lambda: inst("41.88,-87.63"), args.number)
+        print(f"{'':<52} +{(wrapped - raw) * 1e6:7.2f} us/op")
+
+        raw = bench("async activity raw", run_async(async_activity), args.number)
+        inst_async = metrics.instrument("activity")(async_activity)
+        wrapped = bench(f"async activity instrumented{suffix}", run_async(inst_async), args.number)
+        print(f"{'':<52} +{(wrapped - raw) * 1e6:7.2f} us/op")
+
+        raw = bench("orchestrator episode raw", lambda: drive(orchestrator), args.number)
+        inst_orch = metrics.instrument("orchestrator")(orchestrator)
+        wrapped = bench(f"orchestrator episode instrumented{suffix}", lambda: drive(inst_orch), args.number)
+        print(f"{'':<52} +{(wrapped - raw) * 1e6:7.2f} us/op")
+    loop.close()
+
+    print(f"{'render()':<52}", end="")
+    number = max(args.number // 100, 1)
+    seconds = min(timeit.repeat(metrics.render, number=number, repeat=3)) / number
+    print(f" {seconds * 1e6:8.2f} us/op")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Replay cost of `weather_monitor` over many polls, with and without continue_as_new.
+
+With `--polls-per-generation` >= `--polls` the monitor is a plain timer loop:
+every episode replays the whole history so far, and episode time grows with
+the number of polls (quadratic total, hence the shorter `--baseline-polls`).
+With continue_as_new it stays flat.
+
+Usage (from v2-blueprints):
+    python -m benchmarks.monitor --polls 5000 --polls-per-generation 20 --baseline-polls 500
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+import logging
+import statistics
+
+import activities
+import entities
+import orchestrators
+from models import *
+from tests.replay import ReplayEngine
+from tests.test_activities import GeocodingOutFactory, WeatherOutFactory
+
+
+async def bench(polls: int, polls_per_generation: int, destinations: int, checkpoints: int):
+    geocoding = GeocodingOutFactory.build()
+    temperatures = iter(range(10**9))
+    engine = ReplayEngine.from_modules(activities, orchestrators, entities)
+    engine.activities["get_geocoding"] = lambda name: geocoding
+    engine.activities["get_city_weather"] = lambda latlon: WeatherOutFactory.build(
+        current=dict(time="2024-01-01T00:00", interval=900, temperature=next(temperatures) % 7)
+    )
+    engine.activities["notify_weather_changes"] = lambda changes: len(changes)
+    interval = 900
+    client_input = MonitorIn(
+        destinations=[f"City {n}" for n in range(destinations)],
+        interval=interval,
+        polls_per_generation=polls_per_generation,
+        until=(engine.start + timedelta(seconds=interval * (polls - 1))).isoformat(),
+    )
+    input_ = OrchestratorIn(callback_uri_template="http://localhost/{eventName}", client_input=client_input.model_dump())
+    result = await engine.run("weather_monitor", input_.model_dump(), instance_id="monitor")
+    assert result.status == "Completed", result.error
+    episodes = result.episodes
+    label = f"polls_per_generation={polls_per_generation}"
+    print(
+        f"{label:<28} polls={polls} generations={result.generations} episodes={len(episodes)} "
+        f"max_history_events={max(e.history_events for e in episodes)} "
+        f"total_s={sum(e.wall_time for e in episodes):8.3f}"
+    )
+    size = max(len(episodes) // checkpoints, 1)
+    for start in range(0, len(episodes), size):
+        window = episodes[start : start + size]
+        print(
+            f"{'':<28} episodes {start:>6}-{start + len(window) - 1:<6} "
+            f"episode_ms p50={statistics.median(e.wall_time for e in window) * 1000:8.3f} "
+            f"history_events p50={statistics.median(e.history_events for e in window):8.0f}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--polls", type=int, default=2000)
+    parser.add_argument("--baseline-polls", type=int, default=300, help="polls of the timer loop without continue_as_new")
+    parser.add_argument("--polls-per-generation", type=int, default=20)
+    parser.add_argument("--destinations", type=int, default=3)
+    parser.add_argument("--checkpoints", type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    await bench(args.polls, args.polls_per_generation, args.destinations, args.checkpoints)
+    await bench(args.baseline_polls, args.baseline_polls, args.destinations, args.checkpoints)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
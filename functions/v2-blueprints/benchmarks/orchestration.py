@@ -0,0 +1,111 @@
+"""Orchestration cost benchmark on the in-process replay engine.
+
+Usage (from v2-blueprints):
+    python -m benchmarks.orchestration --runs 100 --fanout 200
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+import logging
+import random
+import statistics
+
+import activities
+import entities
+import orchestrators
+from models import *
+from tests.replay import ReplayEngine
+from tests.test_activities import GeocodingOutFactory, WeatherOutFactory
+
+
+def fan_out(context):
+    names = context.get_input()
+    results = yield context.task_all([context.call_activity("greet", n) for n in names])
+    return results
+
+
+def report(label: str, results: list):
+    walls = [r.wall_time * 1000 for r in results]
+    last = results[-1]
+    print(
+        f"{label:<28} episodes={len(last.episodes):>5} replays={last.replays:>5} "
+        f"history_events={last.history_events:>6} history_bytes={last.history_bytes:>8} "
+        f"wall_ms p50={statistics.median(walls):8.3f} max={max(walls):8.3f}"
+    )
+
+
+async def bench_trip(runs: int):
+    geocoding, weather = GeocodingOutFactory.build(), WeatherOutFactory.build()
+    results = []
+    for i in range(runs):
+        engine = ReplayEngine.from_modules(activities, orchestrators, entities)
+        engine.activities["get_geocoding"] = lambda name: geocoding
+        engine.activities["get_city_weather"] = lambda latlon: weather
+        engine.raise_event(f"trip-{i}", "Approval", {"feedback": "ok"}, at=timedelta(seconds=1))
+        input_ = OrchestratorIn(callback_uri_template="http://localhost/{eventName}", client_input={"destination": "Chicago"})
+        results.append(await engine.run("trip", input_.model_dump(), instance_id=f"trip-{i}"))
+    report("trip", results)
+
+
+async def bench_itinerary(runs: int, destinations: int):
+    """Virtual time until the feedback request, with random activity latencies."""
+    geocoding, weather = GeocodingOutFactory.build(), WeatherOutFactory.build()
+    rnd = random.Random(0)
+    results, pipelined, phased, sequential = [], [], [], []
+    for i in range(runs):
+        names = [f"City {n}" for n in range(destinations)]
+        geocode_s = {name: rnd.uniform(0.1, 2) for name in names}
+        weather_s = [rnd.uniform(0.1, 2) for _ in names]
+        # Every city geocodes to a distinct latitude so its weather latency can be found
+        lats = {name: str(n) for n, name in enumerate(names)}
+        engine = ReplayEngine.from_modules(
+            activities, orchestrators, entities,
+            latencies={
+                "get_geocoding": lambda name: timedelta(seconds=geocode_s[name]),
+                "get_city_weather": lambda latlon: timedelta(seconds=weather_s[int(latlon["lat"])]),
+            },
+        )
+        engine.activities["get_geocoding"] = lambda name: geocoding.model_copy(update=dict(lat=lats[name]))
+        engine.activities["get_city_weather"] = lambda latlon: weather
+        input_ = OrchestratorIn(callback_uri_template="http://localhost/{eventName}", client_input={"destinations": names})
+        result = await engine.run("itinerary", input_.model_dump(), instance_id=f"itinerary-{i}")
+        results.append(result)
+        # The feedback timer starts when the feedback is requested
+        pipelined.append((result.completed_at - engine.start).total_seconds() - 5)
+        phased.append(max(geocode_s.values()) + max(weather_s))
+        sequential.append(sum(geocode_s.values()) + sum(weather_s))
+    report(f"itinerary[{destinations}]", results)
+    print(
+        f"{'':<28} virtual_s p50 pipelined={statistics.median(pipelined):6.2f} "
+        f"phase_barrier={statistics.median(phased):6.2f} sequential={statistics.median(sequential):6.2f}"
+    )
+
+
+async def bench_fan_out(runs: int, fanout: int, batch_completions: bool):
+    results = []
+    for _ in range(runs):
+        engine = ReplayEngine(
+            activities={"greet": lambda name: f"Hello {name}"},
+            orchestrators={"fan_out": fan_out},
+            batch_completions=batch_completions,
+        )
+        results.append(await engine.run("fan_out", [str(n) for n in range(fanout)]))
+    mode = "batched" if batch_completions else "one-by-one"
+    report(f"fan_out[{fanout}] {mode}", results)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--fanout", type=int, default=100)
+    parser.add_argument("--destinations", type=int, default=10)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    await bench_trip(args.runs)
+    await bench_itinerary(args.runs, args.destinations)
+    await bench_fan_out(args.runs, args.fanout, batch_completions=True)
+    await bench_fan_out(max(args.runs // 10, 1), args.fanout, batch_completions=False)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
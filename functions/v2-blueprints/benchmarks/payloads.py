@@ -0,0 +1,105 @@
+"""History size and replay time with and without the payload layer.
+
+"itinerary" runs the real orchestrator on realistic, mostly small payloads
+(`benchmarks.fake_upstream`); only the consolidated feedback request grows
+with the number of destinations. "large" has an activity return a
+`--payload-kb` result that the orchestrator only passes on, followed by
+`--steps` more activities, so the result is replayed once per step.
+
+Usage (from v2-blueprints):
+    python -m benchmarks.payloads --destinations 100 --payload-kb 256 --runs 5
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import tempfile
+
+import activities
+from benchmarks.fake_upstream import forecast, place
+import entities
+import orchestrators
+import payloads
+from models import *
+from tests.replay import ReplayEngine
+
+
+def large(context):
+    report = yield context.call_activity("build_report", None)
+    for step in range(context.get_input()):
+        yield context.call_activity("step", step)
+    yield context.call_activity("publish_report", report)
+    return None
+
+
+def build_report(size: int) -> FeedbackReq:
+    workflows = []
+    while len(workflows) * 90 < size:
+        workflows.append(WorkflowOut(destination=f"City {len(workflows)}", lat="41.88", lon="-87.63", current_temp=12.5))
+    return FeedbackReq(output=dict(workflows=[w.model_dump() for w in workflows]), callback_uri="http://localhost/{eventName}")
+
+
+async def bench_large(label: str, runs: int, payload_kb: int, steps: int):
+    report = build_report(payload_kb * 1024)
+    results = []
+    for _ in range(runs):
+        engine = ReplayEngine(
+            activities={"build_report": lambda _: report, "step": lambda step: step, "publish_report": lambda r: None},
+            orchestrators={"large": large},
+        )
+        result = await engine.run("large", steps)
+        assert result.status == "Completed", result.error
+        results.append(result)
+    report_line(f"large {label}", results)
+
+
+def report_line(label: str, results: list):
+    totals = [sum(e.wall_time for e in r.episodes) * 1000 for r in results]
+    last = results[-1]
+    print(
+        f"{label:<30} episodes={len(last.episodes):>4} history_bytes={last.history_bytes:>8} "
+        f"replay_total_ms p50={statistics.median(totals):8.2f} max={max(totals):8.2f}"
+    )
+
+
+async def bench(label: str, runs: int, destinations: int):
+    names = [f"City {n}" for n in range(destinations)]
+    results = []
+    for i in range(runs):
+        engine = ReplayEngine.from_modules(activities, orchestrators, entities, batch_completions=False)
+        engine.activities["get_geocoding"] = lambda name: GeocodingOut.model_validate(place(name))
+        engine.activities["get_city_weather"] = lambda latlon: WeatherOut.model_validate(
+            forecast(float(latlon["lat"]), float(latlon["lon"]))
+        )
+        input_ = OrchestratorIn(callback_uri_template="http://localhost/{eventName}", client_input={"destinations": names})
+        result = await engine.run("itinerary", input_.model_dump(), instance_id=f"itinerary-{i}")
+        assert result.status == "Completed", result.error
+        results.append(result)
+    report_line(f"itinerary {label}", results)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--destinations", type=int, default=100)
+    parser.add_argument("--payload-kb", type=int, default=256)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--compress-threshold", type=int, default=payloads.compress_threshold)
+    parser.add_argument("--claim-check-threshold", type=int, default=16384)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as root:
+        settings = [
+            ("plain", dict(compress_threshold=0, store=None)),
+            ("compressed", dict(compress_threshold=args.compress_threshold)),
+            ("claim-check", dict(claim_check_threshold=args.claim_check_threshold, store=payloads.FileBlobStore(root))),
+        ]
+        for label, config in settings:
+            payloads.configure(**config)
+            await bench(label, args.runs, args.destinations)
+            await bench_large(label, args.runs, args.payload_kb, args.steps)
+    print(payloads.stats.as_dict())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
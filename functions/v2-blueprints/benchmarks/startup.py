@@ -0,0 +1,170 @@
+"""Cold start benchmark: import cost per module and time to first invocation.
+
+Each run is a fresh interpreter that imports `function_app` under
+`python -X importtime` and then runs the first episode of an orchestrator
+through its real entry point (the handle the worker calls), so deferred work
+(e.g. pydantic validators built on first use) is counted too. Bytecode is
+compiled once up front into a temporary cache, as it would be in a deployed
+package.
+
+Reported per module: the self time of the app's own modules, and the self
+time summed over every submodule of the tracked packages. Every run also
+times a fixed set of standard library imports in its own interpreter, the
+baseline: budgets in `startup_budget.json` are multiples of the baseline,
+so they carry over to slower or faster machines. With `--check`, the
+medians are compared to the budget and the exit status is 1 on regression.
+
+Usage (from v2-blueprints):
+    python -m benchmarks.startup --runs 10 --check
+    python -m benchmarks.startup --app-dir ../v2-single-file --orchestrator hello_world --input '["Seattle"]'
+    python -m benchmarks.startup --update-budget
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, Tuple
+
+
+PACKAGES = ("azure.functions", "azure.durable_functions", "aiohttp", "pydantic", "httpx", "orjson", "sqlite3")
+BUDGET_PATH = Path(__file__).with_name("startup_budget.json")
+DEFAULT_TRIP_INPUT = {"callback_uri_template": "http://localhost/{eventName}", "client_input": {"destination": "Chicago"}}
+# Standard library only, timed in its own interpreter
+BASELINE = "import argparse, asyncio, decimal, email.message, http.client, json, logging, typing, xml.dom.minidom"
+BASELINE_CHILD = f"""
+import time
+started = time.perf_counter()
+{BASELINE}
+print((time.perf_counter() - started) * 1000)
+"""
+
+# Runs inside the child interpreter: import, then first orchestrator episode
+CHILD = """
+import json, logging, sys, time
+logging.disable(logging.CRITICAL)
+started = time.perf_counter()
+import function_app
+imported = time.perf_counter()
+name, input_ = sys.argv[1], sys.argv[2]
+handle = next(f for f in function_app.app.get_functions() if f.get_function_name() == name).get_user_function()
+event = {"EventId": -1, "IsPlayed": False, "Timestamp": "2024-01-01T00:00:00Z"}
+context = {
+    "history": [
+        dict(event, EventType=12),
+        dict(event, EventType=0, Name=name, Input=input_, Version=""),
+    ],
+    "input": input_,
+    "instanceId": "startup",
+    "isReplaying": False,
+    "parentInstanceId": None,
+}
+handle(json.dumps(context))
+invoked = time.perf_counter()
+print(json.dumps(dict(
+    import_ms=(imported - started) * 1000,
+    first_invocation_ms=(invoked - imported) * 1000,
+    total_ms=(invoked - started) * 1000,
+)))
+"""
+
+
+def parse_importtime(stderr: str, app_modules: set) -> Dict[str, float]:
+    """Milliseconds per tracked module from `-X importtime` output."""
+    out: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if name in app_modules:
+            out[name] = out.get(name, 0) + int(self_us) / 1000
+            continue
+        for package in PACKAGES:
+            if name == package or name.startswith(package + "."):
+                out[package] = out.get(package, 0) + int(self_us) / 1000
+    return out
+
+
+def run_once(app_dir: Path, env: dict, orchestrator: str, input_: str, app_modules: set) -> Dict[str, float]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD, orchestrator, input_],
+        cwd=app_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    timings.update(parse_importtime(proc.stderr, app_modules))
+    return timings
+
+
+def baseline_once(env: dict) -> float:
+    proc = subprocess.run([sys.executable, "-c", BASELINE_CHILD], env=env, capture_output=True, text=True, check=True)
+    return float(proc.stdout)
+
+
+def measure(app_dir: Path, runs: int, orchestrator: str, input_: str) -> Tuple[Dict[str, float], float]:
+    """Median ms per key, and the median baseline ms."""
+    app_modules = {p.stem for p in app_dir.glob("*.py")}
+    with tempfile.TemporaryDirectory() as pycache:
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache)
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        run_once(app_dir, env, orchestrator, input_, app_modules)  # compile bytecode
+        baseline_once(env)
+        samples, baselines = [], []
+        for _ in range(runs):
+            samples.append(run_once(app_dir, env, orchestrator, input_, app_modules))
+            baselines.append(baseline_once(env))
+    keys = sorted({k for s in samples for k in s})
+    return {k: statistics.median(s.get(k, 0.0) for s in samples) for k in keys}, statistics.median(baselines)
+
+
+def check(
+    results: Dict[str, float], budget: Dict[str, float], baseline_ms: float, tolerance: float, slack_ms: float
+) -> list:
+    """`budget` is in baselines. Modules missing from it count as a budget of 0 (new imports)."""
+    failures = []
+    for key in sorted(set(budget) | set(results)):
+        value, limit = results.get(key, 0.0), budget.get(key, 0.0) * baseline_ms
+        if value > limit * tolerance + slack_ms:
+            failures.append(f"{key}: {value:.1f} ms > budget {limit:.1f} ms ({budget.get(key, 0.0)} x baseline)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app-dir", default=".")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--orchestrator", default="trip")
+    parser.add_argument("--input", default=json.dumps(DEFAULT_TRIP_INPUT))
+    parser.add_argument("--check", action="store_true", help="exit 1 if over budget")
+    parser.add_argument("--update-budget", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    parser.add_argument("--slack-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    app_dir = Path(args.app_dir).resolve()
+    results, baseline_ms = measure(app_dir, args.runs, args.orchestrator, args.input)
+    print(f"{'baseline':<32} {baseline_ms:8.1f} ms")
+    for key, value in results.items():
+        print(f"{key:<32} {value:8.1f} ms {value / baseline_ms:8.3f} x baseline")
+
+    budgets = json.loads(BUDGET_PATH.read_text()) if BUDGET_PATH.exists() else {}
+    if args.update_budget:
+        budgets[app_dir.name] = {k: round(v / baseline_ms, 3) for k, v in results.items()}
+        BUDGET_PATH.write_text(json.dumps(budgets, indent=2, sort_keys=True) + "\n")
+        print(f"Budget for {app_dir.name} written to {BUDGET_PATH}")
+    if args.check:
+        failures = check(results, budgets.get(app_dir.name, {}), baseline_ms, args.tolerance, args.slack_ms)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+def normalize_key(value: str) -> str:
+    return " ".join(str(value).casefold().split())
+
+
+class SqliteStore:
+    """Persistent tier for `TTLCache`.
+
+    Entries survive worker restarts on the same host. Values must be JSON
+    serializable. Expired rows are purged on open and every `purge_every`
+    writes, which also trims the table to `maxrows` by dropping the rows
+    closest to expiry.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        table: str = "cache",
+        mmap_size: int = 64 * 1024 * 1024,
+        maxrows: Optional[int] = None,
+        purge_every: int = 1000,
+    ):
+        import sqlite3  # only loaded when a persistent store is configured
+
+        if maxrows is not None and maxrows <= 0:
+            raise ValueError("maxrows must be positive")
+        self.table = table
+        self.maxrows = maxrows
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table} (expires_at)")
+        self.purge()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._writes += 1
+            due = self._writes >= self.purge_every
+        if due:
+            self.purge()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def purge(self, now: Optional[float] = None) -> int:
+        """Delete expired rows, then the excess over `maxrows`; the number deleted."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._writes = 0
+            deleted = self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,)).rowcount
+            if self.maxrows is not None:
+                deleted += self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY expires_at "
+                    f"LIMIT max((SELECT count(*) FROM {self.table}) - ?, 0))",
+                    (self.maxrows,),
+                ).rowcount
+        return deleted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT count(*) FROM {self.table}").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TTLCache:
+    """Bounded LRU cache with a per-entry time to live.
+
+    An optional `store` (see `SqliteStore`) is consulted on in-memory misses
+    and written through on `set`, so a restarted worker starts warm.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 3600,
+        store: Optional[SqliteStore] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.store = store
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[1] > self._clock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = self._clock()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.expirations += 1
+        if self.store is not None:
+            row = self.store.get(key)
+            if row is not None and row[1] > now:
+                with self._lock:
+                    self._put(key, row[0], row[1])
+                    self.hits += 1
+                    self.store_hits += 1
+                return row[0]
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._put(key, value, expires_at)
+        if self.store is not None:
+            self.store.set(key, value, expires_at)
+
+    def _put(self, key: Hashable, value: Any, expires_at: float):
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if self.store is not None:
+            self.store.delete(key)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return dict(
+            size=len(self._data),
+            maxsize=self.maxsize,
+            hits=self.hits,
+            store_hits=self.store_hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations,
+            hit_ratio=(self.hits / lookups) if lookups else 0.0,
+        )
@@ -0,0 +1,83 @@
+"""Durable entities.
+
+`geo_cache` (the GeoCache) holds geocoding results in durable storage, so
+they are shared by every worker and survive scale-out, unlike the
+in-process `activities.geocoding_cache`. Keys are spread over
+GEOCACHE_SHARDS entity instances, each a bounded LRU with per-entry TTL.
+
+Operations take a dict input: `get` {key, now}, `set` {key, value, now,
+ttl}, `delete` {key}, plus `clear` and `stats`. Orchestrators pass their
+deterministic `current_utc_datetime` as `now`, so expiry doesn't depend on
+the clock of the worker running the entity.
+
+A `get` leaves the shard state alone: recency is only refreshed once per
+GEOCACHE_TOUCH seconds per entry, and expired entries are dropped by the
+next `set`. Values are only the fields orchestrators need (`lat`, `lon`).
+"""
+import os
+import time
+import zlib
+
+import azure.durable_functions as df
+
+
+bp = df.Blueprint()
+
+GEOCACHE_ENTITY = "geo_cache"
+GEOCACHE_SHARDS = int(os.environ.get("GEOCACHE_SHARDS", 16))
+GEOCACHE_SIZE = int(os.environ.get("GEOCACHE_SIZE", 1024))  # per shard
+GEOCACHE_TTL = float(os.environ.get("GEOCACHE_TTL", 7 * 24 * 3600))
+GEOCACHE_TOUCH = float(os.environ.get("GEOCACHE_TOUCH", 3600))
+
+
+def geocache_id(key: str) -> df.EntityId:
+    """The GeoCache shard holding `key` (stable across processes)."""
+    shard = zlib.crc32(key.encode()) % GEOCACHE_SHARDS
+    return df.EntityId(GEOCACHE_ENTITY, f"shard-{shard}")
+
+
+def new_state() -> dict:
+    return dict(entries={}, evictions=0, expirations=0)
+
+
+@bp.entity_trigger(context_name="context", entity_name=GEOCACHE_ENTITY)
+def geo_cache(context: df.DurableEntityContext):
+    state = context.get_state(new_state)
+    # [value, expires_at, used_at] by key, least recently set first
+    entries: dict = state["entries"]
+    input_ = context.get_input() or {}
+    now = input_.get("now")
+    if now is None:
+        now = time.time()
+    operation = context.operation_name
+    result = None
+    changed = True
+    if operation == "get":
+        entry = entries.get(input_["key"])
+        changed = False
+        if entry is not None and entry[1] > now:
+            result = entry[0]
+            if now - entry[2] >= GEOCACHE_TOUCH:
+                entry[2] = now
+                changed = True
+    elif operation == "set":
+        entries.pop(input_["key"], None)
+        entries[input_["key"]] = [input_["value"], now + input_.get("ttl", GEOCACHE_TTL), now]
+        for key in [k for k, (_, expires_at, _) in entries.items() if expires_at <= now]:
+            del entries[key]
+            state["expirations"] += 1
+        while len(entries) > GEOCACHE_SIZE:
+            del entries[min(entries, key=lambda k: entries[k][2])]
+            state["evictions"] += 1
+    elif operation == "delete":
+        changed = entries.pop(input_["key"], None) is not None
+    elif operation == "clear":
+        state = new_state()
+    elif operation == "stats":
+        changed = False
+        result = dict({k: v for k, v in state.items() if k != "entries"}, size=len(entries))
+    else:
+        raise ValueError(f"Unknown GeoCache operation: {operation}")
+    if changed:
+        context.set_state(state)
+    context.set_result(result)
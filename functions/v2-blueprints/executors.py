@@ -0,0 +1,161 @@
+"""Run synchronous activity bodies on bounded executors.
+
+Sync activities otherwise take one of the worker's threads for their whole
+duration, and blocking calls inside async activities stall the event loop
+shared by every async activity (`get_geocoding`, `get_city_weather`, ...).
+`offload` turns a sync function into a coroutine function that runs the
+body on a shared thread or process pool:
+
+    @bp.activity_trigger(input_name="name")
+    @metrics.instrument("activity")
+    @executors.offload("threads")
+    def hello(name: str) -> str:
+        time.sleep(1)
+        return f"Hello {name}"
+
+Use "threads" for blocking I/O and "processes" for CPU-bound work (inputs
+and outputs must then be picklable). Pools are sized with
+EXECUTOR_THREADS and EXECUTOR_PROCESSES, and report queue depth,
+utilization and queue/run time through `metrics`.
+"""
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+import functools
+import importlib
+import inspect
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from metrics import registry
+
+
+# Offloaded functions by "module:qualname", so worker processes can find
+# the original function (the module attribute is the activity registration)
+_functions: Dict[str, Callable] = {}
+
+
+def _run(key: str, module: str, args: tuple, kwargs: dict):
+    fn = _functions.get(key)
+    if fn is None:
+        importlib.import_module(module)
+        fn = _functions[key]
+    started = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return time.perf_counter() - started, out
+
+
+class ManagedExecutor:
+    """A lazily created thread or process pool with load statistics."""
+
+    def __init__(self, name: str, kind: str, max_workers: int):
+        if kind not in ("threads", "processes"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.created_at = time.perf_counter()
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.queue_time_max = 0.0
+
+    @property
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "threads":
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"executor-{self.name}")
+                else:
+                    # multiprocessing is only imported when a process pool is used
+                    from concurrent.futures import ProcessPoolExecutor
+
+                    self._executor = ProcessPoolExecutor(self.max_workers)
+                self.created_at = time.perf_counter()
+            return self._executor
+
+    async def run(self, key: str, module: str, args: tuple, kwargs: dict):
+        loop = asyncio.get_running_loop()
+        labels = (("executor", self.name),)
+        self.submitted += 1
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            run_time, out = await loop.run_in_executor(self.executor, _run, key, module, args, kwargs)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        self.busy_time += run_time
+        queue_time = max(time.perf_counter() - started - run_time, 0.0)
+        self.queue_time_max = max(self.queue_time_max, queue_time)
+        registry.observe("executor_queue_seconds", labels, queue_time)
+        registry.observe("executor_run_seconds", labels, run_time)
+        return out
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.created_at
+        return dict(
+            max_workers=self.max_workers,
+            running=min(self.in_flight, self.max_workers),
+            queued=max(self.in_flight - self.max_workers, 0),
+            submitted=self.submitted,
+            completed=self.completed,
+            errors=self.errors,
+            busy_time=self.busy_time,
+            utilization=self.busy_time / (elapsed * self.max_workers) if elapsed > 0 else 0.0,
+            queue_time_max=self.queue_time_max,
+        )
+
+
+_executors: Dict[str, ManagedExecutor] = {}
+
+
+def executor(kind: str = "threads") -> ManagedExecutor:
+    """The shared executor of `kind`, sized from the environment."""
+    managed = _executors.get(kind)
+    if managed is None:
+        if kind == "threads":
+            max_workers = int(os.environ.get("EXECUTOR_THREADS", min(32, (os.cpu_count() or 1) + 4)))
+        else:
+            max_workers = int(os.environ.get("EXECUTOR_PROCESSES", os.cpu_count() or 1))
+        managed = _executors[kind] = ManagedExecutor(kind, kind, max_workers)
+        registry.register_stats("executor", {"executor": kind}, managed.stats)
+    return managed
+
+
+def offload(pool="threads"):
+    """Run a sync function on `pool` ("threads", "processes" or a `ManagedExecutor`)."""
+
+    def decorator(fn: Callable):
+        if inspect.iscoroutinefunction(fn):
+            raise TypeError(f"{fn.__qualname__} is already a coroutine function")
+        key = f"{fn.__module__}:{fn.__qualname__}"
+        _functions[key] = fn
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            managed = pool if isinstance(pool, ManagedExecutor) else executor(pool)
+            return await managed.run(key, fn.__module__, args, kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def shutdown(wait: bool = True):
+    for managed in _executors.values():
+        managed.shutdown(wait=wait)
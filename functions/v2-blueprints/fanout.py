@@ -0,0 +1,80 @@
+"""Bounded fan-out for orchestrators.
+
+Usage, inside an orchestrator:
+
+    results = yield from fanout.bounded(context, "get_city_weather", inputs)
+
+At most `max_in_flight` tasks are scheduled at a time, and inputs larger
+than `chunk_size` are split across `fan_out` sub-orchestrations, so a very
+large input becomes a tree of bounded batches. Results come back in input
+order. Scheduling only depends on the inputs and on completion order as
+recorded in history, so it is deterministic under replay.
+"""
+import math
+import os
+from typing import Any, Callable, List
+
+import azure.durable_functions as df
+
+
+MAX_IN_FLIGHT = int(os.environ.get("FANOUT_MAX_IN_FLIGHT", 100))
+CHUNK_SIZE = int(os.environ.get("FANOUT_CHUNK_SIZE", 1000))
+FAN_OUT_ORCHESTRATOR = "fan_out"
+
+
+def windowed(context: df.DurableOrchestrationContext, factories: List[Callable], max_in_flight: int):
+    """Run `factories` (task constructors) with a sliding window of `max_in_flight`."""
+    results: List[Any] = [None] * len(factories)
+    pending = {}
+    next_index = 0
+    while next_index < len(factories) or pending:
+        while next_index < len(factories) and len(pending) < max_in_flight:
+            pending[factories[next_index]()] = next_index
+            next_index += 1
+        done = yield context.task_any(list(pending))
+        index = pending.pop(done)
+        if isinstance(done.result, Exception):
+            raise done.result
+        results[index] = done.result
+    return results
+
+
+def split(inputs: list, chunk_size: int) -> List[list]:
+    """Split into at most `chunk_size` groups of similar size."""
+    groups = min(chunk_size, math.ceil(len(inputs) / chunk_size))
+    size = math.ceil(len(inputs) / groups)
+    return [inputs[i : i + size] for i in range(0, len(inputs), size)]
+
+
+def bounded(
+    context: df.DurableOrchestrationContext,
+    function_name: str,
+    inputs: list,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    chunk_size: int = CHUNK_SIZE,
+    sub_orchestrator: bool = False,
+):
+    """Call `function_name` (an activity, or an orchestrator) once per input."""
+    if max_in_flight <= 0 or chunk_size <= 0:
+        raise ValueError("max_in_flight and chunk_size must be positive")
+    if len(inputs) > chunk_size:
+        chunks = split(inputs, chunk_size)
+        factories = [
+            lambda chunk=chunk: context.call_sub_orchestrator(
+                FAN_OUT_ORCHESTRATOR,
+                dict(
+                    function_name=function_name,
+                    inputs=chunk,
+                    max_in_flight=max_in_flight,
+                    chunk_size=chunk_size,
+                    sub_orchestrator=sub_orchestrator,
+                ),
+            )
+            for chunk in chunks
+        ]
+        results = yield from windowed(context, factories, max_in_flight)
+        return [r for chunk in results for r in chunk]
+    call = context.call_sub_orchestrator if sub_orchestrator else context.call_activity
+    factories = [lambda input_=input_: call(function_name, input_) for input_ in inputs]
+    results = yield from windowed(context, factories, max_in_flight)
+    return results
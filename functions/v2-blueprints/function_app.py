@@ -1,12 +1,18 @@
 import azure.functions as func
 import azure.durable_functions as df
 
+import logs
 import triggers
 import activities
 import orchestrators
+import entities
 
 
+if logs.LOG_QUEUE:
+    logs.install()
+
 app = df.DFApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 app.register_blueprint(triggers.bp)
 app.register_blueprint(activities.bp)
 app.register_blueprint(orchestrators.bp)
+app.register_blueprint(entities.bp)
@@ -0,0 +1,241 @@
+"""Offline geocoding from a GeoNames gazetteer.
+
+The index is built once from a GeoNames dump (tab separated, e.g.
+`cities15000.txt` from https://download.geonames.org/export/dump/):
+
+    python -m gazetteer build cities15000.txt gazetteer.idx
+    python -m gazetteer lookup gazetteer.idx "Chicago, IL"
+
+and memory-mapped by `Gazetteer`: a sorted array of (normalized name, place)
+entries searched by bisection, so lookups touch a few pages of the file and
+nothing is loaded up front. Names, ASCII names and (with `--alternate-names`)
+alternate names are indexed; entries of the same name are ordered by
+population. `get_geocoding` uses it when GAZETTEER_PATH is set and only calls
+the geocoding API on a miss.
+"""
+import argparse
+import csv
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+import unicodedata
+
+from cache import normalize_key
+
+
+MAGIC = b"GAZ1"
+# magic, entries, places, then the offsets of the entry, place offset, key and place sections
+HEADER = struct.Struct("<4sIIIIII")
+# key offset, key length, place
+ENTRY = struct.Struct("<IHI")
+OFFSET = struct.Struct("<I")
+LICENCE = "Data (c) GeoNames, CC BY 4.0"
+csv.field_size_limit(sys.maxsize)
+
+
+def normalize_name(value: str) -> str:
+    """`normalize_key`, with accents and punctuation dropped."""
+    decomposed = unicodedata.normalize("NFKD", str(value))
+    chars = (c if c.isalnum() else " " for c in decomposed if not unicodedata.combining(c))
+    return normalize_key("".join(chars))
+
+
+def read_geonames(path: str, alternate_names: bool = False) -> Iterator[Tuple[List[str], dict]]:
+    """(names, place) per row of a GeoNames dump."""
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if len(row) < 15:
+                continue
+            geonameid, name, asciiname, alternates, lat, lon = row[:6]
+            feature_class, feature_code, country, _, admin1 = row[6:11]
+            population = int(row[14] or 0)
+            names = [name, asciiname] + (alternates.split(",") if alternate_names and alternates else [])
+            place = dict(
+                id=int(geonameid),
+                name=name,
+                lat=lat,
+                lon=lon,
+                country=country,
+                admin1=admin1,
+                feature=feature_class,
+                population=population,
+            )
+            yield names, place
+
+
+def build(places: Iterable[Tuple[List[str], dict]], path: str) -> dict:
+    """Write the index of `places` to `path` (atomically)."""
+    entries = []
+    blobs = []
+    for names, place in places:
+        index = len(blobs)
+        blobs.append(json.dumps(place, separators=(",", ":")).encode())
+        keys = {normalize_name(n) for n in names} - {""}
+        entries.extend((key.encode(), -place["population"], index) for key in keys)
+    entries.sort()
+    keys = bytearray()
+    entry_section = bytearray()
+    key_offsets = {}
+    for key, _, index in entries:
+        if key not in key_offsets:
+            key_offsets[key] = len(keys)
+            keys += key
+        entry_section += ENTRY.pack(key_offsets[key], len(key), index)
+    offsets = bytearray()
+    position = 0
+    for blob in blobs:
+        offsets += OFFSET.pack(position)
+        position += len(blob)
+    offsets += OFFSET.pack(position)
+    entries_at = HEADER.size
+    offsets_at = entries_at + len(entry_section)
+    keys_at = offsets_at + len(offsets)
+    places_at = keys_at + len(keys)
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+        f.write(HEADER.pack(MAGIC, len(entries), len(blobs), entries_at, offsets_at, keys_at, places_at))
+        for section in (entry_section, offsets, keys):
+            f.write(section)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(f.name, path)
+    return dict(entries=len(entries), places=len(blobs), bytes=places_at + position)
+
+
+class Gazetteer:
+    """Read-only, memory-mapped view of an index written by `build`."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.entries, self.places, self._entries_at, self._offsets_at, self._keys_at, self._places_at = (
+            HEADER.unpack_from(self._mmap)
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer index")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self.places
+
+    def _entry(self, i: int) -> Tuple[bytes, int]:
+        key_at, key_len, place = ENTRY.unpack_from(self._mmap, self._entries_at + i * ENTRY.size)
+        start = self._keys_at + key_at
+        return self._mmap[start : start + key_len], place
+
+    def _place(self, i: int) -> dict:
+        start, end = struct.unpack_from("<II", self._mmap, self._offsets_at + i * OFFSET.size)
+        return json.loads(self._mmap[self._places_at + start : self._places_at + end])
+
+    def _bisect(self, key: bytes) -> int:
+        lo, hi = 0, self.entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _matches(self, key: bytes, prefix: bool = False) -> Iterator[int]:
+        for i in range(self._bisect(key), self.entries):
+            found, place = self._entry(i)
+            if found != key and not (prefix and found.startswith(key)):
+                return
+            yield place
+
+    def lookup(self, query: str) -> Optional[dict]:
+        """The most populous place named `query`, as a `GeocodingOut` payload.
+
+        Anything after the first comma must match the place's country or
+        first-level admin code ("Paris, FR", "Springfield, IL, US").
+        """
+        name, *qualifiers = [normalize_name(q) for q in str(query).split(",")]
+        for index in self._matches(name.encode()):
+            place = self._place(index)
+            codes = {place["country"].casefold(), place["admin1"].casefold()}
+            if all(q in codes for q in qualifiers if q):
+                self._count(hit=True)
+                return geocoding_out(place)
+        self._count(hit=False)
+        return None
+
+    def prefix(self, prefix: str, limit: int = 10, scan: int = 1000) -> List[dict]:
+        """Up to `limit` places with a name starting with `prefix`, most populous first.
+
+        Only the first `scan` matching names (in name order) are considered.
+        """
+        key = normalize_name(prefix).encode()
+        if not key:
+            return []
+        seen = {}
+        for n, index in enumerate(self._matches(key, prefix=True)):
+            if n >= scan:
+                break
+            if index not in seen:
+                seen[index] = self._place(index)
+        places = sorted(seen.values(), key=lambda p: -p["population"])
+        return [geocoding_out(p) for p in places[:limit]]
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        return dict(places=self.places, entries=self.entries, bytes=len(self._mmap), hits=self.hits, misses=self.misses)
+
+    def close(self):
+        self._mmap.close()
+
+
+def geocoding_out(place: dict) -> dict:
+    """A place in the shape of the geocoding API's (`GeocodingOut`) results."""
+    display_name = ", ".join(p for p in (place["name"], place["admin1"], place["country"]) if p)
+    return dict(
+        place_id=place["id"],
+        licence=LICENCE,
+        powered_by="gazetteer",
+        osm_type="geonames",
+        osm_id=place["id"],
+        boundingbox=[place["lat"], place["lat"], place["lon"], place["lon"]],
+        lat=place["lat"],
+        lon=place["lon"],
+        display_name=display_name,
+        type="city" if place["feature"] == "P" else place["feature"].lower(),
+        importance=round(min(math.log10(place["population"] + 1) / 8, 1.0), 4),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m gazetteer")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="index a GeoNames dump")
+    build_parser.add_argument("source")
+    build_parser.add_argument("index")
+    build_parser.add_argument("--alternate-names", action="store_true")
+    lookup_parser = commands.add_parser("lookup", help="resolve names with an index")
+    lookup_parser.add_argument("index")
+    lookup_parser.add_argument("names", nargs="+")
+    lookup_parser.add_argument("--prefix", action="store_true")
+    args = parser.parse_args()
+    if args.command == "build":
+        print(build(read_geonames(args.source, args.alternate_names), args.index))
+        return
+    gazetteer = Gazetteer(args.index)
+    for name in args.names:
+        print(json.dumps(gazetteer.prefix(name) if args.prefix else gazetteer.lookup(name)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import asyncio
+import atexit
+import logging
+import os
+import time
+from typing import Optional
+
+import aiohttp
+
+from metrics import record_upstream, registry
+
+
+class PoolMetrics:
+
+    def __init__(self):
+        self.in_flight = 0
+        self.queued = 0
+        self.requests = 0
+        self.errors = 0
+        self.connections_created = 0
+        self.connect_time_total = 0.0
+        self.connect_time_max = 0.0
+        self.queue_time_total = 0.0
+        self.request_time_total = 0.0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class HttpPool:
+    """Shared `aiohttp.ClientSession` with bounded, instrumented connections.
+
+    The session is created lazily on the running event loop and recreated if
+    the loop changes (e.g. between test cases); the previous one is closed.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        keepalive_timeout: float = 30,
+        dns_ttl: int = 300,
+        connect_timeout: float = 5,
+        total_timeout: float = 30,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self.metrics = PoolMetrics()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls) -> "HttpPool":
+        return cls(
+            limit=int(os.environ.get("HTTP_POOL_LIMIT", 100)),
+            limit_per_host=int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", 20)),
+            keepalive_timeout=float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", 30)),
+            dns_ttl=int(os.environ.get("HTTP_DNS_TTL", 300)),
+            connect_timeout=float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5)),
+            total_timeout=float(os.environ.get("HTTP_TIMEOUT", 30)),
+        )
+
+    async def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            previous, previous_loop = self._session, self._loop
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_ttl,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                trace_configs=[self._trace_config()],
+            )
+            self._loop = loop
+            if previous is not None and not previous.closed:
+                await self._close_previous(previous, previous_loop)
+        return self._session
+
+    @staticmethod
+    async def _close_previous(session: aiohttp.ClientSession, loop: Optional[asyncio.AbstractEventLoop]):
+        if loop is not None and loop.is_running():
+            # Still serving another thread: close it there
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            # Connections of a stopped or closed loop are closed without it
+            await session.close()
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        metrics = self.metrics
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            ctx.request_start = time.perf_counter()
+            metrics.in_flight += 1
+            metrics.requests += 1
+
+        async def on_request_end(session, ctx, params):
+            elapsed = time.perf_counter() - ctx.request_start
+            metrics.in_flight -= 1
+            metrics.request_time_total += elapsed
+            record_upstream(elapsed)
+
+        async def on_request_exception(session, ctx, params):
+            metrics.in_flight -= 1
+            metrics.errors += 1
+            record_upstream(time.perf_counter() - ctx.request_start)
+
+        async def on_connection_queued_start(session, ctx, params):
+            ctx.queued_start = time.perf_counter()
+            metrics.queued += 1
+
+        async def on_connection_queued_end(session, ctx, params):
+            metrics.queued -= 1
+            metrics.queue_time_total += time.perf_counter() - ctx.queued_start
+
+        async def on_connection_create_start(session, ctx, params):
+            ctx.connect_start = time.perf_counter()
+
+        async def on_connection_create_end(session, ctx, params):
+            elapsed = time.perf_counter() - ctx.connect_start
+            metrics.connections_created += 1
+            metrics.connect_time_total += elapsed
+            metrics.connect_time_max = max(metrics.connect_time_max, elapsed)
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(on_connection_queued_end)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        return trace_config
+
+    def stats(self) -> dict:
+        return dict(
+            self.metrics.as_dict(),
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+        )
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    def close_sync(self):
+        """Shutdown hook: close the session if its event loop is still usable."""
+        loop = self._loop
+        if self._session is None or self._session.closed or loop is None:
+            return
+        if loop.is_closed() or loop.is_running():
+            return
+        try:
+            loop.run_until_complete(self.close())
+        except Exception as e:
+            logging.error(f"Could not close http pool: {e}")
+
+
+http_pool = HttpPool.from_env()
+atexit.register(http_pool.close_sync)
+registry.register_stats("http_pool", {}, http_pool.stats)
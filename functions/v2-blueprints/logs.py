@@ -0,0 +1,176 @@
+"""Structured, sampled and non-blocking logging for the hot paths.
+
+Events are logged by name with keyword fields:
+
+    log = logs.get_logger(__name__)
+    log.warning("geocoding", name=name, response=resp)
+    log.warning("planning", context=context, destination=destination)
+
+Nothing is formatted at the call site: the record carries the fields and the
+message is rendered when a handler formats it (callable fields, e.g.
+`cache=cache.stats`, are only called then). With `install` (done by
+`function_app`, disabled with LOG_QUEUE=0) other handlers run on a background
+listener thread, behind a bounded queue that drops instead of blocking when
+full (LOG_QUEUE_SIZE). The Functions worker's own handler stays in place: it
+doesn't block, and it needs the caller's thread to attach the invocation ID.
+Passing an orchestration `context` suppresses the event while the
+orchestrator is replaying. LOG_SAMPLING keeps only a fraction of chosen
+events, e.g. `geocoding=0.01,weather=0.1`.
+"""
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue
+import random
+import threading
+from typing import Dict, Optional
+
+from metrics import registry
+
+
+def parse_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (i.strip() for i in value.split(","))):
+        event, _, rate = item.partition("=")
+        rates[event.strip()] = float(rate)
+    return rates
+
+
+SAMPLING = parse_rates(os.environ.get("LOG_SAMPLING", ""))
+LOG_QUEUE = os.environ.get("LOG_QUEUE", "1") == "1"
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# Handlers of the Functions worker (the in-process and proxy workers)
+WORKER_MODULES = ("azure_functions_worker", "proxy_worker")
+
+
+class LogStats:
+
+    def __init__(self):
+        self.emitted = 0
+        self.replay_suppressed = 0
+        self.sampled_out = 0
+        self.dropped = 0
+
+    def as_dict(self) -> dict:
+        out = dict(vars(self))
+        out["queue_depth"] = _queue.qsize() if _queue is not None else 0
+        return out
+
+
+class Event:
+    """The message of an event record, rendered once on first `str()`."""
+
+    __slots__ = ("name", "fields", "_text")
+
+    def __init__(self, name: str, fields: dict):
+        self.name = name
+        self.fields = fields
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = " ".join([self.name, *(f"{k}={v() if callable(v) else v}" for k, v in self.fields.items())])
+        return self._text
+
+
+class EventLogger:
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def log(self, level: int, event: str, context=None, **fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        if context is not None and context.is_replaying:
+            stats.replay_suppressed += 1
+            return
+        rate = SAMPLING.get(event)
+        if rate is not None and random.random() >= rate:
+            stats.sampled_out += 1
+            return
+        stats.emitted += 1
+        self.logger.log(level, Event(event, fields), extra={"event": event, "fields": fields}, stacklevel=3)
+
+    def debug(self, event: str, context=None, **fields):
+        self.log(logging.DEBUG, event, context, **fields)
+
+    def info(self, event: str, context=None, **fields):
+        self.log(logging.INFO, event, context, **fields)
+
+    def warning(self, event: str, context=None, **fields):
+        self.log(logging.WARNING, event, context, **fields)
+
+    def error(self, event: str, context=None, **fields):
+        self.log(logging.ERROR, event, context, **fields)
+
+
+def get_logger(name: Optional[str] = None) -> EventLogger:
+    return EventLogger(logging.getLogger(name))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Enqueues records as they are, and drops them when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener runs in this process: no need to format (or copy) here
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            stats.dropped += 1
+
+
+stats = LogStats()
+_queue: Optional[queue.Queue] = None
+_listener: Optional[QueueListener] = None
+# (logger, queue handler, handlers moved to the listener)
+_installed = None
+_lock = threading.Lock()
+registry.register_stats("logs", {}, stats.as_dict)
+
+
+def is_worker_handler(handler: logging.Handler) -> bool:
+    return type(handler).__module__.startswith(WORKER_MODULES)
+
+
+def install(logger: Optional[logging.Logger] = None, maxsize: Optional[int] = None):
+    """Move the handlers of `logger` (the root logger) behind a queue.
+
+    The worker's handlers are left in place.
+    """
+    global _queue, _listener, _installed
+    logger = logger or logging.getLogger()
+    with _lock:
+        if _installed is not None:
+            return
+        handlers = [h for h in logger.handlers if not is_worker_handler(h)]
+        if not handlers:
+            return
+        _queue = queue.Queue(maxsize or LOG_QUEUE_SIZE)
+        _listener = QueueListener(_queue, *handlers, respect_handler_level=True)
+        queue_handler = DroppingQueueHandler(_queue)
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+        _installed = (logger, queue_handler, handlers)
+        _listener.start()
+
+
+def uninstall():
+    """Flush the queue and give the handlers back to their logger."""
+    global _queue, _listener, _installed
+    with _lock:
+        if _installed is None:
+            return
+        _listener.stop()
+        logger, queue_handler, handlers = _installed
+        logger.removeHandler(queue_handler)
+        for handler in handlers:
+            logger.addHandler(handler)
+        _queue, _listener, _installed = None, None, None
+
+
+atexit.register(uninstall)
@@ -0,0 +1,277 @@
+"""In-process metrics for triggers, activities and orchestrators.
+
+Functions are instrumented with `instrument`, placed directly above the
+function definition (below the `bp.*` registration decorators):
+
+    @bp.activity_trigger(input_name="name")
+    @metrics.instrument("activity")
+    async def get_geocoding(name: str) -> GeocodingOut:
+
+Metrics are kept per worker process and rendered in the Prometheus text
+format by `render`, which backs the `/metrics` route.
+
+`function_payload_bytes` is opt-in (METRICS_PAYLOAD_SIZES=1): sizing a
+model encodes it once more than the worker does.
+"""
+from bisect import bisect_left
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+PAYLOAD_SIZES = os.environ.get("METRICS_PAYLOAD_SIZES", "0") == "1"
+
+# Seconds spent waiting on upstream HTTP during the current invocation
+upstream_time: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar(
+    "upstream_time", default=None
+)
+
+
+def record_upstream(seconds: float):
+    acc = upstream_time.get()
+    if acc is not None:
+        acc[0] += seconds
+
+
+class Histogram:
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.help: Dict[str, Tuple[str, str]] = {}
+        self.collectors: List[Tuple[str, Dict[str, str], Callable[[], dict]]] = []
+
+    def observe(self, name: str, labels: Labels, value: float, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, labels: Labels, value: float = 1):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def describe(self, name: str, type_: str, help_: str):
+        self.help[name] = (type_, help_)
+
+    def register_stats(self, prefix: str, labels: Dict[str, str], stats: Callable[[], dict]):
+        """Expose every numeric value of `stats()` as the gauge `<prefix>_<key>`.
+
+        Registering the same prefix and labels again replaces the collector.
+        """
+        self.collectors = [c for c in self.collectors if c[:2] != (prefix, labels)]
+        self.collectors.append((prefix, labels, stats))
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self) -> str:
+        lines = []
+        described = set()
+
+        def header(name, default_type):
+            if name in described:
+                return
+            described.add(name)
+            type_, help_ = self.help.get(name, (default_type, name))
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {type_}")
+
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            histograms = [(key, (h.buckets, list(h.counts), h.sum, h.count)) for key, h in histograms]
+        for (name, labels), (buckets, counts, sum_, count) in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {sum_}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for prefix, labels, stats in self.collectors:
+            for key, value in sorted(stats().items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                header(name, "gauge")
+                lines.append(f"{name}{format_labels(tuple(labels.items()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+registry = Registry()
+registry.describe("function_duration_seconds", "histogram", "Function invocation (or orchestrator episode) wall time.")
+registry.describe("function_upstream_seconds", "histogram", "Time spent waiting on upstream HTTP per invocation.")
+registry.describe("function_local_seconds", "histogram", "Invocation time not spent on upstream HTTP.")
+registry.describe("function_payload_bytes", "histogram", "Serialized size of function inputs and outputs.")
+registry.describe("function_invocations_total", "counter", "Function invocations.")
+registry.describe("function_exceptions_total", "counter", "Function invocations that raised.")
+registry.describe("orchestrator_episodes_total", "counter", "Orchestrator executions, by replay vs first execution.")
+
+
+def payload_size(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    # Encodes the payload a second time (the worker does it again): opt-in
+    to_json = getattr(value, "to_json", None)
+    if to_json is not None:
+        out = to_json()
+        return len(out) if isinstance(out, (str, bytes)) else len(json.dumps(out, default=str))
+    get_body = getattr(value, "get_body", None)
+    if get_body is not None:
+        return len(get_body() or b"")
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def instrument(kind: str, name: Optional[str] = None, input_name: Optional[str] = None):
+    """Record latency, payload sizes, upstream time and exceptions of a function.
+
+    `kind` is one of "activity", "orchestrator" or "http". `input_name` is
+    the parameter whose size is recorded as the input payload (by default
+    the first one).
+    """
+
+    def decorator(fn):
+        fn_name = name or fn.__name__
+        labels = (("function", fn_name), ("kind", kind))
+        in_labels, out_labels = labels + (("direction", "in"),), labels + (("direction", "out"),)
+        parameter = input_name or next(iter(inspect.signature(fn).parameters), None)
+
+        def input_size(args, kwargs):
+            if parameter in kwargs:
+                return payload_size(kwargs[parameter])
+            return payload_size(args[0]) if args else 0
+
+        if inspect.isgeneratorfunction(fn):
+            replay_labels = labels + (("replay", "true"),)
+            first_labels = labels + (("replay", "false"),)
+
+            @functools.wraps(fn)
+            def orchestrator_wrapper(context, *args, **kwargs):
+                registry.inc("orchestrator_episodes_total", replay_labels if context.is_replaying else first_labels)
+                elapsed = 0.0
+                started = time.perf_counter()
+                gen = fn(context, *args, **kwargs)
+                value, error = None, None
+                try:
+                    while True:
+                        started = time.perf_counter()
+                        task = gen.throw(error) if error is not None else gen.send(value)
+                        elapsed += time.perf_counter() - started
+                        try:
+                            value, error = (yield task), None
+                        except Exception as e:
+                            value, error = None, e
+                except StopIteration as e:
+                    elapsed += time.perf_counter() - started
+                    if PAYLOAD_SIZES and not context.is_replaying:
+                        registry.observe("function_payload_bytes", out_labels, payload_size(e.value), SIZE_BUCKETS)
+                    return e.value
+                except Exception as e:
+                    elapsed += time.perf_counter() - started
+                    registry.inc("function_exceptions_total", labels + (("exception", type(e).__name__),))
+                    raise
+                finally:
+                    registry.observe("function_duration_seconds", labels, elapsed)
+
+            return orchestrator_wrapper
+
+        def before(args, kwargs):
+            registry.inc("function_invocations_total", labels)
+            if PAYLOAD_SIZES:
+                registry.observe("function_payload_bytes", in_labels, input_size(args, kwargs), SIZE_BUCKETS)
+            acc = [0.0]
+            return acc, upstream_time.set(acc), time.perf_counter()
+
+        def after(acc, token, started, out=None, error=None):
+            elapsed = time.perf_counter() - started
+            upstream_time.reset(token)
+            registry.observe("function_duration_seconds", labels, elapsed)
+            if acc[0]:
+                registry.observe("function_upstream_seconds", labels, acc[0])
+            registry.observe("function_local_seconds", labels, max(elapsed - acc[0], 0.0))
+            if error is not None:
+                registry.inc("function_exceptions_total", labels + (("exception", type(error).__name__),))
+            elif PAYLOAD_SIZES:
+                registry.observe("function_payload_bytes", out_labels, payload_size(out), SIZE_BUCKETS)
+
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                state = before(args, kwargs)
+                try:
+                    out = await fn(*args, **kwargs)
+                except Exception as e:
+                    after(*state, error=e)
+                    raise
+                after(*state, out=out)
+                return out
+
+        else:
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                state = before(args, kwargs)
+                try:
+                    out = fn(*args, **kwargs)
+                except Exception as e:
+                    after(*state, error=e)
+                    raise
+                after(*state, out=out)
+                return out
+
+        return wrapper
+
+    return decorator
+
+
+def render() -> str:
+    return registry.render()
@@ -1,21 +1,144 @@
-from typing import List
-from pydantic import BaseModel, ConfigDict, Field
+from collections import OrderedDict
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+import payloads
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+class PydanticCodec:
+    """pydantic-core's native JSON (de)serialization."""
+
+    name = "pydantic"
+
+    def dumps(self, model: BaseModel) -> str:
+        return model.model_dump_json()
+
+    def loads(self, cls: type, data: str) -> BaseModel:
+        return cls.model_validate_json(data)
+
+
+class OrjsonCodec:
+    """orjson parsing with pydantic validation of the resulting objects."""
+
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("OrjsonCodec requires the `orjson` package")
+
+    def dumps(self, model: BaseModel) -> str:
+        return orjson.dumps(model.model_dump(mode="json")).decode()
+
+    def loads(self, cls: type, data: str) -> BaseModel:
+        return cls.model_validate(orjson.loads(data))
+
+
+class DecodeMemo:
+    """
+    Bounded LRU of decoded payloads keyed by (class, JSON string).
+
+    Orchestrators decode the same history payloads on every replay; with the
+    memo each distinct payload is validated once. Decoded models are shared,
+    so they must be treated as read-only. Thread safe: the worker runs
+    (synchronous) orchestrator functions on its thread pool.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cls: type, data: str):
+        with self._lock:
+            entry = self._data.get((cls, data))
+            if entry is not None:
+                self._data.move_to_end((cls, data))
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry
+
+    def set(self, cls: type, data: str, value: BaseModel):
+        with self._lock:
+            self._data[(cls, data)] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(size=len(self._data), hits=self.hits, misses=self.misses)
+
+
+CODECS = {"pydantic": PydanticCodec, "orjson": OrjsonCodec}
+
+
+def _codec_from_env():
+    name = os.environ.get("PAYLOAD_CODEC", "pydantic")
+    try:
+        return CODECS[name]()
+    except (KeyError, ImportError) as e:
+        logging.warning(f"Payload codec {name} unavailable ({e!r}), using pydantic")
+        return PydanticCodec()
+
+
+codec = _codec_from_env()
+decode_memo = DecodeMemo(int(os.environ.get("PAYLOAD_MEMO_SIZE", 1024)))
+
+
+def set_codec(new_codec, memo_size: Optional[int] = None):
+    global codec
+    codec = new_codec
+    decode_memo.clear()
+    if memo_size is not None:
+        decode_memo.maxsize = memo_size
 
 
 class JsonSerializable(BaseModel):
-        
+    # Validators are built on first use rather than at import (cold start)
+    model_config = ConfigDict(defer_build=True)
+
     def to_json(self):
-        return self.model_dump_json()
+        return payloads.encode(codec.dumps(self))
+
+    @model_validator(mode="wrap")
+    @classmethod
+    def _resolve_lazy(cls, value, handler):
+        # Nested lazy payloads are validated (and serialized) as their model
+        if isinstance(value, payloads.LazyPayload):
+            value = value.resolve()
+        return handler(value)
+
+    @classmethod
+    def from_json(cls, obj: str):
+        if payloads.is_envelope(obj):
+            return payloads.lazy(cls, obj)
+        if decode_memo.maxsize <= 0:
+            return codec.loads(cls, obj)
+        out = decode_memo.get(cls, obj)
+        if out is None:
+            out = codec.loads(cls, obj)
+            decode_memo.set(cls, obj, out)
+        return out
 
 
 class OrchestratorIn(JsonSerializable):
     callback_uri_template: str
     client_input: dict
 
-    @staticmethod
-    def from_json(obj: str):
-        return OrchestratorIn.model_validate_json(obj)
-
 
 class GeocodingOut(JsonSerializable):
     model_config = ConfigDict()
@@ -32,27 +155,21 @@ class GeocodingOut(JsonSerializable):
     type: str
     importance: float
 
-    @staticmethod
-    def from_json(obj: dict):
-        return GeocodingOut.model_validate_json(obj)
-
 
 class WeatherIn(JsonSerializable):
     lat: str
     lon: str
 
-    @staticmethod
-    def from_json(obj: str):
-        return WeatherIn.model_validate_json(obj)
-
 
 class WeatherCurrentUnits(BaseModel):
+    model_config = ConfigDict(defer_build=True)
     time: str
     interval: str
     temperature: str
 
 
 class WeatherCurrent(BaseModel):
+    model_config = ConfigDict(defer_build=True)
     time: str
     interval: int
     temperature: float
@@ -69,27 +186,15 @@ class WeatherOut(JsonSerializable):
     current_units: WeatherCurrentUnits
     current: WeatherCurrent
 
-    @staticmethod
-    def from_json(obj: str):
-        return WeatherOut.model_validate_json(obj)
-
 
 class FeedbackReq(JsonSerializable):
     output: dict
     callback_uri: str
 
-    @staticmethod
-    def from_json(obj: str):
-        return FeedbackReq.model_validate_json(obj)
-
 
 class FeedbackRsp(JsonSerializable):
     status: str
 
-    @staticmethod
-    def from_json(obj: str):
-        return FeedbackRsp.model_validate_json(obj)
-
 
 class WorkflowOut(JsonSerializable):
     destination: str
@@ -97,16 +202,34 @@ class WorkflowOut(JsonSerializable):
     lon: str
     current_temp: float
 
-    @staticmethod
-    def from_json(obj: str):
-        return WorkflowOut.model_validate_json(obj)
-
 
 class OrchesratorOut(JsonSerializable):
     workflow: WorkflowOut
     feedback: FeedbackRsp
 
-    @staticmethod
-    def from_json(obj: str):
-        return OrchesratorOut.model_validate_json(obj)
 
+
+class ItineraryOut(JsonSerializable):
+    workflows: List[WorkflowOut]
+    feedback: FeedbackRsp
+
+
+class MonitorIn(JsonSerializable):
+    destinations: List[str]
+    interval: float = Field(900, gt=0)  # seconds between polls
+    threshold: float = Field(0.5, ge=0)  # smallest temperature change reported
+    polls_per_generation: int = Field(12, gt=0)  # polls before continue_as_new
+    until: Optional[str] = None  # ISO datetime to stop at
+    # Carried over by continue_as_new
+    locations: Dict[str, WeatherIn] = {}
+    temperatures: Dict[str, float] = {}
+    polls: int = 0
+    changes: int = 0
+    generation: int = 0
+
+
+class WeatherChange(JsonSerializable):
+    destination: str
+    previous: Optional[float]
+    current: float
+    time: str
@@ -1,37 +1,29 @@
-from datetime import timedelta
-import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 
 import azure.durable_functions as df
 
+from cache import normalize_key
+import entities
+import fanout
+import logs
+import metrics
+import models
 from models import *
 
 
 bp = df.Blueprint()
+MONITOR_STOP_EVENT = "StopMonitor"
+log = logs.get_logger(__name__)
+metrics.registry.register_stats("decode_memo", {}, models.decode_memo.stats)
 
-@bp.orchestration_trigger(context_name="context")
-def trip(context: df.DurableOrchestrationContext):
-    input = OrchestratorIn.model_validate(context.get_input())
-    destination = input.client_input["destination"]
-    if context.is_replaying is False:
-        logging.warning(f"Planning to: {destination}")
-    city_geocoding: GeocodingOut = yield context.call_activity(
-        name="get_geocoding", input_=str(destination)
-    )
-    get_weather_in = WeatherIn(lat=city_geocoding.lat, lon=city_geocoding.lon)
-    get_weather_out: WeatherOut = yield context.call_activity(
-        name="get_city_weather", input_=get_weather_in.model_dump()
-    )
-    wf_out = WorkflowOut(
-        destination=destination,
-        lat=city_geocoding.lat,
-        lon=city_geocoding.lon,
-        current_temp=str(get_weather_out.current.temperature),
-    )
-    # Send feedback request
+
+def wait_for_feedback(context: df.DurableOrchestrationContext, callback_uri_template: str, output: dict):
+    """Send a feedback request for `output` and wait up to 5s for the answer."""
     fb_event_name = "Approval"
     fb_req = FeedbackReq(
-        output=wf_out.model_dump(),
-        callback_uri=input.callback_uri_template.format(eventName=fb_event_name),
+        output=output,
+        callback_uri=callback_uri_template.format(eventName=fb_event_name),
     )
     yield context.call_activity(name="ask_for_feedback", input_=fb_req)
     timer_task = context.create_timer(
@@ -42,13 +34,170 @@ def trip(context: df.DurableOrchestrationContext):
     if winner_task == timer_task:
         fb_rsp = FeedbackRsp(status="timeout")
     elif winner_task == approval_task:
-        logging.warning(f"Got feedback with result {approval_task.result}")
+        log.warning("feedback", context=context, result=approval_task.result)
         timer_task.cancel()  # important
         fb_rsp = FeedbackRsp(status=("completed" if approval_task.result["feedback"] in ("ok", None) else "rejected"))
+    return fb_rsp
+
+
+@bp.orchestration_trigger(context_name="context")
+@metrics.instrument("orchestrator")
+def trip(context: df.DurableOrchestrationContext):
+    input = OrchestratorIn.model_validate(context.get_input())
+    destination = input.client_input["destination"]
+    log.warning("planning", context=context, destination=destination)
+    # Shared GeoCache entity first: it is warm even on a new instance
+    geocache_key = normalize_key(destination)
+    geocache = entities.geocache_id(geocache_key)
+    now = context.current_utc_datetime.timestamp()
+    cached = yield context.call_entity(geocache, "get", dict(key=geocache_key, now=now))
+    if cached is not None:
+        get_weather_in = WeatherIn.model_validate(cached)
+    else:
+        city_geocoding: GeocodingOut = yield context.call_activity(
+            name="get_geocoding", input_=str(destination)
+        )
+        get_weather_in = WeatherIn(lat=city_geocoding.lat, lon=city_geocoding.lon)
+        context.signal_entity(
+            geocache, "set", dict(key=geocache_key, value=get_weather_in.model_dump(), now=now)
+        )
+    get_weather_out: WeatherOut = yield context.call_activity(
+        name="get_city_weather", input_=get_weather_in.model_dump()
+    )
+    wf_out = WorkflowOut(
+        destination=destination,
+        lat=get_weather_in.lat,
+        lon=get_weather_in.lon,
+        current_temp=str(get_weather_out.current.temperature),
+    )
+    fb_rsp = yield from wait_for_feedback(context, input.callback_uri_template, wf_out.model_dump())
     out = OrchesratorOut(
         workflow=wf_out,
         feedback=fb_rsp,
     )
-    if context.is_replaying is False:
-        logging.warning(f"Destination details: {out}")
+    log.warning("trip_details", context=context, output=out)
     return out.model_dump()
+
+
+@bp.orchestration_trigger(context_name="context", orchestration=fanout.FAN_OUT_ORCHESTRATOR)
+@metrics.instrument("orchestrator")
+def fan_out(context: df.DurableOrchestrationContext):
+    """One batch of `fanout.bounded`: see the `fanout` module."""
+    results = yield from fanout.bounded(context, **context.get_input())
+    return results
+
+
+@bp.orchestration_trigger(context_name="context")
+@metrics.instrument("orchestrator")
+def itinerary(context: df.DurableOrchestrationContext):
+    """`trip` for several destinations, with one feedback request at the end.
+
+    Each destination's GeoCache -> geocoding -> weather chain advances as soon
+    as its own previous step completes, so the itinerary takes about as long
+    as its slowest chain rather than the sum of them.
+    """
+    input = OrchestratorIn.model_validate(context.get_input())
+    destinations = [str(d) for d in input.client_input["destinations"]]
+    log.warning("planning_itinerary", context=context, destinations=destinations)
+    now = context.current_utc_datetime.timestamp()
+    keys = [normalize_key(d) for d in destinations]
+    locations: List[Optional[WeatherIn]] = [None] * len(destinations)
+    workflows: List[Optional[WorkflowOut]] = [None] * len(destinations)
+    # task -> (destination index, step)
+    pending = {
+        context.call_entity(entities.geocache_id(key), "get", dict(key=key, now=now)): (index, "geocache")
+        for index, key in enumerate(keys)
+    }
+    while pending:
+        done = yield context.task_any(list(pending))
+        index, step = pending.pop(done)
+        if isinstance(done.result, Exception):
+            raise done.result
+        if step == "geocache" and done.result is None:
+            pending[context.call_activity(name="get_geocoding", input_=destinations[index])] = (index, "geocoding")
+        elif step in ("geocache", "geocoding"):
+            if step == "geocache":
+                locations[index] = WeatherIn.model_validate(done.result)
+            else:
+                locations[index] = WeatherIn(lat=done.result.lat, lon=done.result.lon)
+                context.signal_entity(
+                    entities.geocache_id(keys[index]),
+                    "set",
+                    dict(key=keys[index], value=locations[index].model_dump(), now=now),
+                )
+            pending[context.call_activity(name="get_city_weather", input_=locations[index].model_dump())] = (index, "weather")
+        else:
+            workflows[index] = WorkflowOut(
+                destination=destinations[index],
+                lat=locations[index].lat,
+                lon=locations[index].lon,
+                current_temp=str(done.result.current.temperature),
+            )
+    fb_rsp = yield from wait_for_feedback(
+        context, input.callback_uri_template, dict(workflows=[w.model_dump() for w in workflows])
+    )
+    out = ItineraryOut(workflows=workflows, feedback=fb_rsp)
+    log.warning("itinerary_details", context=context, output=out)
+    return out.model_dump()
+
+
+def as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+@bp.orchestration_trigger(context_name="context")
+@metrics.instrument("orchestrator")
+def weather_monitor(context: df.DurableOrchestrationContext):
+    """Poll the weather of `destinations` until `until` or a StopMonitor event.
+
+    Temperature changes of at least `threshold` are sent to
+    `notify_weather_changes`. Every `polls_per_generation` polls the
+    orchestration continues as new with its compact state (locations, last
+    temperatures, counters), so its history, and the cost of replaying it,
+    stays bounded however long it runs.
+    """
+    input = OrchestratorIn.model_validate(context.get_input())
+    state = MonitorIn.model_validate(input.client_input)
+    until = as_utc(datetime.fromisoformat(state.until)) if state.until else None
+    if not state.locations:
+        geocodings = yield context.task_all(
+            [context.call_activity(name="get_geocoding", input_=d) for d in state.destinations]
+        )
+        state.locations = {d: WeatherIn(lat=g.lat, lon=g.lon) for d, g in zip(state.destinations, geocodings)}
+    # One waiter for the whole generation: each new one would wait for another event
+    stop_task = context.wait_for_external_event(MONITOR_STOP_EVENT)
+    for _ in range(state.polls_per_generation):
+        weathers = yield context.task_all(
+            [
+                context.call_activity(name="get_city_weather", input_=state.locations[d].model_dump())
+                for d in state.destinations
+            ]
+        )
+        changes = []
+        for destination, weather in zip(state.destinations, weathers):
+            previous = state.temperatures.get(destination)
+            current = weather.current.temperature
+            if previous is None or abs(current - previous) >= state.threshold:
+                changes.append(
+                    WeatherChange(destination=destination, previous=previous, current=current, time=weather.current.time)
+                )
+                state.temperatures[destination] = current
+        state.polls += 1
+        if changes:
+            state.changes += len(changes)
+            yield context.call_activity(name="notify_weather_changes", input_=[c.model_dump() for c in changes])
+        summary = state.model_dump(include={"generation", "polls", "changes", "temperatures"})
+        context.set_custom_status(summary)
+        next_poll = context.current_utc_datetime + timedelta(seconds=state.interval)
+        if until is not None and as_utc(next_poll) > until:
+            return summary
+        timer_task = context.create_timer(next_poll)
+        winner_task = yield context.task_any([stop_task, timer_task])
+        if winner_task == stop_task:
+            timer_task.cancel()
+            return summary
+    state.generation += 1
+    log.info("monitor_continue_as_new", context=context, generation=state.generation)
+    context.continue_as_new(
+        OrchestratorIn(callback_uri_template=input.callback_uri_template, client_input=state.model_dump()).model_dump()
+    )
@@ -0,0 +1,234 @@
+"""Compression and claim-check for payloads kept in durable history.
+
+`JsonSerializable.to_json` passes its JSON through `encode`:
+
+- payloads up to PAYLOAD_COMPRESS_THRESHOLD bytes are kept as they are;
+- larger ones are zlib-compressed (base64, since history is JSON), when
+  that makes them smaller;
+- payloads over PAYLOAD_CLAIM_CHECK_THRESHOLD are written to PAYLOAD_STORE
+  under their sha256, and only that reference goes into history.
+
+`JsonSerializable.from_json` returns a `LazyPayload` for such envelopes:
+nothing is fetched or decompressed until an attribute of the model is used,
+so replays don't pay for results the orchestrator only passes along. It is
+not an instance of the model: pydantic models resolve it when it is passed
+as a field, and `resolve()` gives the model itself.
+
+PAYLOAD_STORE is `file:///some/dir` or `azure://<container>` (Blob storage
+of AzureWebJobsStorage, e.g. Azurite with `UseDevelopmentStorage=true`;
+requires the `azure-storage-blob` package).
+"""
+import base64
+from collections import OrderedDict
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+from typing import Optional
+from urllib.parse import urlsplit
+import zlib
+
+from metrics import registry
+
+
+ENVELOPE_PREFIX = '{"$payload":'
+
+
+class FileBlobStore:
+    """Blobs as files under `root`."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def put(self, name: str, data: bytes):
+        path = self.root / name
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+
+    def get(self, name: str) -> bytes:
+        return (self.root / name).read_bytes()
+
+
+class AzureBlobStore:
+    """Blobs in an Azure Storage (or Azurite) container."""
+
+    def __init__(self, container: str, connection_string: str):
+        from azure.storage.blob import ContainerClient  # optional dependency
+
+        self._container = ContainerClient.from_connection_string(connection_string, container)
+        self._created = False
+
+    def put(self, name: str, data: bytes):
+        from azure.core.exceptions import ResourceExistsError
+
+        if not self._created:
+            try:
+                self._container.create_container()
+            except ResourceExistsError:
+                pass
+            self._created = True
+        try:
+            self._container.upload_blob(name, data, overwrite=False)
+        except ResourceExistsError:
+            pass  # content-addressed: same name, same data
+
+    def get(self, name: str) -> bytes:
+        return self._container.download_blob(name).readall()
+
+
+def store_from_url(url: Optional[str]):
+    if not url:
+        return None
+    parts = urlsplit(url)
+    if parts.scheme == "file":
+        return FileBlobStore(parts.path)
+    if parts.scheme == "azure":
+        return AzureBlobStore(parts.netloc, os.environ["AzureWebJobsStorage"])
+    raise ValueError(f"Unsupported PAYLOAD_STORE: {url}")
+
+
+class PayloadStats:
+
+    def __init__(self):
+        self.encoded = 0
+        self.compressed = 0
+        self.claim_checked = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lazy = 0
+        self.resolved = 0
+        self.fetched = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+compress_threshold = int(os.environ.get("PAYLOAD_COMPRESS_THRESHOLD", 4096))
+claim_check_threshold = int(os.environ.get("PAYLOAD_CLAIM_CHECK_THRESHOLD", 64 * 1024))
+store = store_from_url(os.environ.get("PAYLOAD_STORE"))
+stats = PayloadStats()
+# References already written by this process (encode runs again on every
+# replay), least recently used first; a forgotten one is just written again
+_stored = OrderedDict()
+STORED_REFS = int(os.environ.get("PAYLOAD_STORED_REFS", 4096))
+_lock = threading.Lock()
+registry.register_stats("payloads", {}, stats.as_dict)
+
+
+def configure(compress_threshold: Optional[int] = None, claim_check_threshold: Optional[int] = None, store=False):
+    """Change thresholds and/or the store (`None` disables claim-check)."""
+    module = globals()
+    if compress_threshold is not None:
+        module["compress_threshold"] = compress_threshold
+    if claim_check_threshold is not None:
+        module["claim_check_threshold"] = claim_check_threshold
+    if store is not False:
+        module["store"] = store
+        _stored.clear()
+
+
+def encode(data: str) -> str:
+    """The history representation of a JSON payload."""
+    stats.encoded += 1
+    raw = data.encode()
+    stats.bytes_in += len(raw)
+    out = data
+    if 0 < compress_threshold < len(raw):
+        compressed = zlib.compress(raw)
+        if store is not None and 0 < claim_check_threshold < len(raw):
+            ref = f"payloads/{hashlib.sha256(raw).hexdigest()}.json.z"
+            with _lock:
+                if ref in _stored:
+                    _stored.move_to_end(ref)
+                else:
+                    store.put(ref, compressed)
+                    _stored[ref] = None
+                    while len(_stored) > STORED_REFS:
+                        _stored.popitem(last=False)
+            stats.claim_checked += 1
+            out = json.dumps({"$payload": "ref", "ref": ref, "size": len(raw)})
+        else:
+            envelope = json.dumps({"$payload": "zlib", "data": base64.b64encode(compressed).decode()})
+            if len(envelope) < len(raw):
+                stats.compressed += 1
+                out = envelope
+    stats.bytes_out += len(out)
+    return out
+
+
+def is_envelope(data) -> bool:
+    return isinstance(data, str) and data.startswith(ENVELOPE_PREFIX)
+
+
+def decode(data: str) -> str:
+    """The JSON payload of an envelope."""
+    envelope = json.loads(data)
+    kind = envelope["$payload"]
+    if kind == "zlib":
+        return zlib.decompress(base64.b64decode(envelope["data"])).decode()
+    if kind == "ref":
+        if store is None:
+            raise RuntimeError(f"Payload {envelope['ref']} is claim-checked, but PAYLOAD_STORE is not set")
+        stats.fetched += 1
+        return zlib.decompress(store.get(envelope["ref"])).decode()
+    raise ValueError(f"Unknown payload envelope: {kind}")
+
+
+class LazyPayload:
+    """Stands in for a model decoded from an envelope until it is used.
+
+    Re-serialization passes the envelope on unchanged; attribute access
+    decodes it. Instances are created by `lazy`, whose per-model subclasses
+    carry the model's name and module for the durable serializer.
+    """
+
+    model: type = None
+
+    def __init__(self, data: str):
+        stats.lazy += 1
+        self.__dict__.update(_data=data, _value=None)
+
+    def resolve(self):
+        """The decoded model."""
+        if self._value is None:
+            stats.resolved += 1
+            self.__dict__["_value"] = self.model.from_json(decode(self._data))
+        return self._value
+
+    def to_json(self) -> str:
+        return self._data
+
+
+    def __getattr__(self, name: str):
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self.resolve(), name, value)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyPayload):
+            other = other.resolve()
+        return self.resolve() == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self._value) if self._value is not None else f"<lazy {self.model.__name__}>"
+
+
+_lazy_classes = {}
+
+
+def lazy(cls: type, data: str) -> LazyPayload:
+    """A `LazyPayload` of model `cls` for the envelope `data`."""
+    lazy_cls = _lazy_classes.get(cls)
+    if lazy_cls is None:
+        namespace = dict(model=cls, __module__=cls.__module__, __qualname__=cls.__qualname__)
+        lazy_cls = _lazy_classes[cls] = type(cls.__name__, (LazyPayload,), namespace)
+    return lazy_cls(data)
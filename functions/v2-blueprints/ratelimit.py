@@ -0,0 +1,203 @@
+"""Per-host token bucket rate limiting for upstream HTTP calls.
+
+Limits are configured with RATE_LIMITS, e.g.
+`geocode.maps.co=1:2,api.open-meteo.com=10:20` (requests per second and
+burst per host). Hosts without a limit are not throttled, but still honour
+`Retry-After`.
+
+Every activity invocation in the worker shares the host's limiter. Waiting
+callers are served in FIFO order. On a 429 the rate is halved and the bucket
+is paused for `Retry-After`. Successful calls then bring the rate back to
+just under the rate that was throttled, and only probe above it slowly, so
+throughput settles below the quota instead of oscillating around it.
+"""
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import os
+import time
+from typing import Callable, Deque, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from metrics import registry
+
+
+class TokenBucket:
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float = 1,
+        min_rate: Optional[float] = None,
+        decrease: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """`rate` is in tokens per second; 0 means unlimited."""
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.min_rate = min_rate if min_rate is not None else rate / 10
+        self.decrease = decrease
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self.ceiling = 0.0
+        self.acquired = 0
+        self.waited = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.throttled = 0
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _available(self, now: float) -> bool:
+        if now < self._paused_until:
+            return False
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        return self._tokens >= 1
+
+    def _take(self):
+        if self.rate > 0:
+            self._tokens -= 1
+        self.acquired += 1
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is free and nobody is waiting for it."""
+        if not self._waiters and self._available(self._clock()):
+            self._take()
+            return True
+        return False
+
+    async def acquire(self) -> float:
+        """Wait for a token; returns the seconds waited."""
+        now = self._clock()
+        if not self._waiters and self._available(now):
+            self._take()
+            return 0.0
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self._schedule(loop)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                self._tokens += 1  # granted but not used
+                self.acquired -= 1
+            self._schedule(loop)
+            raise
+        waited = self._clock() - now
+        self.waited += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        return waited
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        if not self._waiters:
+            return
+        now = self._clock()
+        delay = max(self._paused_until - now, 0.0)
+        if self.rate > 0:
+            self._refill(now)
+            delay = max(delay, (1 - self._tokens) / self.rate)
+        self._wakeup = loop.call_later(delay, self._wake, loop)
+
+    def _wake(self, loop: asyncio.AbstractEventLoop):
+        self._wakeup = None
+        now = self._clock()
+        while self._waiters and self._available(now):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._take()
+                waiter.set_result(None)
+        self._schedule(loop)
+
+    def on_throttled(self, retry_after: Optional[float] = None):
+        """The host answered 429: slow down, and pause for `retry_after`."""
+        self.throttled += 1
+        now = self._clock()
+        if self.rate > 0:
+            self.ceiling = self.rate
+            self.rate = max(self.rate * self.decrease, self.min_rate)
+            self._refill(now)
+            self._tokens = min(self._tokens, 0)
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+
+    def on_success(self):
+        if self.rate <= 0 or self.rate >= self.max_rate:
+            return
+        target = self.ceiling * 0.9
+        if self.rate < target:
+            self.rate += (target - self.rate) * 0.1
+        else:
+            self.rate = min(self.rate + self.max_rate * 0.01, self.max_rate)
+
+    def stats(self) -> dict:
+        return dict(
+            rate=self.rate,
+            max_rate=self.max_rate,
+            queued=len(self._waiters),
+            acquired=self.acquired,
+            waited=self.waited,
+            wait_time_total=self.wait_time_total,
+            wait_time_max=self.wait_time_max,
+            throttled=self.throttled,
+        )
+
+
+def retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a `Retry-After` header (delay-seconds or HTTP-date)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def parse_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    limits = {}
+    for item in filter(None, (i.strip() for i in value.split(","))):
+        host, _, spec = item.partition("=")
+        rate, _, burst = spec.partition(":")
+        limits[host.strip()] = (float(rate), float(burst or 1))
+    return limits
+
+
+LIMITS = parse_limits(os.environ.get("RATE_LIMITS", "geocode.maps.co=1:1"))
+_limiters: Dict[str, TokenBucket] = {}
+
+
+def limiter(url_or_host: str) -> TokenBucket:
+    """The token bucket shared by all calls to a host."""
+    host = urlsplit(url_or_host).hostname or url_or_host
+    bucket = _limiters.get(host)
+    if bucket is None:
+        rate, burst = LIMITS.get(host, (0, 1))
+        bucket = _limiters[host] = TokenBucket(rate, burst)
+        registry.register_stats("ratelimit", {"host": host}, bucket.stats)
+    return bucket
+
+
+def clear():
+    _limiters.clear()
@@ -0,0 +1,276 @@
+"""Deadlines, hedged requests and circuit breaking for upstream HTTP calls.
+
+Usage, inside an activity:
+
+    async def request():
+        http_client = await http_pool.session()
+        async with http_client.get(url=url, params=params) as rsp:
+            rsp.raise_for_status()
+            return await rsp.json()
+
+    payload = await resilience.upstream(url).call(request)
+
+`request` must be idempotent: when the first attempt is slower than the
+host's recent `hedge_quantile` latency, a second one is started and the
+first response wins. Hedges are capped at `hedge_budget` of the requests so
+a slow host doesn't get twice the load, and `may_hedge` (e.g. a rate
+limiter's `try_acquire`) can veto them.
+
+Waiting for a rate limit token belongs before `call`: time spent there is
+not the host's latency and must not count against the deadline or breaker.
+"""
+import asyncio
+from collections import deque
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from metrics import registry
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised without calling the host while its circuit is open."""
+
+
+class Throttled(Exception):
+    """A 429 the caller retries once its rate limiter lets it through.
+
+    Neither a success nor a failure for the breaker: the host is alive, but
+    says nothing about whether it is healthy.
+    """
+
+    def __init__(self, retry_after: Optional[float]):
+        super().__init__(f"Throttled, retry after {retry_after}")
+        self.retry_after = retry_after
+
+
+def is_failure(e: BaseException) -> bool:
+    """Whether an error says the host is unhealthy (vs. a bad request)."""
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status >= 500 or e.status == 429
+    return isinstance(e, (asyncio.TimeoutError, aiohttp.ClientError, OSError))
+
+
+class LatencyTracker:
+    """Recent latencies of successful calls, for percentile estimates."""
+
+    def __init__(self, window: int = 256):
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """Open after `failure_threshold` consecutive failures.
+
+    While open, calls fail fast with `CircuitOpenError`. After
+    `reset_timeout` seconds one probe call is let through (half-open): its
+    success closes the circuit, its failure opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN and self._clock() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            return
+        self.rejected += 1
+        raise CircuitOpenError(f"Circuit open, retry in {self.retry_after():.1f}s")
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + self.reset_timeout - self._clock(), 0.0)
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self.opened_at = self._clock()
+
+    def abandon(self):
+        """The call let through by `allow` was cancelled before it finished."""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.opened_at = self._clock() - self.reset_timeout
+
+    def stats(self) -> dict:
+        return dict(
+            state=self.state,
+            consecutive_failures=self.failures,
+            opened=self.opened,
+            rejected=self.rejected,
+        )
+
+
+class Upstream:
+    """Resilience policy for one upstream host."""
+
+    def __init__(
+        self,
+        host: str,
+        deadline: float = 10,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.05,
+        hedge_budget: float = 0.1,
+        breaker: Optional[CircuitBreaker] = None,
+        min_samples: int = 20,
+    ):
+        self.host = host
+        self.deadline = deadline
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.breaker = breaker or CircuitBreaker()
+        self.min_samples = min_samples
+        self.latency = LatencyTracker()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, host: str) -> "Upstream":
+        return cls(
+            host,
+            deadline=float(os.environ.get("UPSTREAM_DEADLINE", 10)),
+            hedge_quantile=float(os.environ.get("UPSTREAM_HEDGE_QUANTILE", 0.95)),
+            hedge_min_delay=float(os.environ.get("UPSTREAM_HEDGE_MIN_DELAY", 0.05)),
+            hedge_budget=float(os.environ.get("UPSTREAM_HEDGE_BUDGET", 0.1)),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get("UPSTREAM_BREAKER_FAILURES", 5)),
+                reset_timeout=float(os.environ.get("UPSTREAM_BREAKER_RESET", 30)),
+            ),
+        )
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None to not hedge this call."""
+        if self.hedge_budget <= 0 or len(self.latency.samples) < self.min_samples:
+            return None
+        if self.hedges >= self.hedge_budget * self.requests:
+            return None
+        return max(self.latency.percentile(self.hedge_quantile), self.hedge_min_delay)
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        deadline: Optional[float] = None,
+        may_hedge: Optional[Callable[[], bool]] = None,
+    ) -> Any:
+        self.breaker.allow()
+        self.requests += 1
+        started = time.perf_counter()
+        try:
+            out = await asyncio.wait_for(self._hedged(fn, may_hedge), deadline or self.deadline)
+        except asyncio.TimeoutError:
+            self.deadline_exceeded += 1
+            self._failed()
+            raise
+        except (asyncio.CancelledError, Throttled):
+            self.breaker.abandon()
+            raise
+        except Exception as e:
+            if is_failure(e):
+                self._failed()
+            else:
+                self.breaker.record_success()
+            raise
+        self.latency.observe(time.perf_counter() - started)
+        self.breaker.record_success()
+        return out
+
+    def _failed(self):
+        self.failures += 1
+        self.breaker.record_failure()
+
+    async def _hedged(self, fn: Callable[[], Awaitable[Any]], may_hedge: Optional[Callable[[], bool]] = None) -> Any:
+        primary = asyncio.ensure_future(fn())
+        delay = self.hedge_delay()
+        if delay is None:
+            return await primary
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and (may_hedge is None or may_hedge()):
+                self.hedges += 1
+                tasks.append(asyncio.ensure_future(fn()))
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return dict(
+            requests=self.requests,
+            hedges=self.hedges,
+            hedge_wins=self.hedge_wins,
+            hedge_rate=self.hedges / self.requests if self.requests else 0.0,
+            deadline_exceeded=self.deadline_exceeded,
+            failures=self.failures,
+            latency_p50=self.latency.percentile(0.5) or 0.0,
+            latency_hedge_quantile=self.latency.percentile(self.hedge_quantile) or 0.0,
+            **{f"breaker_{k}": v for k, v in self.breaker.stats().items()},
+        )
+
+
+_upstreams: Dict[str, Upstream] = {}
+
+
+def upstream(url_or_host: str) -> Upstream:
+    """The shared `Upstream` of a host, configured from the environment."""
+    host = urlsplit(url_or_host).hostname or url_or_host
+    up = _upstreams.get(host)
+    if up is None:
+        up = _upstreams[host] = Upstream.from_env(host)
+        registry.register_stats("upstream", {"host": host}, up.stats)
+    return up
+
+
+def stats() -> dict:
+    return {host: up.stats() for host, up in _upstreams.items()}
+
+
+def clear():
+    _upstreams.clear()
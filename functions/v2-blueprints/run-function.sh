@@ -3,6 +3,15 @@
 ### External Feedback
 curl -o - --request POST http://localhost:7071/api/workflow/trip --data '{"destination":"Chicago"}' | jq ".statusQueryGetUri"
 
+# Deduplicated: repeats within WORKFLOW_DEDUPE_WINDOW attach to the same instance, or get its output once completed
+curl -o - --request POST "http://localhost:7071/api/workflow/trip?dedupe=1" --data '{"destination":"Chicago"}' | jq
+
+### Several destinations, one feedback request
+curl -o - --request POST http://localhost:7071/api/workflow/itinerary --data '{"destinations":["Chicago","Milan","Tokyo"]}' | jq ".statusQueryGetUri"
+
+### Weather monitor (stop with the StopMonitor event)
+curl -o - --request POST http://localhost:7071/api/workflow/weather_monitor --data '{"destinations":["Chicago","Milan"],"interval":600}' | jq ".sendEventPostUri"
+
 #### Feedback
 # Use the callback uri from the get_feedback logging
 callback_uri="http://localhost:7071/runtime/webhooks/durabletask/instances/4f286578-70b8-11ee-958c-d79b55559e5f/raiseEvent/Approval?taskHub=green&connection=Storage&code=R5wrKj6nfulNeamkBgAKAAhhq2cvQ_nz5eMOg57pShvxAzFuSsmdgQ=="
@@ -10,4 +19,16 @@ curl -o - --location --request POST ${callback_uri}  \
   --header 'Content-Type: application/json' \
   --data-raw '{
       "feedback": "ok",
-  }'
\ No newline at end of file
+  }'
+
+### Bulk start (NDJSON in, one management payload per line out)
+printf '{"destination":"Chicago"}\n{"destination":"Milan"}\n' \
+  | curl -o - --request POST "http://localhost:7071/api/workflow-bulk/trip?concurrency=16" --data-binary @-
+### Bulk approvals (one line per instance: delivered or error, queued_ms, raise_ms)
+curl -o - --request POST "http://localhost:7071/api/workflow-events/bulk?event_name=Approval&concurrency=32" \
+  --data '[{"instance_id": "<instance-id-1>", "payload": {"feedback": "ok"}}, {"instance_id": "<instance-id-2>", "payload": {"feedback": "ok"}}]'
+### Long-poll the status of several instances
+curl -o - --request POST http://localhost:7071/api/workflow-status/wait \
+  --data '{"instance_ids": ["<instance-id-1>", "<instance-id-2>"], "timeout": 30}'
+### Per-function latency/size metrics (Prometheus text format)
+curl -o - http://localhost:7071/api/metrics
@@ -0,0 +1,80 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Flight:
+    """An in-flight call: the future its callers await and the task running it."""
+
+    __slots__ = ("future", "task")
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight call.
+
+    The first caller for a key starts the call in its own task; callers
+    arriving while it runs await the same future and get the same result or
+    exception. Each caller waits at most `timeout` seconds, and the shared
+    call itself is cancelled after `timeout`.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        self.calls += 1
+        entry = self._flights.get(key)
+        if entry is not None and entry.future.get_loop() is loop:
+            self.coalesced += 1
+        else:
+            future = loop.create_future()
+            # Mark the exception as retrieved even if every waiter gave up
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            entry = self._flights[key] = _Flight(future)
+            # The event loop only keeps a weak reference to tasks
+            entry.task = loop.create_task(self._run(key, fn, entry))
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry.future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[Any]], entry: _Flight):
+        flight = entry.future
+        try:
+            result = await asyncio.wait_for(fn(), self.timeout)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            self.errors += 1
+            if not flight.done():
+                flight.set_exception(e)
+        else:
+            if not flight.done():
+                flight.set_result(result)
+        finally:
+            entry.task = None
+            if self._flights.get(key) is entry:
+                del self._flights[key]
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> dict:
+        return dict(
+            calls=self.calls,
+            coalesced=self.coalesced,
+            errors=self.errors,
+            timeouts=self.timeouts,
+            in_flight=len(self._flights),
+        )
@@ -1,8 +1,29 @@
 from aioresponses import aioresponses
 import pytest
 
+from activities import geocoding_cache, weather_cache
+from http_pool import http_pool
+import ratelimit
+import resilience
+
 
 @pytest.fixture
 def aioresponse():
     with aioresponses() as m:
-        yield m
\ No newline at end of file
+        yield m
+
+
+@pytest.fixture
+async def clear_caches(monkeypatch):
+    """Fresh caches, rate limiters and upstream policies, and no pooled session."""
+    monkeypatch.setattr(ratelimit, "LIMITS", {})
+    ratelimit.clear()
+    resilience.clear()
+    geocoding_cache.clear()
+    weather_cache.clear()
+    yield
+    geocoding_cache.clear()
+    weather_cache.clear()
+    ratelimit.clear()
+    resilience.clear()
+    await http_pool.close()
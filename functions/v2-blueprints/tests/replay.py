@@ -0,0 +1,661 @@
+"""In-process replay engine for durable orchestrators.
+
+Runs the generator orchestrators registered on a blueprint against a fake
+`DurableOrchestrationContext`, without the Functions host or Azurite.
+
+Each orchestration keeps a real event history. Whenever the orchestrator
+blocks on a task that has not completed yet, the work scheduled during the
+episode is executed, its completion appended to the history, and the
+orchestrator is re-run from the start, replaying what it already saw.
+Timers and external events run on a virtual clock. Entity operations run
+against state kept by the engine, in the order they were scheduled.
+
+Payloads cross the activity and orchestrator boundary through the same
+custom-object JSON hooks used by the Functions host, so `to_json` and
+`from_json` are exercised exactly as in production.
+"""
+import asyncio
+import inspect
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from azure.functions._durable_functions import (
+    _deserialize_custom_object,
+    _serialize_custom_object,
+)
+from azure.functions.decorators.function_app import FunctionBuilder
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, default=_serialize_custom_object)
+
+
+def loads(value: Optional[str]) -> Any:
+    if value is None:
+        return None
+    return json.loads(value, object_hook=_deserialize_custom_object)
+
+
+class NonDeterminismError(RuntimeError):
+    pass
+
+
+class OrchestrationStuckError(RuntimeError):
+    pass
+
+
+@dataclass
+class Completion:
+    seq: int
+    episode: int
+    ok: bool
+    value: Any
+
+
+class Task:
+
+    def __init__(self, context: "FakeOrchestrationContext", kind: str, name: Optional[str] = None):
+        self.context = context
+        self.kind = kind
+        self.name = name
+        self.id: Optional[int] = None
+        self.result: Any = None
+        self.is_completed = False
+        self.is_faulted = False
+
+    def _completion(self) -> Optional[Completion]:
+        raise NotImplementedError
+
+    def _settle(self, completion: Completion):
+        self.is_completed = True
+        self.is_faulted = not completion.ok
+        self.result = completion.value
+
+    def __repr__(self):
+        return f"<{type(self).__name__} id={self.id} name={self.name}>"
+
+
+class HistoryTask(Task):
+    """A task whose completion is recorded against its id in the history."""
+
+    def _completion(self) -> Optional[Completion]:
+        completion = self.context._completions.get(self.id)
+        if completion is not None and not self.is_completed:
+            self._settle(completion)
+        return completion
+
+
+class ActivityTask(HistoryTask):
+
+    def __init__(self, context, kind, name, input_):
+        super().__init__(context, kind, name)
+        self.input = input_
+
+
+class EntityTask(ActivityTask):
+
+    def __init__(self, context, kind, entity_id, operation: str, input_):
+        super().__init__(context, kind, f"{entity_id.name}.{operation}", input_)
+        self.entity_id = entity_id
+        self.operation = operation
+
+
+class TimerTask(HistoryTask):
+
+    def __init__(self, context, fire_at: datetime):
+        super().__init__(context, "timer")
+        self.fire_at = fire_at
+        self.is_cancelled = False
+
+    def cancel(self):
+        if self.is_completed:
+            raise Exception("Cannot cancel a completed task.")
+        self.is_cancelled = True
+
+
+class ExternalEventTask(Task):
+
+    def __init__(self, context, name: str, index: int):
+        super().__init__(context, "event", name)
+        self.index = index
+
+    def _completion(self) -> Optional[Completion]:
+        events = self.context._events.get(self.name, [])
+        if self.index >= len(events):
+            return None
+        completion = events[self.index]
+        if not self.is_completed:
+            self._settle(completion)
+        return completion
+
+
+class WhenAllTask(Task):
+
+    def __init__(self, context, tasks: List[Task]):
+        super().__init__(context, "all")
+        self.children = list(tasks)
+
+    def _completion(self) -> Optional[Completion]:
+        completions = [t._completion() for t in self.children]
+        failed = [c for c in completions if c is not None and not c.ok]
+        if failed:
+            first = min(failed, key=lambda c: c.seq)
+            completion = Completion(first.seq, first.episode, False, first.value)
+        elif any(c is None for c in completions):
+            return None
+        elif not completions:
+            completion = Completion(-1, 0, True, [])
+        else:
+            last = max(completions, key=lambda c: c.seq)
+            completion = Completion(last.seq, last.episode, True, [c.value for c in completions])
+        self._settle(completion)
+        return completion
+
+
+class WhenAnyTask(Task):
+
+    def __init__(self, context, tasks: List[Task]):
+        super().__init__(context, "any")
+        self.children = list(tasks)
+
+    def _completion(self) -> Optional[Completion]:
+        done = [(t, t._completion()) for t in self.children]
+        done = [(t, c) for t, c in done if c is not None]
+        if not done:
+            return None
+        winner, first = min(done, key=lambda tc: tc[1].seq)
+        completion = Completion(first.seq, first.episode, True, winner)
+        self._settle(completion)
+        return completion
+
+
+class FakeOrchestrationContext:
+    """The subset of `df.DurableOrchestrationContext` used by orchestrators."""
+
+    def __init__(self, engine: "ReplayEngine", instance: "Instance", episode: int):
+        self._engine = engine
+        self._instance = instance
+        self._episode = episode
+        self._completions: Dict[int, Completion] = {}
+        self._events: Dict[str, List[Completion]] = {}
+        self._scheduled: Dict[int, dict] = {}
+        self._waiters: Dict[str, int] = {}
+        self._next_id = 0
+        self._uuid_counter = 0
+        self._replayed_tasks = 0
+        self.tasks: List[HistoryTask] = []
+        self.new_tasks: List[HistoryTask] = []
+        self.custom_status: Any = instance.custom_status
+        self.continue_as_new_input: Any = None
+        self.is_continued_as_new = False
+        for seq, event in enumerate(instance.history):
+            etype = event["type"]
+            if etype in ("TaskScheduled", "TimerCreated"):
+                self._scheduled[event["task_id"]] = event
+            elif etype in ("TaskCompleted", "TimerFired"):
+                self._completions[event["task_id"]] = Completion(
+                    seq, event["episode"], True, loads(event.get("result"))
+                )
+            elif etype == "TaskFailed":
+                self._completions[event["task_id"]] = Completion(
+                    seq, event["episode"], False, Exception(event["reason"])
+                )
+            elif etype == "EventRaised":
+                self._events.setdefault(event["name"], []).append(
+                    Completion(seq, event["episode"], True, loads(event.get("input")))
+                )
+        self._advance(0)
+
+    def _advance(self, episode: int):
+        self._clock_episode = episode
+        self.is_replaying = episode < self._episode
+        self.current_utc_datetime = self._instance.timestamps[episode]
+
+    def _track(self, task: HistoryTask, kind: str, name: Optional[str]) -> HistoryTask:
+        task.id = self._next_id
+        self._next_id += 1
+        recorded = self._scheduled.get(task.id)
+        if recorded is None:
+            self.new_tasks.append(task)
+        elif recorded.get("kind") != kind or recorded.get("name") != name:
+            raise NonDeterminismError(
+                f"Task {task.id} was {recorded.get('kind')}:{recorded.get('name')} "
+                f"in history, got {kind}:{name} on replay"
+            )
+        self.tasks.append(task)
+        return task
+
+    @property
+    def instance_id(self) -> str:
+        return self._instance.instance_id
+
+    @property
+    def parent_instance_id(self) -> Optional[str]:
+        return self._instance.parent_instance_id
+
+    @property
+    def histories(self) -> List[dict]:
+        return self._instance.history
+
+    def get_input(self) -> Any:
+        return loads(self._instance.input)
+
+    def new_uuid(self) -> str:
+        self._uuid_counter += 1
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, f"{self.instance_id}_{self._uuid_counter}"))
+
+    def set_custom_status(self, status: Any):
+        self.custom_status = status
+
+    def call_activity(self, name: str, input_: Any = None) -> Task:
+        return self._track(ActivityTask(self, "activity", name, dumps(input_)), "activity", name)
+
+    def call_activity_with_retry(self, name: str, retry_options: Any, input_: Any = None) -> Task:
+        task = ActivityTask(self, "activity", name, dumps(input_))
+        task.max_attempts = getattr(retry_options, "max_number_of_attempts", 1)
+        return self._track(task, "activity", name)
+
+    def call_sub_orchestrator(self, name: str, input_: Any = None, instance_id: Optional[str] = None) -> Task:
+        task = ActivityTask(self, "orchestration", name, dumps(input_))
+        task.instance_id = instance_id
+        return self._track(task, "orchestration", name)
+
+    def call_entity(self, entity_id: Any, operation_name: str, operation_input: Any = None) -> Task:
+        task = EntityTask(self, "entity", entity_id, operation_name, dumps(operation_input))
+        return self._track(task, "entity", task.name)
+
+    def signal_entity(self, entity_id: Any, operation_name: str, operation_input: Any = None) -> Task:
+        """Fire and forget: the returned task never completes."""
+        task = EntityTask(self, "signal", entity_id, operation_name, dumps(operation_input))
+        return self._track(task, "signal", task.name)
+
+    def create_timer(self, fire_at: datetime) -> TimerTask:
+        return self._track(TimerTask(self, fire_at), "timer", None)
+
+    def wait_for_external_event(self, name: str) -> Task:
+        index = self._waiters.get(name, 0)
+        self._waiters[name] = index + 1
+        return ExternalEventTask(self, name, index)
+
+    def task_all(self, tasks: List[Task]) -> Task:
+        return WhenAllTask(self, tasks)
+
+    def task_any(self, tasks: List[Task]) -> Task:
+        return WhenAnyTask(self, tasks)
+
+    def continue_as_new(self, input_: Any):
+        self.continue_as_new_input = dumps(input_)
+        self.is_continued_as_new = True
+
+
+class FakeEntityContext:
+    """The subset of `df.DurableEntityContext` used by entity functions."""
+
+    def __init__(self, name: str, key: str, operation: str, input_: Optional[str], state: Optional[str]):
+        self.entity_name = name
+        self.entity_key = key
+        self.operation_name = operation
+        self.is_newly_constructed = state is None
+        self._input = input_
+        self._state = loads(state)
+        self.result: Any = None
+        self.destructed = False
+        self.state_written = False
+
+    def get_input(self) -> Any:
+        return loads(self._input)
+
+    def get_state(self, initializer: Optional[Callable[[], Any]] = None) -> Any:
+        if self._state is None and initializer is not None:
+            self._state = initializer()
+        return self._state
+
+    def set_state(self, state: Any):
+        self._state = state
+        self.state_written = True
+
+    def set_result(self, result: Any):
+        self.result = result
+
+    def destruct_on_exit(self):
+        self.destructed = True
+
+
+@dataclass
+class EpisodeStats:
+    generation: int
+    index: int
+    replayed_tasks: int
+    history_events: int
+    history_bytes: int
+    wall_time: float
+
+
+@dataclass
+class Instance:
+    name: str
+    instance_id: str
+    input: Optional[str]
+    parent_instance_id: Optional[str] = None
+    history: List[dict] = field(default_factory=list)
+    timestamps: List[datetime] = field(default_factory=list)
+    custom_status: Any = None
+
+
+@dataclass
+class OrchestrationResult:
+    instance_id: str
+    name: str
+    status: str
+    output: Any = None
+    error: Optional[BaseException] = None
+    custom_status: Any = None
+    history: List[dict] = field(default_factory=list)
+    episodes: List[EpisodeStats] = field(default_factory=list)
+    generations: int = 1
+    completed_at: Optional[datetime] = None
+
+    @property
+    def replays(self) -> int:
+        return max(len(self.episodes) - self.generations, 0)
+
+    @property
+    def history_events(self) -> int:
+        return len(self.history)
+
+    @property
+    def history_bytes(self) -> int:
+        return len(json.dumps(self.history))
+
+    @property
+    def wall_time(self) -> float:
+        return sum(e.wall_time for e in self.episodes)
+
+
+@dataclass
+class _Pending:
+    at: datetime
+    order: int
+    event: dict
+
+
+def registered_functions(*modules) -> Dict[str, Dict[str, Callable]]:
+    """Collect the user functions registered on blueprints, by trigger type."""
+    functions = {"activities": {}, "orchestrators": {}, "entities": {}}
+    for module in modules:
+        for value in vars(module).values():
+            if not isinstance(value, FunctionBuilder):
+                continue
+            fn = value.build()
+            trigger = fn.get_trigger().type
+            user_function = fn.get_user_function()
+            if trigger == "activityTrigger":
+                functions["activities"][fn.get_function_name()] = user_function
+            elif trigger == "orchestrationTrigger":
+                functions["orchestrators"][fn.get_function_name()] = user_function.orchestrator_function
+            elif trigger == "entityTrigger":
+                functions["entities"][fn.get_function_name()] = user_function.entity_function
+    return functions
+
+
+class ReplayEngine:
+    """Executes orchestrations in-process with durable replay semantics.
+
+    Parameters
+    ----------
+    activities, orchestrators, entities:
+        Functions by name; see `from_modules` to collect them from blueprints.
+    start:
+        Virtual time at which orchestrations start.
+    batch_completions:
+        Deliver every completion available at the same virtual time in one
+        episode (the default) or one completion per episode, the worst case
+        for replay cost.
+    latencies:
+        Virtual duration of activities by name: a `timedelta`, or a function
+        of the activity input returning one. Activities complete instantly
+        by default.
+    """
+
+    def __init__(
+        self,
+        activities: Optional[Dict[str, Callable]] = None,
+        orchestrators: Optional[Dict[str, Callable]] = None,
+        entities: Optional[Dict[str, Callable]] = None,
+        start: Optional[datetime] = None,
+        batch_completions: bool = True,
+        max_episodes: int = 100_000,
+        latencies: Optional[Dict[str, Union[timedelta, Callable[[Any], timedelta]]]] = None,
+    ):
+        self.activities = dict(activities or {})
+        self.orchestrators = dict(orchestrators or {})
+        self.entities = dict(entities or {})
+        # Serialized state by (entity name, key), as persisted by the host
+        self.entity_states: Dict[tuple, Optional[str]] = {}
+        self.entity_operations: Dict[str, int] = {}
+        self.start = start or datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.batch_completions = batch_completions
+        self.max_episodes = max_episodes
+        self.latencies = dict(latencies or {})
+        self.activity_calls: Dict[str, int] = {}
+        self._events: Dict[str, List[_Pending]] = {}
+        self._order = 0
+        self._now: Dict[str, datetime] = {}
+
+    @classmethod
+    def from_modules(cls, *modules, **kwargs) -> "ReplayEngine":
+        functions = registered_functions(*modules)
+        engine = cls(
+            activities=functions["activities"],
+            orchestrators=functions["orchestrators"],
+            entities=functions["entities"],
+            **kwargs,
+        )
+        return engine
+
+    def entity_state(self, entity_id: Any) -> Any:
+        return loads(self.entity_states.get((entity_id.name, entity_id.key)))
+
+    def _next_order(self) -> int:
+        self._order += 1
+        return self._order
+
+    def raise_event(
+        self,
+        instance_id: str,
+        name: str,
+        data: Any = None,
+        at: Union[None, timedelta, datetime] = None,
+    ):
+        """Queue an external event; `at` defaults to the instance's current time."""
+        if at is None:
+            at = self._now.get(instance_id, self.start)
+        elif isinstance(at, timedelta):
+            at = self.start + at
+        event = {"type": "EventRaised", "name": name, "input": dumps(data)}
+        self._events.setdefault(instance_id, []).append(_Pending(at, self._next_order(), event))
+
+    async def run(
+        self,
+        name: str,
+        input_: Any = None,
+        instance_id: Optional[str] = None,
+    ) -> OrchestrationResult:
+        return await self._run(name, dumps(input_), instance_id or str(uuid.uuid4()), None, self.start)
+
+    async def _run(self, name, input_, instance_id, parent_instance_id, started_at) -> OrchestrationResult:
+        orchestrator = self.orchestrators[name]
+        result = OrchestrationResult(instance_id=instance_id, name=name, status="Running", generations=0)
+        now = started_at
+        while True:
+            result.generations += 1
+            instance = Instance(name, instance_id, input_, parent_instance_id)
+            instance.history.append({"type": "ExecutionStarted", "episode": 0, "input": input_})
+            now, continued = await self._run_generation(orchestrator, instance, result, now)
+            result.history = instance.history
+            result.custom_status = instance.custom_status
+            if continued is None:
+                result.completed_at = now
+                return result
+            input_ = continued
+
+    async def _run_generation(self, orchestrator, instance: Instance, result: OrchestrationResult, now: datetime):
+        pending: List[_Pending] = []
+        timers: Dict[int, datetime] = {}
+        episode = 0
+        while True:
+            if len(result.episodes) >= self.max_episodes:
+                raise OrchestrationStuckError(f"{instance.instance_id}: exceeded {self.max_episodes} episodes")
+            self._now[instance.instance_id] = now
+            instance.timestamps.append(now)
+            instance.history.append({"type": "OrchestratorStarted", "episode": episode, "timestamp": now.isoformat()})
+            context = FakeOrchestrationContext(self, instance, episode)
+            started = time.perf_counter()
+            done, value = self._execute(orchestrator, context)
+            wall_time = time.perf_counter() - started
+            instance.custom_status = context.custom_status
+            result.episodes.append(
+                EpisodeStats(
+                    generation=result.generations,
+                    index=episode,
+                    replayed_tasks=context._replayed_tasks,
+                    history_events=len(instance.history),
+                    history_bytes=len(json.dumps(instance.history)),
+                    wall_time=wall_time,
+                )
+            )
+            if done:
+                if isinstance(value, BaseException):
+                    result.status, result.error = "Failed", value
+                    instance.history.append({"type": "ExecutionFailed", "episode": episode, "reason": str(value)})
+                    return now, None
+                if context.is_continued_as_new:
+                    instance.history.append({"type": "ExecutionContinuedAsNew", "episode": episode})
+                    return now, context.continue_as_new_input
+                result.status, result.output = "Completed", value
+                instance.history.append({"type": "ExecutionCompleted", "episode": episode, "result": dumps(value)})
+                return now, None
+
+            pending.extend(await self._dispatch(context, instance, now))
+            for task in context.tasks:
+                if isinstance(task, TimerTask) and task.id not in context._completions:
+                    if task.is_cancelled:
+                        timers.pop(task.id, None)
+                    else:
+                        timers[task.id] = task.fire_at
+            pending.extend(self._events.pop(instance.instance_id, []))
+            candidates = [p.at for p in pending] + list(timers.values())
+            if not candidates:
+                raise OrchestrationStuckError(f"{instance.instance_id}: waiting on {value!r} with no pending work")
+            now = max(now, min(candidates))
+            due = sorted((p for p in pending if p.at <= now), key=lambda p: (p.at, p.order))
+            pending = [p for p in pending if p.at > now]
+            fired = sorted(task_id for task_id, fire_at in timers.items() if fire_at <= now)
+            if not self.batch_completions:
+                if due:
+                    pending.extend(due[1:])
+                    due, fired = due[:1], []
+                else:
+                    fired = fired[:1]
+            episode += 1
+            for p in due:
+                instance.history.append(dict(p.event, episode=episode))
+            for task_id in fired:
+                del timers[task_id]
+                instance.history.append({"type": "TimerFired", "episode": episode, "task_id": task_id})
+
+    def _execute(self, orchestrator, context: FakeOrchestrationContext):
+        try:
+            gen = orchestrator(context)
+        except Exception as e:
+            return True, e
+        if not inspect.isgenerator(gen):
+            return True, gen
+        value, error = None, None
+        while True:
+            try:
+                task = gen.throw(error) if error is not None else gen.send(value)
+            except StopIteration as e:
+                return True, e.value
+            except Exception as e:
+                return True, e
+            if not isinstance(task, Task):
+                return True, TypeError(f"Orchestrators must yield tasks, got {task!r}")
+            completion = task._completion()
+            if completion is None:
+                return False, task
+            context._replayed_tasks += 1
+            context._advance(completion.episode)
+            if completion.ok:
+                value, error = completion.value, None
+            else:
+                value, error = None, completion.value
+
+    async def _dispatch(self, context: FakeOrchestrationContext, instance: Instance, now: datetime) -> List[_Pending]:
+        calls = []
+        for task in context.new_tasks:
+            if isinstance(task, TimerTask):
+                instance.history.append(
+                    {"type": "TimerCreated", "episode": context._episode, "task_id": task.id,
+                     "kind": "timer", "name": None, "fire_at": task.fire_at.isoformat()}
+                )
+                continue
+            instance.history.append(
+                {"type": "TaskScheduled", "episode": context._episode, "task_id": task.id,
+                 "kind": task.kind, "name": task.name, "input": task.input}
+            )
+            if task.kind in ("entity", "signal"):
+                # Entity operations are serialized: run them now, in order
+                pending = self._call_entity(task, now)
+                if task.kind == "entity":
+                    calls.append(asyncio.sleep(0, pending))
+            elif task.kind == "activity":
+                calls.append(self._call_activity(task, now))
+            elif task.kind == "orchestration":
+                calls.append(self._call_orchestrator(task, instance, now))
+        return list(await asyncio.gather(*calls))
+
+    async def _call_activity(self, task: ActivityTask, now: datetime) -> _Pending:
+        self.activity_calls[task.name] = self.activity_calls.get(task.name, 0) + 1
+        fn = self.activities[task.name]
+        latency = self.latencies.get(task.name, timedelta(0))
+        if callable(latency):
+            latency = latency(loads(task.input))
+        attempts = getattr(task, "max_attempts", 1)
+        for attempt in range(1, attempts + 1):
+            try:
+                out = fn(loads(task.input))
+                if inspect.isawaitable(out):
+                    out = await out
+                event = {"type": "TaskCompleted", "task_id": task.id, "result": dumps(out)}
+                break
+            except Exception as e:
+                event = {"type": "TaskFailed", "task_id": task.id, "reason": f"{type(e).__name__}: {e}"}
+        return _Pending(now + latency, self._next_order(), event)
+
+    def _call_entity(self, task: EntityTask, now: datetime) -> _Pending:
+        name, entity_key = task.entity_id.name, task.entity_id.key
+        self.entity_operations[task.name] = self.entity_operations.get(task.name, 0) + 1
+        context = FakeEntityContext(name, entity_key, task.operation, task.input, self.entity_states.get((name, entity_key)))
+        try:
+            self.entities[name](context)
+        except Exception as e:
+            return _Pending(now, self._next_order(), {"type": "TaskFailed", "task_id": task.id, "reason": f"{type(e).__name__}: {e}"})
+        if context.destructed:
+            self.entity_states.pop((name, entity_key), None)
+        else:
+            self.entity_states[(name, entity_key)] = dumps(context._state)
+        return _Pending(now, self._next_order(), {"type": "TaskCompleted", "task_id": task.id, "result": dumps(context.result)})
+
+    async def _call_orchestrator(self, task: ActivityTask, parent: Instance, now: datetime) -> _Pending:
+        instance_id = task.instance_id or f"{parent.instance_id}:{task.id}"
+        child = await self._run(task.name, task.input, instance_id, parent.instance_id, now)
+        if child.status == "Completed":
+            event = {"type": "TaskCompleted", "task_id": task.id, "result": dumps(child.output)}
+        else:
+            event = {"type": "TaskFailed", "task_id": task.id, "reason": f"{type(child.error).__name__}: {child.error}"}
+        return _Pending(child.completed_at, self._next_order(), event)
@@ -1,11 +1,16 @@
+import asyncio
 import re
 from polyfactory.factories.pydantic_factory import ModelFactory
 import pytest
 
 from models import *
 from activities import (
+    geocoding_cache,
+    geocoding_flight,
     get_city_weather,
     get_geocoding,
+    weather_cache,
+    weather_expiry,
 )
 
 class GeocodingOutFactory(ModelFactory[GeocodingOut]):
@@ -16,6 +21,9 @@ class WeatherOutFactory(ModelFactory[WeatherOut]):
     __model__ = WeatherOut
 
 
+pytestmark = pytest.mark.usefixtures("clear_caches")
+
+
 @pytest.mark.asyncio
 async def test_get_geocoding(aioresponse):
     rsp: GeocodingOut = GeocodingOutFactory.build()
@@ -25,6 +33,31 @@ async def test_get_geocoding(aioresponse):
     assert type(out) == GeocodingOut
 
 
+@pytest.mark.asyncio
+async def test_get_geocoding_cached(aioresponse):
+    rsp: GeocodingOut = GeocodingOutFactory.build()
+    aioresponse.get(re.compile(".*"), status=200, payload=[rsp.model_dump()])
+    fn = get_geocoding.build().get_user_function()
+    before = geocoding_cache.stats()
+    first = await fn("New York")
+    second = await fn("  new   york")
+    after = geocoding_cache.stats()
+    assert first == second == rsp
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_geocoding_coalesced(aioresponse):
+    rsp: GeocodingOut = GeocodingOutFactory.build()
+    aioresponse.get(re.compile(".*"), status=200, payload=[rsp.model_dump()])
+    fn = get_geocoding.build().get_user_function()
+    before = geocoding_flight.stats()
+    outs = await asyncio.gather(*(fn("Chicago") for _ in range(4)))
+    assert outs == [rsp] * 4
+    assert geocoding_flight.stats()["coalesced"] - before["coalesced"] == 3
+
+
 @pytest.mark.asyncio
 async def test_get_weather(aioresponse):
     rsp: WeatherOut = WeatherOutFactory.build()
@@ -33,3 +66,26 @@ async def test_get_weather(aioresponse):
     in_ = WeatherIn(lat="90.0", lon="90")
     out = await fn(in_.model_dump())
     assert type(out) == WeatherOut
+
+
+def test_weather_expiry():
+    rsp: WeatherOut = WeatherOutFactory.build(
+        utc_offset_seconds=3600,
+        current=WeatherCurrent(time="2023-10-22T13:15", interval=900, temperature=12.0),
+    )
+    started = 1697980500.0  # 2023-10-22T12:15Z
+    assert weather_expiry(rsp, now=started + 10) == started + 900
+    assert weather_expiry(rsp, now=started + 2000) == started + 2700
+
+
+@pytest.mark.asyncio
+async def test_get_weather_cached(aioresponse):
+    rsp: WeatherOut = WeatherOutFactory.build(
+        current=WeatherCurrent(time="not-a-date", interval=900, temperature=12.0),
+    )
+    aioresponse.get(re.compile(".*"), status=200, payload=rsp.model_dump())
+    fn = get_city_weather.build().get_user_function()
+    first = await fn(WeatherIn(lat="45.46421", lon="9.18951").model_dump())
+    second = await fn(WeatherIn(lat="45.4641", lon="9.1895").model_dump())
+    assert first == second == rsp
+    assert len(weather_cache) == 1
@@ -1,50 +1,244 @@
-from azure import functions
+from datetime import datetime, timedelta
+
 import pytest
 
-# from az_fun import activities
-# from az_fun.app import df, logic, adf_app
-
-from unittest.mock import AsyncMock, MagicMock, patch
-
-# def mock_call_activity(fn: str, *args, **kwargs):
-#   return getattr(activities, fn.removesuffix("_builder"))(*args, **kwargs)
-
-
-@pytest.mark.skip
-def test_logic():
-  with patch(
-    'azure.durable_functions.DurableOrchestrationContext',
-    spec=df.DurableOrchestrationContext,
-  ) as mock:
-    mock.call_activity = mock_call_activity
-    result = list(logic(mock))
-    assert result == [
-      "Hello Seattle",
-      "Hello Tokyo",
-      "Hello London",
-    ]
-
-
-@pytest.mark.skip
-async def test_durablefunctionsorchestrator_trigger(self):
-    function_name = 'DurableFunctionsOrchestrator'
-    instance_id = 'f86a9f49-ae1c-4c66-a60e-991c4c764fe5'
-    starter = MagicMock()
-
-    mock_request = functions.HttpRequest(
-        method='GET',
-        body=None,
-        url=f'http://localhost:7071/api/orchestrators{function_name}',
-        route_params={'functionName': function_name},
-        params={'name': 'Test'}
+import activities
+import entities
+import orchestrators
+from models import *
+from tests.replay import NonDeterminismError, OrchestrationStuckError, ReplayEngine
+from tests.test_activities import GeocodingOutFactory, WeatherOutFactory
+
+
+CALLBACK_URI_TEMPLATE = "http://localhost:7071/runtime/webhooks/durabletask/instances/trip-1/raiseEvent/{eventName}"
+
+
+@pytest.fixture
+def engine():
+    engine = ReplayEngine.from_modules(activities, orchestrators, entities)
+    geocoding = GeocodingOutFactory.build(lat="41.88", lon="-87.63")
+    weather = WeatherOutFactory.build()
+    engine.activities["get_geocoding"] = lambda name: geocoding
+    engine.activities["get_city_weather"] = lambda latlon: weather
+    return engine
+
+
+def trip_input(destination="Chicago"):
+    return OrchestratorIn(
+        callback_uri_template=CALLBACK_URI_TEMPLATE,
+        client_input={"destination": destination},
+    ).model_dump()
+
+
+@pytest.mark.asyncio
+async def test_trip_approved(engine):
+    engine.raise_event("trip-1", "Approval", {"feedback": "ok"}, at=timedelta(seconds=1))
+    result = await engine.run("trip", trip_input(), instance_id="trip-1")
+    assert result.status == "Completed", result.error
+    out = OrchesratorOut.model_validate(result.output)
+    assert out.feedback.status == "completed"
+    assert out.workflow.destination == "Chicago"
+    assert out.workflow.lat == "41.88"
+    assert engine.activity_calls == {"get_geocoding": 1, "get_city_weather": 1, "ask_for_feedback": 1}
+    assert engine.entity_operations == {"geo_cache.get": 1, "geo_cache.set": 1}
+    assert result.replays == 5
+
+
+@pytest.mark.asyncio
+async def test_trip_geocache_hit(engine):
+    await engine.run("trip", trip_input("Chicago"), instance_id="trip-1")
+    result = await engine.run("trip", trip_input("  chicago"), instance_id="trip-2")
+    assert result.status == "Completed", result.error
+    assert OrchesratorOut.model_validate(result.output).workflow.lat == "41.88"
+    assert engine.activity_calls["get_geocoding"] == 1
+    assert engine.entity_operations == {"geo_cache.get": 2, "geo_cache.set": 1}
+
+
+@pytest.mark.asyncio
+async def test_trip_rejected(engine):
+    engine.raise_event("trip-1", "Approval", {"feedback": "no"}, at=timedelta(seconds=1))
+    result = await engine.run("trip", trip_input(), instance_id="trip-1")
+    assert OrchesratorOut.model_validate(result.output).feedback.status == "rejected"
+
+
+@pytest.mark.asyncio
+async def test_trip_timeout(engine):
+    result = await engine.run("trip", trip_input(), instance_id="trip-1")
+    assert result.status == "Completed", result.error
+    assert OrchesratorOut.model_validate(result.output).feedback.status == "timeout"
+    assert result.completed_at - engine.start == timedelta(seconds=5)
+
+
+@pytest.mark.asyncio
+async def test_trip_activity_failure(engine):
+    def fail(name):
+        raise RuntimeError(f"Could not fetch geocoding for {name}")
+
+    engine.activities["get_geocoding"] = fail
+    result = await engine.run("trip", trip_input(), instance_id="trip-1")
+    assert result.status == "Failed"
+    assert "Could not fetch geocoding for Chicago" in str(result.error)
+
+
+def itinerary_input(*destinations):
+    return OrchestratorIn(
+        callback_uri_template=CALLBACK_URI_TEMPLATE,
+        client_input={"destinations": list(destinations)},
+    ).model_dump()
+
+
+@pytest.mark.asyncio
+async def test_itinerary_pipelines_destinations(engine):
+    # Chicago: slow geocoding, fast weather; Milan: fast geocoding, slow weather
+    geocoding_latency = {"Chicago": 3, "Milan": 1}
+    engine.latencies["get_geocoding"] = lambda name: timedelta(seconds=geocoding_latency[name])
+    engine.latencies["get_city_weather"] = lambda latlon: timedelta(seconds=2 if latlon["lat"] == "45.46" else 1)
+    geocodings = {"Chicago": GeocodingOutFactory.build(lat="41.88"), "Milan": GeocodingOutFactory.build(lat="45.46")}
+    engine.activities["get_geocoding"] = lambda name: geocodings[name]
+    engine.raise_event("itinerary-1", "Approval", {"feedback": "ok"}, at=timedelta(seconds=5))
+    result = await engine.run("itinerary", itinerary_input("Chicago", "Milan"), instance_id="itinerary-1")
+    assert result.status == "Completed", result.error
+    out = ItineraryOut.model_validate(result.output)
+    assert [w.destination for w in out.workflows] == ["Chicago", "Milan"]
+    assert [w.lat for w in out.workflows] == ["41.88", "45.46"]
+    assert out.feedback.status == "completed"
+    # Slowest chain (3s + 1s), not the geocoding then weather phases (3s + 2s)
+    asked = next(e["episode"] for e in result.history if e.get("name") == "ask_for_feedback")
+    asked_at = next(
+        e["timestamp"] for e in result.history if e["type"] == "OrchestratorStarted" and e["episode"] == asked
+    )
+    assert datetime.fromisoformat(asked_at) - engine.start == timedelta(seconds=4)
+    assert engine.activity_calls == {"get_geocoding": 2, "get_city_weather": 2, "ask_for_feedback": 1}
+
+
+@pytest.mark.asyncio
+async def test_itinerary_uses_geocache(engine):
+    await engine.run("itinerary", itinerary_input("Chicago"), instance_id="itinerary-1")
+    result = await engine.run("itinerary", itinerary_input("chicago ", "Milan"), instance_id="itinerary-2")
+    assert result.status == "Completed", result.error
+    assert ItineraryOut.model_validate(result.output).feedback.status == "timeout"
+    assert engine.activity_calls["get_geocoding"] == 2
+    assert engine.entity_operations == {"geo_cache.get": 3, "geo_cache.set": 2}
+
+
+@pytest.mark.asyncio
+async def test_itinerary_fails_with_a_chain(engine):
+    def fail(latlon):
+        raise RuntimeError("weather unavailable")
+
+    engine.activities["get_city_weather"] = fail
+    result = await engine.run("itinerary", itinerary_input("Chicago", "Milan"), instance_id="itinerary-1")
+    assert result.status == "Failed"
+    assert "weather unavailable" in str(result.error)
+
+
+def monitor_input(**client_input):
+    return OrchestratorIn(callback_uri_template=CALLBACK_URI_TEMPLATE, client_input=client_input).model_dump()
+
+
+@pytest.fixture
+def monitor_engine(engine):
+    temperatures = iter([10, 10.2, 11, 11, 11, 12.5] * 100)
+    engine.activities["get_city_weather"] = lambda latlon: WeatherOutFactory.build(
+        current=dict(time="2024-01-01T00:00", interval=900, temperature=next(temperatures))
     )
+    return engine
+
+
+@pytest.mark.asyncio
+async def test_weather_monitor_continues_as_new(monitor_engine):
+    until = (monitor_engine.start + timedelta(minutes=15 * 11)).isoformat()
+    input_ = monitor_input(destinations=["Chicago"], polls_per_generation=4, until=until)
+    result = await monitor_engine.run("weather_monitor", input_, instance_id="monitor-1")
+    assert result.status == "Completed", result.error
+    assert result.generations == 3
+    assert result.output == dict(generation=2, polls=12, changes=6, temperatures={"Chicago": 12.5})
+    assert result.custom_status == result.output
+    assert result.completed_at - monitor_engine.start == timedelta(minutes=15 * 11)
+    # Geocoded once, carried over by continue_as_new
+    assert monitor_engine.activity_calls["get_geocoding"] == 1
+    assert monitor_engine.activity_calls["notify_weather_changes"] == 6
+    assert len(result.history) < 40
+
+
+@pytest.mark.asyncio
+async def test_weather_monitor_stops_on_event(monitor_engine):
+    monitor_engine.raise_event("monitor-1", orchestrators.MONITOR_STOP_EVENT, at=timedelta(minutes=20))
+    result = await monitor_engine.run("weather_monitor", monitor_input(destinations=["Chicago", "Milan"]), instance_id="monitor-1")
+    assert result.status == "Completed", result.error
+    assert result.output["polls"] == 2
+    assert result.completed_at - monitor_engine.start == timedelta(minutes=20)
+
+
+def hello(context):
+    names = context.get_input()
+    results = yield context.task_all([context.call_activity("greet", n) for n in names])
+    return results
+
+
+def hello_weather(context):
+    greetings = yield context.call_sub_orchestrator("hello", context.get_input())
+    first = yield context.task_any([context.call_activity("greet", "first"), context.create_timer(
+        context.current_utc_datetime + timedelta(seconds=1)
+    )])
+    return greetings + [first.result]
+
 
-    mock_response = functions.HttpResponse(
-        body = None,
-        status_code= 200,
-        headers={
-            "Retry-After": 10
-        }
+@pytest.mark.asyncio
+async def test_task_all_and_sub_orchestrator():
+    engine = ReplayEngine(
+        activities={"greet": lambda name: f"Hello {name}"},
+        orchestrators={"hello": hello, "hello_weather": hello_weather},
     )
+    result = await engine.run("hello_weather", ["Seattle", "Tokyo", "London"])
+    assert result.output == ["Hello Seattle", "Hello Tokyo", "Hello London", "Hello first"]
+    assert engine.activity_calls == {"greet": 4}
+
+
+@pytest.mark.asyncio
+async def test_unbatched_completions_replay_per_task():
+    engine = ReplayEngine(
+        activities={"greet": lambda name: f"Hello {name}"},
+        orchestrators={"hello": hello},
+        batch_completions=False,
+    )
+    result = await engine.run("hello", ["a", "b", "c"])
+    assert result.output == ["Hello a", "Hello b", "Hello c"]
+    assert result.replays == 3
+
+
+@pytest.mark.asyncio
+async def test_replaying_flag():
+    seen = []
+
+    def orchestrator(context):
+        seen.append(context.is_replaying)
+        yield context.call_activity("greet", "a")
+        seen.append(context.is_replaying)
+
+    engine = ReplayEngine(activities={"greet": lambda name: name}, orchestrators={"o": orchestrator})
+    await engine.run("o")
+    assert seen == [False, True, False]
+
+
+@pytest.mark.asyncio
+async def test_non_determinism_detected():
+    calls = []
+
+    def orchestrator(context):
+        calls.append(None)
+        yield context.call_activity("greet" if len(calls) == 1 else "other", "a")
+
+    engine = ReplayEngine(activities={"greet": lambda name: name}, orchestrators={"o": orchestrator})
+    result = await engine.run("o")
+    assert isinstance(result.error, NonDeterminismError)
+
+
+@pytest.mark.asyncio
+async def test_stuck_orchestration():
+    def orchestrator(context):
+        yield context.wait_for_external_event("never")
 
-    
\ No newline at end of file
+    engine = ReplayEngine(orchestrators={"o": orchestrator})
+    with pytest.raises(OrchestrationStuckError):
+        await engine.run("o")
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from cache import SqliteStore, TTLCache, normalize_key
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalize_key():
+    assert normalize_key("  New   York ") == normalize_key("new york")
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=120)
+    clock.now += 61
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats()["expirations"] == 1
+
+
+def test_persistent_tier(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = TTLCache(maxsize=10, ttl=60, store=SqliteStore(path))
+    cache.set("milan", {"lat": "45.46", "lon": "9.19"})
+    cache.store.close()
+
+    restarted = TTLCache(maxsize=10, ttl=60, store=SqliteStore(path))
+    assert restarted.get("milan") == {"lat": "45.46", "lon": "9.19"}
+    assert restarted.stats()["store_hits"] == 1
+    assert "milan" in restarted
+
+
+def test_store_purges_and_caps_rows(tmp_path):
+    path = str(tmp_path / "cache.db")
+    store = SqliteStore(path)
+    now = time.time()
+    store.set("expired", 1, now - 1)
+    for i in range(5):
+        store.set(f"k{i}", i, now + 60 + i)
+    store.close()
+
+    store = SqliteStore(path, maxrows=3, purge_every=2)
+    assert len(store) == 3  # purged on open: the expired row and the two soonest to expire
+    assert store.get("expired") is None and store.get("k1") is None
+    assert store.get("k2") == (2, now + 62)
+    store.set("k5", 5, now + 65)
+    assert len(store) == 4
+    store.set("k6", 6, now + 66)  # second write: purged again
+    assert len(store) == 3
+    assert store.get("k2") is None and store.get("k6") == (6, now + 66)
+    store.close()
+
+
+def test_invalid_maxsize():
+    with pytest.raises(ValueError):
+        TTLCache(maxsize=0)
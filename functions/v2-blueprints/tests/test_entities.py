@@ -0,0 +1,78 @@
+import pytest
+
+import entities
+from entities import geo_cache, geocache_id
+from tests.replay import FakeEntityContext, dumps
+
+
+class GeoCache:
+    """Runs operations against one GeoCache shard, persisting state like the host."""
+
+    def __init__(self):
+        self.fn = geo_cache.build().get_user_function().entity_function
+        self.state = None
+        self.writes = 0
+
+    def __call__(self, operation, **input_):
+        context = FakeEntityContext(entities.GEOCACHE_ENTITY, "shard-0", operation, dumps(input_), self.state)
+        self.fn(context)
+        if context.state_written:
+            self.state = dumps(context.get_state())
+            self.writes += 1
+        return context.result
+
+
+def test_get_set_and_ttl():
+    cache = GeoCache()
+    assert cache("get", key="milan", now=0) is None
+    cache("set", key="milan", value={"lat": "45.46"}, now=0, ttl=10)
+    assert cache("get", key="milan", now=5) == {"lat": "45.46"}
+    assert cache("get", key="milan", now=10) is None
+    cache("set", key="rome", value={"lat": "41.89"}, now=10)
+    assert cache("stats") == dict(evictions=0, expirations=1, size=1)
+
+
+def test_get_does_not_write_state(monkeypatch):
+    monkeypatch.setattr(entities, "GEOCACHE_TOUCH", 60)
+    cache = GeoCache()
+    cache("set", key="a", value=1, now=0)
+    writes = cache.writes
+    for now in range(0, 60, 10):
+        assert cache("get", key="a", now=now) == 1
+        assert cache("get", key="b", now=now) is None
+    assert cache.writes == writes
+    cache("get", key="a", now=60)  # coarse recency refresh
+    assert cache.writes == writes + 1
+
+
+def test_bounded_lru(monkeypatch):
+    monkeypatch.setattr(entities, "GEOCACHE_SIZE", 2)
+    monkeypatch.setattr(entities, "GEOCACHE_TOUCH", 60)
+    cache = GeoCache()
+    cache("set", key="a", value=1, now=0)
+    cache("set", key="b", value=2, now=10)
+    cache("get", key="a", now=30)  # too recent to refresh: a is still least recently used
+    cache("set", key="c", value=3, now=40)
+    assert cache("get", key="a", now=40) is None
+    cache("get", key="b", now=100)  # refreshed: c is now least recently used
+    cache("set", key="d", value=4, now=100)
+    assert cache("get", key="c", now=100) is None
+    assert cache("get", key="b", now=100) == 2
+    assert cache("stats")["evictions"] == 2
+
+
+def test_delete_clear_and_unknown_operation():
+    cache = GeoCache()
+    cache("set", key="a", value=1, now=0)
+    cache("delete", key="a")
+    assert cache("get", key="a", now=0) is None
+    cache("clear")
+    assert cache("stats") == dict(evictions=0, expirations=0, size=0)
+    with pytest.raises(ValueError):
+        cache("explode")
+
+
+def test_geocache_id_is_stable():
+    assert geocache_id("chicago").key == geocache_id("chicago").key
+    assert geocache_id("chicago").key.startswith("shard-")
+    assert geocache_id("chicago").name == entities.GEOCACHE_ENTITY
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import time
+
+import azure.durable_functions as df
+import pytest
+
+import executors
+from executors import ManagedExecutor, offload
+import metrics
+
+
+def blocking(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def pid() -> int:
+    return os.getpid()
+
+
+def fail():
+    raise ValueError("nope")
+
+
+async def test_blocking_work_does_not_stall_the_loop():
+    pool = ManagedExecutor("test", "threads", 4)
+    call = offload(pool)(blocking)
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker = asyncio.ensure_future(tick())
+    started = time.perf_counter()
+    assert await asyncio.gather(*(call(0.1) for _ in range(4))) == [0.1] * 4
+    elapsed = time.perf_counter() - started
+    ticker.cancel()
+    pool.shutdown()
+    assert elapsed < 0.3
+    assert ticks >= 5
+
+
+async def test_queue_depth_and_stats():
+    pool = ManagedExecutor("test", "threads", 1)
+    call = offload(pool)(blocking)
+    calls = [asyncio.ensure_future(call(0.05)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    stats = pool.stats()
+    assert (stats["running"], stats["queued"]) == (1, 2)
+    await asyncio.gather(*calls)
+    pool.shutdown()
+    stats = pool.stats()
+    assert (stats["running"], stats["queued"], stats["completed"]) == (0, 0, 3)
+    assert stats["queue_time_max"] >= 0.09
+    assert 0 < stats["utilization"] <= 1
+
+
+async def test_errors_propagate():
+    pool = ManagedExecutor("test", "threads", 1)
+    with pytest.raises(ValueError):
+        await offload(pool)(fail)()
+    pool.shutdown()
+    assert pool.stats()["errors"] == 1
+
+
+async def test_process_pool():
+    pool = ManagedExecutor("test", "processes", 1)
+    try:
+        assert await offload(pool)(pid)() != os.getpid()
+    finally:
+        pool.shutdown()
+
+
+def test_rejects_coroutine_functions():
+    async def already_async():
+        pass
+
+    with pytest.raises(TypeError):
+        offload()(already_async)
+
+
+async def test_offloaded_activity_registration():
+    bp = df.Blueprint()
+
+    @bp.activity_trigger(input_name="seconds")
+    @metrics.instrument("activity")
+    @offload("threads")
+    def sleepy(seconds: float) -> float:
+        return blocking(seconds)
+
+    assert await sleepy.build().get_user_function()(0.01) == 0.01
+    assert executors.executor("threads").stats()["completed"] >= 1
+    assert 'executor_busy_time{executor="threads"}' in metrics.render()
@@ -0,0 +1,107 @@
+import aiohttp
+from aiohttp import web
+import pytest
+
+import activities
+from benchmarks.fake_upstream import STATS, Behaviour, create_app, forecast, parse_latency, place
+from benchmarks.loadgen import LoadGenerator
+from models import *
+
+pytestmark = pytest.mark.usefixtures("clear_caches")
+
+
+async def serve(app: web.Application):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture
+async def upstream(monkeypatch):
+    behaviour = Behaviour()
+    app = create_app(behaviour, seed=0)
+    runner, url = await serve(app)
+    monkeypatch.setattr(activities, "GEOCODING_BASE_URL", url)
+    monkeypatch.setattr(activities, "WEATHER_BASE_URL", url)
+    yield behaviour, app
+    await runner.cleanup()
+
+
+def test_payloads_are_schema_valid():
+    geocoding = GeocodingOut.model_validate(place("Chicago"))
+    assert (geocoding.lat, geocoding.lon) == (place("  chicago")["lat"], place("  chicago")["lon"])
+    WeatherOut.model_validate(forecast(float(geocoding.lat), float(geocoding.lon)))
+
+
+def test_parse_latency():
+    assert parse_latency("fixed:20")(None) == 0.02
+    with pytest.raises(ValueError):
+        parse_latency("normal:1")
+
+
+async def test_activities_against_fake_upstream(upstream):
+    _, app = upstream
+    geocoding = await activities.get_geocoding.build().get_user_function()("Chicago")
+    assert geocoding.display_name == "Chicago, Fakeland"
+    weather = await activities.get_city_weather.build().get_user_function()(
+        WeatherIn(lat=geocoding.lat, lon=geocoding.lon).model_dump()
+    )
+    assert weather.current.interval == 900
+    assert app[STATS]["requests"] == 2
+
+
+async def test_injected_throttling_and_errors(upstream, monkeypatch):
+    behaviour, app = upstream
+    monkeypatch.setattr(activities, "RATE_LIMIT_RETRIES", 0)
+    behaviour.throttle_rate = 1
+    with pytest.raises(aiohttp.ClientResponseError) as e:
+        await activities.get_geocoding.build().get_user_function()("Milan")
+    assert e.value.status == 429
+    behaviour.throttle_rate, behaviour.error_rate = 0, 1
+    with pytest.raises(aiohttp.ClientResponseError) as e:
+        await activities.get_geocoding.build().get_user_function()("Milan")
+    assert e.value.status == 503
+    assert app[STATS] == dict(requests=2, errors=1, throttled=1)
+
+
+async def test_loadgen_closed_loop():
+    instances = {}
+
+    async def start(request: web.Request):
+        instance_id = str(len(instances))
+        instances[instance_id] = await request.json()
+        base = f"{request.scheme}://{request.host}"
+        return web.json_response(
+            dict(
+                id=instance_id,
+                statusQueryGetUri=f"{base}/status/{instance_id}",
+                sendEventPostUri=f"{base}/events/{instance_id}/{{eventName}}",
+            ),
+            status=202,
+        )
+
+    async def raise_event(request: web.Request):
+        assert request.match_info["name"] == "Approval"
+        return web.Response(status=202)
+
+    async def status(request: web.Request):
+        return web.json_response(dict(runtimeStatus="Completed"))
+
+    app = web.Application()
+    app.router.add_post("/api/workflow/trip", start)
+    app.router.add_post("/events/{id}/{name}", raise_event)
+    app.router.add_get("/status/{id}", status)
+    runner, url = await serve(app)
+    try:
+        gen = LoadGenerator(url, "trip", [{"destination": "Chicago"}], approve=True, wait=True, poll_interval=0)
+        async with aiohttp.ClientSession() as session:
+            await gen.closed_loop(session, concurrency=3, duration=10, requests=7)
+    finally:
+        await runner.cleanup()
+    assert len(instances) == 7
+    assert len(gen.results.started) == len(gen.results.completed) == 7
+    assert gen.results.statuses == {"Completed": 7}
+    assert gen.results.errors == {}
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+import fanout
+import orchestrators
+from tests.replay import ReplayEngine
+
+
+def greet_all(context):
+    input_ = context.get_input()
+    results = yield from fanout.bounded(context, "greet", **input_)
+    return results
+
+
+@pytest.fixture
+def engine():
+    in_flight = dict(now=0, max=0)
+
+    async def greet(name):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0)
+        in_flight["now"] -= 1
+        if name == "fail":
+            raise ValueError("cannot greet")
+        return f"Hello {name}"
+
+    engine = ReplayEngine.from_modules(orchestrators)
+    engine.activities["greet"] = greet
+    engine.orchestrators["greet_all"] = greet_all
+    engine.in_flight = in_flight
+    return engine
+
+
+def test_split():
+    chunks = fanout.split(list(range(25)), 10)
+    assert [len(c) for c in chunks] == [9, 9, 7]
+    assert [x for c in chunks for x in c] == list(range(25))
+    assert len(fanout.split(list(range(10_000)), 10)) == 10
+
+
+@pytest.mark.asyncio
+async def test_windowed(engine):
+    names = [str(n) for n in range(20)]
+    result = await engine.run("greet_all", dict(inputs=names, max_in_flight=3, chunk_size=100))
+    assert result.output == [f"Hello {n}" for n in names]
+    assert engine.in_flight["max"] == 3
+
+
+@pytest.mark.asyncio
+async def test_chunked_tree(engine):
+    names = [str(n) for n in range(250)]
+    result = await engine.run("greet_all", dict(inputs=names, max_in_flight=4, chunk_size=10))
+    assert result.status == "Completed", result.error
+    assert result.output == [f"Hello {n}" for n in names]
+    assert engine.activity_calls == {"greet": 250}
+    # The top-level history only holds the sub-orchestrations
+    scheduled = [e for e in result.history if e["type"] == "TaskScheduled"]
+    assert len(scheduled) == 10
+    assert {e["name"] for e in scheduled} == {"fan_out"}
+
+
+@pytest.mark.asyncio
+async def test_failure_propagates(engine):
+    result = await engine.run("greet_all", dict(inputs=["a", "fail", "b"], max_in_flight=2, chunk_size=10))
+    assert result.status == "Failed"
+    assert "cannot greet" in str(result.error)
@@ -0,0 +1,97 @@
+import importlib.util
+import os
+from pathlib import Path
+import sys
+import zipfile
+
+import pytest
+
+SCRIPT = Path(__file__).resolve().parents[2] / "scripts" / "fn2zip.py"
+spec = importlib.util.spec_from_file_location("fn2zip", SCRIPT)
+fn2zip = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fn2zip)
+
+
+@pytest.mark.parametrize("rel, excluded", [
+    ("tests/test_activities.py", True),
+    ("tests", True),
+    ("benchmarks/startup.py", True),
+    ("pkg/__pycache__/x.cpython-311.pyc", True),
+    ("requirements-dev.txt", True),
+    ("run-function.sh", True),
+    ("docs/index.md", True),
+    ("function_app.py", False),
+    ("activities.py", False),
+    ("host.json", False),
+    ("contests.py", False),
+])
+def test_excluded(rel, excluded):
+    assert fn2zip.excluded(rel, fn2zip.EXCLUSIONS + ["docs/*"]) is excluded
+
+
+def write(root: Path, rel: str, data: str = "x"):
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(data)
+
+
+def test_strip_layer_keeps_licenses(tmp_path):
+    kept = [
+        "pkg/__init__.py",
+        "pkg/LICENSE.md",
+        "pkg/docs/NOTICE",
+        "pkg-1.0.dist-info/METADATA",
+        "pkg-1.0.dist-info/entry_points.txt",
+        "pkg-1.0.dist-info/LICENSE",
+        "pkg-1.0.dist-info/COPYING.txt",
+        "pkg-1.0.dist-info/licenses/LICENSE.txt",
+        "pkg-1.0.dist-info/licenses/vendored/NOTICE.rst",
+    ]
+    removed = [
+        "bin/tool",
+        "pkg/tests/test_pkg.py",
+        "pkg/docs/index.md",
+        "pkg/README.md",
+        "pkg/types.pyi",
+        "pkg/py.typed",
+        "pkg/ext.c",
+        "pkg-1.0.dist-info/RECORD",
+        "pkg-1.0.dist-info/WHEEL",
+    ]
+    for rel in kept + removed:
+        write(tmp_path, rel)
+    assert fn2zip.strip_layer(tmp_path) == len(removed)
+    assert sorted(p.relative_to(tmp_path).as_posix() for p in tmp_path.rglob("*") if p.is_file()) == sorted(kept)
+    assert not (tmp_path / "bin").exists() and not (tmp_path / "pkg" / "tests").exists()
+
+
+def build(project: Path, output: Path, cache: Path, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["fn2zip.py", "-o", str(output), "--cache-dir", str(cache), str(project)])
+    fn2zip.main()
+    return output.read_bytes()
+
+
+def test_builds_are_reproducible(tmp_path, monkeypatch):
+    project = tmp_path / "app"
+    write(project, "requirements.txt", "azure-functions\n")
+    write(project, "function_app.py", "import activities\n")
+    write(project, "activities.py", "VALUE = 1\n")
+    write(project, "host.json", "{}")
+    write(project, "tests/test_app.py", "")
+    # A pre-built dependency layer, so that no packages are installed
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    python = fn2zip.interpreter_tag(sys.executable)
+    key = fn2zip.layer_key(b"azure-functions\n", python, None, ["/home/site/wwwroot"])
+    with zipfile.ZipFile(cache / f"layer-{python['impl']}-{key}.zip", "w") as zf:
+        fn2zip.add_files(zf, project, [project / "host.json"], fn2zip.SITE_PACKAGES + "/")
+
+    first = build(project, tmp_path / "first.zip", cache, monkeypatch)
+    os.utime(project / "activities.py", (1, 1))
+    second = build(project, tmp_path / "second.zip", cache, monkeypatch)
+    assert first == second
+    names = zipfile.ZipFile(tmp_path / "first.zip").namelist()
+    assert f"{fn2zip.SITE_PACKAGES}/host.json" in names
+    assert "function_app.py" in names and "activities.py" in names
+    assert any(n.startswith("__pycache__/activities.") for n in names)
+    assert not any(n.startswith("tests/") or n == "requirements.txt" for n in names)
@@ -0,0 +1,82 @@
+import re
+
+import pytest
+
+import activities
+import executors
+from gazetteer import Gazetteer, build, read_geonames
+from http_pool import http_pool
+from models import *
+import ratelimit
+from tests.test_activities import GeocodingOutFactory
+
+
+ROWS = [
+    ["4887398", "Chicago", "Chicago", "Chicaga,Шикаго", "41.85003", "-87.65005", "P", "PPLA2", "US", "", "IL", "031", "", "", "2720546"],
+    ["2988507", "Paris", "Paris", "Lutetia", "48.85341", "2.3488", "P", "PPLC", "FR", "", "11", "75", "", "", "2138551"],
+    ["4717560", "Paris", "Paris", "", "33.66094", "-95.55551", "P", "PPLA2", "US", "", "TX", "277", "", "", "24782"],
+    ["3448439", "São Paulo", "Sao Paulo", "Sampa", "-23.5475", "-46.63611", "P", "PPLA", "BR", "", "27", "3550308", "", "", "10021295"],
+    ["3451190", "Rio de Janeiro", "Rio de Janeiro", "", "-22.90642", "-43.18223", "P", "PPLA", "BR", "", "21", "", "", "", "6023699"],
+]
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    source = tmp_path / "cities.txt"
+    source.write_text("".join("\t".join(row + ["", "", "UTC", "2024-01-01"]) + "\n" for row in ROWS), encoding="utf-8")
+    path = str(tmp_path / "gazetteer.idx")
+    assert build(read_geonames(str(source), alternate_names=True), path)["places"] == len(ROWS)
+    return path
+
+
+def test_lookup(index_path):
+    gazetteer = Gazetteer(index_path)
+    paris = GeocodingOut.model_validate(gazetteer.lookup("  PARIS "))
+    assert (paris.lat, paris.lon, paris.display_name) == ("48.85341", "2.3488", "Paris, 11, FR")
+    assert gazetteer.lookup("Paris, TX")["lat"] == "33.66094"
+    assert gazetteer.lookup("Paris, TX, US")["lat"] == "33.66094"
+    assert gazetteer.lookup("Paris, DE") is None
+    assert gazetteer.lookup("sao paulo")["place_id"] == 3448439
+    assert gazetteer.lookup("São-Paulo")["place_id"] == 3448439
+    assert gazetteer.lookup("шикаго")["place_id"] == 4887398
+    assert gazetteer.lookup("Atlantis") is None
+    assert gazetteer.stats()["misses"] == 2
+    gazetteer.close()
+
+
+def test_prefix(index_path):
+    gazetteer = Gazetteer(index_path)
+    assert [p["place_id"] for p in gazetteer.prefix("pa")] == [2988507, 4717560]
+    assert [p["place_id"] for p in gazetteer.prefix("r")] == [3451190]
+    assert [p["place_id"] for p in gazetteer.prefix("pa", limit=1)] == [2988507]
+    assert gazetteer.prefix(" ") == []
+    gazetteer.close()
+
+
+@pytest.fixture
+async def with_gazetteer(index_path, monkeypatch):
+    monkeypatch.setattr(activities, "gazetteer", Gazetteer(index_path))
+    monkeypatch.setattr(ratelimit, "LIMITS", {})
+    activities.geocoding_cache.clear()
+    yield activities.gazetteer
+    activities.geocoding_cache.clear()
+    activities.gazetteer.close()
+    await http_pool.close()
+
+
+async def test_get_geocoding_without_upstream(with_gazetteer, aioresponse):
+    fn = activities.get_geocoding.build().get_user_function()
+    submitted = executors.executor("threads").submitted
+    out = await fn("Chicago")
+    assert (out.lat, out.lon) == ("41.85003", "-87.65005")
+    assert not aioresponse.requests
+    # The index is read on the thread pool, not on the event loop
+    assert executors.executor("threads").submitted == submitted + 1
+
+
+async def test_get_geocoding_falls_back_on_a_miss(with_gazetteer, aioresponse):
+    rsp = GeocodingOutFactory.build()
+    aioresponse.get(re.compile(".*"), status=200, payload=[rsp.model_dump()])
+    fn = activities.get_geocoding.build().get_user_function()
+    assert await fn("Springfield") == rsp
+    assert len(aioresponse.requests) == 1
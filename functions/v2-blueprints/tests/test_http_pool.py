@@ -0,0 +1,68 @@
+import asyncio
+
+from aiohttp import web
+import pytest
+
+from http_pool import HttpPool
+
+
+@pytest.fixture
+async def server():
+    async def ok(request):
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_get("/", ok)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/"
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_session_and_connections(server):
+    pool = HttpPool(limit=4, limit_per_host=1)
+    session = await pool.session()
+    assert await pool.session() is session
+    for _ in range(3):
+        async with session.get(server) as rsp:
+            assert (await rsp.json()) == {"ok": True}
+    stats = pool.stats()
+    assert stats["requests"] == 3
+    assert stats["in_flight"] == 0
+    assert stats["connections_created"] == 1
+    await pool.close()
+    assert session.closed
+
+
+@pytest.mark.asyncio
+async def test_pool_queues_over_host_limit(server):
+    pool = HttpPool(limit_per_host=1)
+    session = await pool.session()
+
+    async def get():
+        async with session.get(server) as rsp:
+            return await rsp.json()
+
+    await asyncio.gather(*(get() for _ in range(5)))
+    assert pool.stats()["queue_time_total"] > 0
+    assert pool.stats()["queued"] == 0
+    await pool.close()
+
+
+@pytest.mark.parametrize("close_first_loop", [False, True])
+def test_pool_closes_session_of_previous_loop(close_first_loop):
+    pool = HttpPool()
+    first_loop, second_loop = asyncio.new_event_loop(), asyncio.new_event_loop()
+    first = first_loop.run_until_complete(pool.session())
+    if close_first_loop:
+        first_loop.close()
+    second = second_loop.run_until_complete(pool.session())
+    assert second is not first
+    assert first.closed and not second.closed
+    second_loop.run_until_complete(pool.close())
+    first_loop.close()
+    second_loop.close()
@@ -0,0 +1,125 @@
+import logging
+import threading
+
+import pytest
+
+import logs
+
+
+class Recorder(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.threads = []
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+        self.threads.append(threading.current_thread())
+
+
+class Context:
+
+    def __init__(self, is_replaying: bool):
+        self.is_replaying = is_replaying
+
+
+class Expensive:
+
+    def __init__(self):
+        self.rendered = 0
+
+    def __str__(self):
+        self.rendered += 1
+        return "expensive"
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("tests.logs")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    recorder = Recorder()
+    logger.addHandler(recorder)
+    yield logger, recorder
+    logs.uninstall()
+    logger.removeHandler(recorder)
+
+
+@pytest.fixture
+def sampling():
+    saved = dict(logs.SAMPLING)
+    yield logs.SAMPLING
+    logs.SAMPLING.clear()
+    logs.SAMPLING.update(saved)
+
+
+def test_fields_are_rendered_by_the_handler(logger):
+    logger, recorder = logger
+    log = logs.EventLogger(logger)
+    value = Expensive()
+    log.debug("hidden", value=value)
+    assert value.rendered == 0
+    log.warning("shown", value=value, stats=lambda: {"hits": 1})
+    assert recorder.records == ["shown value=expensive stats={'hits': 1}"]
+    assert value.rendered == 1
+
+
+def test_replaying_events_are_suppressed(logger):
+    logger, recorder = logger
+    log = logs.EventLogger(logger)
+    suppressed = logs.stats.replay_suppressed
+    log.warning("planning", context=Context(True), destination="Chicago")
+    log.warning("planning", context=Context(False), destination="Chicago")
+    assert recorder.records == ["planning destination=Chicago"]
+    assert logs.stats.replay_suppressed == suppressed + 1
+
+
+def test_sampling(logger, sampling):
+    logger, recorder = logger
+    log = logs.EventLogger(logger)
+    sampling.update(logs.parse_rates("weather=0, geocoding=0.5"))
+    for _ in range(200):
+        log.warning("weather")
+        log.warning("geocoding")
+        log.warning("feedback_request")
+    assert recorder.records.count("weather") == 0
+    assert 50 < recorder.records.count("geocoding") < 150
+    assert recorder.records.count("feedback_request") == 200
+
+
+def test_queue_moves_formatting_off_the_caller(logger):
+    logger, recorder = logger
+    logs.install(logger)
+    assert recorder not in logger.handlers
+    value = Expensive()
+    logs.EventLogger(logger).warning("shown", value=value)
+    logs.uninstall()
+    assert recorder.records == ["shown value=expensive"]
+    assert recorder.threads[0] is not threading.current_thread()
+    assert recorder in logger.handlers
+
+
+def test_full_queue_drops(logger):
+    logger, recorder = logger
+    logs.install(logger, maxsize=1)
+    logs._listener.stop()  # nothing drains the queue
+    dropped = logs.stats.dropped
+    for _ in range(3):
+        logger.warning("flood")
+    assert logs.stats.dropped == dropped + 2
+    logs._listener.start()
+
+
+def test_worker_handler_stays_inline(logger):
+    logger, recorder = logger
+    WorkerHandler = type("AsyncLoggingHandler", (Recorder,), {"__module__": "azure_functions_worker.dispatcher"})
+    worker = WorkerHandler()
+    logger.addHandler(worker)
+    logs.install(logger)
+    assert worker in logger.handlers and recorder not in logger.handlers
+    logger.warning("shown")
+    assert worker.threads == [threading.current_thread()]
+    logs.uninstall()
+    logger.removeHandler(worker)
+    assert recorder.records == ["shown"]
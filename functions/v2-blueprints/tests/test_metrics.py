@@ -0,0 +1,134 @@
+import azure.functions as func
+import pytest
+
+import activities  # registers the cache collectors rendered by the route
+import metrics
+from metrics import Histogram, Registry, instrument, record_upstream
+from tests.replay import ReplayEngine
+import triggers
+
+
+@pytest.fixture(autouse=True)
+def clear_registry(monkeypatch):
+    monkeypatch.setattr(metrics, "PAYLOAD_SIZES", True)
+    metrics.registry.clear()
+    yield
+    metrics.registry.clear()
+
+
+def histogram(name, **labels):
+    key = (name, tuple(labels.items()))
+    return metrics.registry.histograms.get(key)
+
+
+def counter(name, **labels):
+    return metrics.registry.counters.get((name, tuple(labels.items())), 0)
+
+
+def test_histogram_buckets():
+    h = Histogram((1, 2))
+    for value in (0.5, 1, 1.5, 3):
+        h.observe(value)
+    assert h.counts == [2, 1, 1]
+    assert h.count == 4
+    assert h.sum == 6
+
+
+def test_render_prometheus_format():
+    registry = Registry()
+    registry.describe("latency_seconds", "histogram", "Latency.")
+    registry.observe("latency_seconds", (("function", "f"),), 0.2, buckets=(0.1, 1))
+    registry.inc("calls_total", (("function", 'a"b'),))
+    registry.register_stats("cache", {"name": "geo"}, lambda: {"hits": 3, "hit_ratio": 0.5, "label": "x"})
+    out = registry.render()
+    assert "# TYPE latency_seconds histogram" in out
+    assert 'latency_seconds_bucket{function="f",le="0.1"} 0' in out
+    assert 'latency_seconds_bucket{function="f",le="1"} 1' in out
+    assert 'latency_seconds_bucket{function="f",le="+Inf"} 1' in out
+    assert 'latency_seconds_count{function="f"} 1' in out
+    assert "# TYPE calls_total counter" in out
+    assert 'calls_total{function="a\\"b"} 1' in out
+    assert 'cache_hits{name="geo"} 3' in out
+    assert 'cache_hit_ratio{name="geo"} 0.5' in out
+    assert "cache_label" not in out
+
+
+@pytest.mark.asyncio
+async def test_instrument_async_records_upstream():
+    @instrument("activity")
+    async def fetch(name: str) -> str:
+        record_upstream(0.25)
+        return name * 2
+
+    assert await fetch("ab") == "abab"
+    labels = dict(function="fetch", kind="activity")
+    assert counter("function_invocations_total", **labels) == 1
+    assert histogram("function_upstream_seconds", **labels).sum == 0.25
+    assert histogram("function_payload_bytes", **labels, direction="in").sum == 2
+    assert histogram("function_payload_bytes", **labels, direction="out").sum == 4
+    record_upstream(1)  # outside of an invocation: ignored
+    assert histogram("function_upstream_seconds", **labels).sum == 0.25
+
+
+def test_instrument_sync_exception():
+    @instrument("http")
+    def handler(req):
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        handler(None)
+    labels = dict(function="handler", kind="http")
+    assert counter("function_exceptions_total", **labels, exception="ValueError") == 1
+    assert histogram("function_duration_seconds", **labels).count == 1
+
+
+@pytest.mark.asyncio
+async def test_instrument_orchestrator_counts_replays():
+    @instrument("orchestrator")
+    def orchestrator(context):
+        a = yield context.call_activity("greet", "a")
+        b = yield context.call_activity("greet", "b")
+        return [a, b]
+
+    engine = ReplayEngine(
+        activities={"greet": lambda name: f"Hello {name}"},
+        orchestrators={"orchestrator": orchestrator},
+    )
+    result = await engine.run("orchestrator")
+    assert result.output == ["Hello a", "Hello b"]
+    labels = dict(function="orchestrator", kind="orchestrator")
+    assert counter("orchestrator_episodes_total", **labels, replay="false") == 1
+    assert counter("orchestrator_episodes_total", **labels, replay="true") == 2
+    assert histogram("function_duration_seconds", **labels).count == 3
+    # Output size is recorded once, not on every replay
+    assert histogram("function_payload_bytes", **labels, direction="out").count == 1
+
+
+@pytest.mark.asyncio
+async def test_instrument_orchestrator_propagates_task_failure():
+    @instrument("orchestrator")
+    def orchestrator(context):
+        try:
+            yield context.call_activity("fail", None)
+        except Exception as e:
+            return f"handled {e}"
+
+    def fail(_):
+        raise RuntimeError("nope")
+
+    engine = ReplayEngine(activities={"fail": fail}, orchestrators={"orchestrator": orchestrator})
+    result = await engine.run("orchestrator")
+    assert "nope" in result.output
+
+
+def test_metrics_route():
+    metrics.registry.inc("function_invocations_total", (("function", "f"), ("kind", "http")))
+    response = triggers.http_metrics.build().get_user_function()(
+        func.HttpRequest(method="GET", url="/api/metrics", body=b"")
+    )
+    assert response.status_code == 200
+    assert response.mimetype.startswith("text/plain")
+    body = response.get_body().decode()
+    assert 'function_invocations_total{function="f",kind="http"} 1' in body
+    assert 'cache_size{name="geocoding"}' in body
+    assert "http_pool_requests" in body
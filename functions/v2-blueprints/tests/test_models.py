@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import models
+from models import *
+from tests.test_activities import WeatherOutFactory
+
+
+@pytest.fixture(autouse=True)
+def restore_codec():
+    codec, maxsize = models.codec, models.decode_memo.maxsize
+    yield
+    models.set_codec(codec, memo_size=maxsize)
+
+
+@pytest.mark.parametrize("codec", [PydanticCodec, OrjsonCodec])
+def test_codec_round_trip(codec):
+    models.set_codec(codec())
+    rsp: WeatherOut = WeatherOutFactory.build()
+    assert WeatherOut.from_json(rsp.to_json()) == rsp
+
+
+def test_decode_memo():
+    models.set_codec(PydanticCodec(), memo_size=8)
+    payload = WorkflowOut(destination="Milan", lat="45.46", lon="9.19", current_temp=12.0).to_json()
+    first = WorkflowOut.from_json(payload)
+    second = WorkflowOut.from_json(str(payload))
+    assert first is second
+    assert models.decode_memo.stats()["hits"] >= 1
+    # The class is part of the key
+    assert type(WeatherIn.from_json('{"lat": "1", "lon": "2"}')) == WeatherIn
+
+
+def test_decode_memo_disabled():
+    models.set_codec(PydanticCodec(), memo_size=0)
+    payload = FeedbackRsp(status="ok").to_json()
+    assert FeedbackRsp.from_json(payload) is not FeedbackRsp.from_json(payload)
+
+
+def test_decode_memo_threads():
+    models.set_codec(PydanticCodec(), memo_size=4)
+    payloads = [WeatherIn(lat=str(i), lon="0").to_json() for i in range(16)]
+
+    def decode(i):
+        for payload in payloads[i % 4:] * 50:
+            assert WeatherIn.from_json(payload).lat == WeatherIn.model_validate_json(payload).lat
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(decode, range(8)))
+    assert models.decode_memo.stats()["size"] == 4
+
+
+@pytest.mark.parametrize("field, value", [("interval", 0), ("polls_per_generation", 0), ("threshold", -1)])
+def test_monitor_input_is_validated(field, value):
+    with pytest.raises(ValueError):
+        MonitorIn.model_validate({"destinations": ["Chicago"], field: value})
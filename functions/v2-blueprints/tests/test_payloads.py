@@ -0,0 +1,110 @@
+from datetime import timedelta
+import json
+
+import pytest
+
+import activities
+import entities
+import metrics
+import orchestrators
+import payloads
+from models import *
+from payloads import FileBlobStore, LazyPayload
+from tests.replay import ReplayEngine, dumps, loads
+from tests.test_activities import GeocodingOutFactory, WeatherOutFactory
+
+
+@pytest.fixture(autouse=True)
+def restore_payloads():
+    settings = payloads.compress_threshold, payloads.claim_check_threshold, payloads.store
+    yield
+    payloads.configure(*settings)
+
+
+def big_feedback(n: int = 200) -> FeedbackReq:
+    workflows = [WorkflowOut(destination=f"City {i}", lat="41.88", lon="-87.63", current_temp=12.5) for i in range(n)]
+    return FeedbackReq(output=dict(workflows=[w.model_dump() for w in workflows]), callback_uri="http://localhost/{eventName}")
+
+
+def test_small_payloads_are_unchanged():
+    payloads.configure(compress_threshold=4096)
+    rsp = FeedbackRsp(status="ok")
+    assert rsp.to_json() == rsp.model_dump_json()
+    assert type(FeedbackRsp.from_json(rsp.to_json())) is FeedbackRsp
+
+
+def test_compressed_payload_decodes_lazily():
+    payloads.configure(compress_threshold=1024, store=None)
+    req = big_feedback()
+    history = dumps(req)
+    assert len(history) < len(req.model_dump_json()) / 5
+    decoded = loads(history)
+    assert isinstance(decoded, LazyPayload)
+    assert decoded.model is FeedbackReq
+    assert decoded._value is None
+    # Passing it on re-uses the envelope without decoding
+    assert dumps(decoded) == history
+    assert decoded._value is None
+    assert decoded.callback_uri == req.callback_uri
+    assert decoded == req
+
+
+def test_nested_lazy_payload_is_resolved():
+    payloads.configure(compress_threshold=64, store=None)
+    workflow = WorkflowOut(destination="Chicago, Illinois" * 10, lat="41.88", lon="-87.63", current_temp=12.5)
+    lazy = WorkflowOut.from_json(workflow.to_json())
+    assert isinstance(lazy, LazyPayload)
+    out = OrchesratorOut(workflow=lazy, feedback=FeedbackRsp(status="ok"))
+    assert type(out.workflow) is WorkflowOut
+    assert out.model_dump()["workflow"] == workflow.model_dump()
+
+
+def test_payload_size_is_the_history_size():
+    payloads.configure(compress_threshold=1024, store=None)
+    req = big_feedback()
+    assert metrics.payload_size(req) == len(json.loads(dumps(req))["__data__"])
+    lazy = FeedbackReq.from_json(req.to_json())
+    assert metrics.payload_size(lazy) == len(req.to_json())
+
+
+def test_stored_refs_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(payloads, "STORED_REFS", 2)
+    puts = []
+    store = FileBlobStore(str(tmp_path))
+    monkeypatch.setattr(store, "put", lambda name, data: puts.append(name))
+    payloads.configure(compress_threshold=16, claim_check_threshold=32, store=store)
+    reqs = [FeedbackReq(output={"trip": i, "padding": "x" * 64}, callback_uri="http://localhost") for i in range(3)]
+    for req in reqs + reqs[2:]:
+        req.to_json()
+    assert len(puts) == 3 and len(payloads._stored) == 2
+    reqs[0].to_json()  # forgotten: written again
+    assert len(puts) == 4 and len(payloads._stored) == 2
+
+
+def test_claim_check(tmp_path):
+    payloads.configure(compress_threshold=1024, claim_check_threshold=4096, store=FileBlobStore(str(tmp_path)))
+    req = big_feedback()
+    history = dumps(req)
+    envelope = json.loads(json.loads(history)["__data__"])
+    assert envelope["$payload"] == "ref"
+    assert (tmp_path / envelope["ref"]).exists()
+    assert len(history) < 300
+    assert loads(history) == req
+    payloads.configure(store=None)
+    with pytest.raises(RuntimeError, match="PAYLOAD_STORE"):
+        loads(history).callback_uri
+
+
+@pytest.mark.asyncio
+async def test_trip_with_compressed_payloads():
+    payloads.configure(compress_threshold=64, store=None)
+    engine = ReplayEngine.from_modules(activities, orchestrators, entities)
+    geocoding = GeocodingOutFactory.build(lat="41.88", lon="-87.63", display_name="Chicago, Illinois, United States" * 20)
+    engine.activities["get_geocoding"] = lambda name: geocoding
+    engine.activities["get_city_weather"] = lambda latlon: WeatherOutFactory.build()
+    engine.raise_event("trip-1", "Approval", {"feedback": "ok"}, at=timedelta(seconds=1))
+    input_ = OrchestratorIn(callback_uri_template="http://localhost/{eventName}", client_input={"destination": "Chicago"})
+    result = await engine.run("trip", input_.model_dump(), instance_id="trip-1")
+    assert result.status == "Completed", result.error
+    assert OrchesratorOut.model_validate(result.output).workflow.lat == "41.88"
+    assert any('$payload' in (e.get("result") or "") for e in result.history)
@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import re
+import time
+
+import pytest
+
+import activities
+import ratelimit
+from ratelimit import TokenBucket, parse_limits, retry_after
+import resilience
+from resilience import CircuitBreaker, Upstream
+from tests.test_activities import GeocodingOutFactory
+
+pytestmark = pytest.mark.usefixtures("clear_caches")
+
+
+@pytest.mark.asyncio
+async def test_fifo_and_rate():
+    bucket = TokenBucket(rate=100, burst=1)
+    order = []
+
+    async def call(i):
+        await bucket.acquire()
+        order.append(i)
+
+    started = time.monotonic()
+    await asyncio.gather(*(call(i) for i in range(6)))
+    elapsed = time.monotonic() - started
+    assert order == list(range(6))
+    assert elapsed >= 0.045
+    stats = bucket.stats()
+    assert stats["acquired"] == 6
+    assert stats["waited"] == 5
+    assert stats["queued"] == 0
+    assert stats["wait_time_max"] >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_unlimited_does_not_wait():
+    bucket = TokenBucket(rate=0)
+    await asyncio.gather(*(bucket.acquire() for _ in range(100)))
+    assert bucket.stats()["waited"] == 0
+
+
+@pytest.mark.asyncio
+async def test_throttled_pauses_and_slows_down():
+    bucket = TokenBucket(rate=100, burst=5)
+    bucket.on_throttled(retry_after=0.05)
+    assert bucket.rate == 50
+    started = time.monotonic()
+    await bucket.acquire()
+    assert time.monotonic() - started >= 0.045
+    for _ in range(200):
+        bucket.on_success()
+    # Recovers to just under the throttled rate, then probes slowly up to the limit
+    assert 89 <= bucket.rate <= 100
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    bucket = TokenBucket(rate=10, burst=1)
+    await bucket.acquire()
+    waiter = asyncio.ensure_future(bucket.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert bucket.stats()["queued"] == 0
+    await asyncio.wait_for(bucket.acquire(), 1)
+
+
+def test_retry_after():
+    assert retry_after(None) is None
+    assert retry_after("3") == 3
+    assert retry_after("garbage") is None
+    at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < retry_after(format_datetime(at, usegmt=True)) <= 30
+
+
+def test_parse_limits():
+    assert parse_limits("geocode.maps.co=1:2, api.open-meteo.com=10") == {
+        "geocode.maps.co": (1.0, 2.0),
+        "api.open-meteo.com": (10.0, 1.0),
+    }
+
+
+@pytest.mark.asyncio
+async def test_get_geocoding_retries_after_429(aioresponse, monkeypatch):
+    monkeypatch.setattr(ratelimit, "LIMITS", {"geocode.maps.co": (100, 1)})
+    ratelimit.clear()
+    rsp = GeocodingOutFactory.build()
+    url = re.compile(r"^https://geocode\.maps\.co/.*")
+    aioresponse.get(url, status=429, headers={"Retry-After": "0"})
+    aioresponse.get(url, status=200, payload=[rsp.model_dump()])
+    out = await activities.get_geocoding.build().get_user_function()("Throttled City")
+    assert out == rsp
+    assert ratelimit.limiter("geocode.maps.co").stats()["throttled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_limiter_wait_is_not_upstream_latency(aioresponse, monkeypatch):
+    monkeypatch.setattr(ratelimit, "LIMITS", {"geocode.maps.co": (20, 1)})
+    ratelimit.clear()
+    up = Upstream("geocode.maps.co", deadline=0.05, breaker=CircuitBreaker(failure_threshold=2))
+    monkeypatch.setitem(resilience._upstreams, "geocode.maps.co", up)
+    aioresponse.get(re.compile(r"^https://geocode\.maps\.co/.*"), status=200, payload=[GeocodingOutFactory.build().model_dump()], repeat=True)
+    fn = activities.get_geocoding.build().get_user_function()
+    # 8 tokens at 20/s queue for 0.35s, well past the 0.05s deadline
+    await asyncio.gather(*(fn(f"Queued City {i}") for i in range(8)))
+    assert up.stats()["deadline_exceeded"] == 0
+    assert up.breaker.state == CircuitBreaker.CLOSED
+    assert max(up.latency.samples) < 0.05
+
+
+@pytest.mark.asyncio
+async def test_try_acquire_does_not_jump_the_queue():
+    now = [0.0]
+    bucket = TokenBucket(rate=1, burst=1, clock=lambda: now[0])
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    waiting = asyncio.ensure_future(bucket.acquire())
+    await asyncio.sleep(0)
+    now[0] = 1.0  # a token is free, but it is the waiter's
+    assert not bucket.try_acquire()
+    waiting.cancel()
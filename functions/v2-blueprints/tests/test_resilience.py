@@ -0,0 +1,170 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, Throttled, Upstream, is_failure
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def response_error(status: int) -> aiohttp.ClientResponseError:
+    return aiohttp.ClientResponseError(request_info=None, history=(), status=status)
+
+
+def warm(up: Upstream, seconds: float = 0.01):
+    for _ in range(up.min_samples):
+        up.latency.observe(seconds)
+    up.requests = 100
+
+
+def test_breaker_opens_and_probes():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    clock.now = 10
+    breaker.allow()  # half-open probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now = 20
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats() == dict(state=0, consecutive_failures=0, opened=2, rejected=2)
+
+
+def test_is_failure():
+    assert is_failure(response_error(503))
+    assert is_failure(response_error(429))
+    assert not is_failure(response_error(404))
+    assert is_failure(asyncio.TimeoutError())
+    assert is_failure(aiohttp.ClientConnectionError())
+    assert not is_failure(RuntimeError("no results"))
+
+
+@pytest.mark.asyncio
+async def test_deadline_counts_as_failure():
+    up = Upstream("slow", deadline=0.01, breaker=CircuitBreaker(failure_threshold=1))
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await up.call(slow)
+    with pytest.raises(CircuitOpenError):
+        await up.call(slow)
+    stats = up.stats()
+    assert stats["deadline_exceeded"] == 1
+    assert stats["breaker_state"] == CircuitBreaker.OPEN
+    assert stats["breaker_rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_trip_breaker():
+    up = Upstream("h", breaker=CircuitBreaker(failure_threshold=1))
+
+    async def not_found():
+        raise response_error(404)
+
+    for _ in range(3):
+        with pytest.raises(aiohttp.ClientResponseError):
+            await up.call(not_found)
+    assert up.breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_throttled_is_neutral():
+    clock = Clock()
+    up = Upstream("h", breaker=CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock))
+
+    async def throttled():
+        raise Throttled(1)
+
+    async def unavailable():
+        raise response_error(503)
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        await up.call(unavailable)
+    with pytest.raises(Throttled):
+        await up.call(throttled)
+    assert up.breaker.failures == 1  # not reset
+    with pytest.raises(aiohttp.ClientResponseError):
+        await up.call(unavailable)
+    assert up.breaker.state == CircuitBreaker.OPEN
+    clock.now = 10
+    with pytest.raises(Throttled):
+        await up.call(throttled)  # the half-open probe is released, not closed
+    assert up.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(Throttled):
+        await up.call(throttled)  # another probe is let through straight away
+    assert up.failures == 2 and not up.latency.samples
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_over_slow_primary():
+    up = Upstream("h", hedge_min_delay=0.01)
+    warm(up)
+    delays = [1, 0]
+
+    async def request():
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return delay
+
+    assert await up.call(request) == 0
+    assert up.stats()["hedges"] == 1
+    assert up.stats()["hedge_wins"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hedge_falls_back_to_primary_on_hedge_error():
+    up = Upstream("h", hedge_min_delay=0.01)
+    warm(up)
+    calls = []
+
+    async def request():
+        calls.append(None)
+        if len(calls) == 1:
+            await asyncio.sleep(0.05)
+            return "primary"
+        raise aiohttp.ClientConnectionError()
+
+    assert await up.call(request) == "primary"
+    assert up.hedges == 1 and up.hedge_wins == 0
+
+
+@pytest.mark.asyncio
+async def test_no_hedging_without_samples_or_budget():
+    up = Upstream("h", hedge_min_delay=0.001)
+    assert up.hedge_delay() is None
+    warm(up)
+    assert up.hedge_delay() == 0.01
+    up.hedges = 10
+    assert up.hedge_delay() is None
+
+
+@pytest.mark.asyncio
+async def test_hedge_vetoed():
+    up = Upstream("h", hedge_min_delay=0.01)
+    warm(up)
+
+    async def request():
+        await asyncio.sleep(0.03)
+        return "primary"
+
+    assert await up.call(request, may_hedge=lambda: False) == "primary"
+    assert up.hedges == 0
@@ -0,0 +1,128 @@
+import importlib.util
+import json
+from pathlib import Path
+import sys
+from urllib.parse import parse_qs, urlencode
+
+import pytest
+
+from tests.replay import ReplayEngine
+
+SINGLE_FILE_DIR = Path(__file__).parent.parent.parent / "v2-single-file"
+pytestmark = pytest.mark.skipif(not SINGLE_FILE_DIR.exists(), reason="v2-single-file not checked out")
+
+
+@pytest.fixture(scope="module")
+def app():
+    # Its own module name, so it doesn't shadow the blueprints' function_app;
+    # registered so the custom-object hooks can find its payload classes
+    spec = importlib.util.spec_from_file_location("single_file_app", SINGLE_FILE_DIR / "function_app.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    yield module
+    del sys.modules[spec.name]
+
+
+def forecast(lat: str, lon: str) -> dict:
+    return dict(
+        latitude=float(lat),
+        longitude=float(lon),
+        generationtime_ms=0.1,
+        utc_offset_seconds=0,
+        timezone="GMT",
+        timezone_abbreviation="GMT",
+        elevation=10,
+        current_units=dict(time="iso8601", interval="seconds", temperature="°C"),
+        current=dict(time="2024-01-01T00:00", interval=900, temperature=float(lat)),
+    )
+
+
+class Response:
+
+    def __init__(self, payload, status_code=200):
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode()
+
+
+class OpenMeteo:
+    """Answers like open-meteo: an object for one location, a list for several."""
+
+    def __init__(self):
+        self.requests = []
+
+    async def get(self, url, params=None, **kwargs):
+        self.requests.append(urlencode(params))
+        points = list(zip(params["latitude"].split(","), params["longitude"].split(",")))
+        payload = [forecast(lat, lon) for lat, lon in points]
+        return Response(payload[0] if len(payload) == 1 else payload)
+
+
+@pytest.fixture
+def open_meteo(app, monkeypatch):
+    upstream = OpenMeteo()
+    monkeypatch.setattr(app.http_pool, "get", upstream.get)
+    return upstream
+
+
+def locations(n: int) -> list:
+    return [dict(lat=f"{i}.5", lon=f"-{i}.25") for i in range(n)]
+
+
+async def test_weather_batch_single_location(app, open_meteo):
+    fn = app.get_city_weather_batch.build().get_user_function()
+    out = await fn(locations(1))
+    assert [(w.latitude, w.longitude) for w in out] == [(0.5, -0.25)]
+    assert len(open_meteo.requests) == 1
+
+
+async def test_weather_batch_chunks_in_order(app, open_meteo, monkeypatch):
+    monkeypatch.setattr(app, "WEATHER_BATCH_SIZE", 2)
+    fn = app.get_city_weather_batch.build().get_user_function()
+    out = await fn(locations(5))
+    assert [(w.latitude, w.longitude) for w in out] == [(i + 0.5, -i - 0.25) for i in range(5)]
+    assert [parse_qs(r)["latitude"] for r in open_meteo.requests] == [["0.5,1.5"], ["2.5,3.5"], ["4.5"]]
+
+
+async def test_weather_batch_upstream_error(app, monkeypatch):
+    async def get(url, params=None, **kwargs):
+        return Response({"reason": "overloaded"}, status_code=503)
+
+    monkeypatch.setattr(app.http_pool, "get", get)
+    fn = app.get_city_weather_batch.build().get_user_function()
+    with pytest.raises(ConnectionError):
+        await fn(locations(3))
+
+
+async def test_weather_batched(app, open_meteo):
+    names = [f"city-{i}" for i in range(5)]
+
+    async def get_geocoding(name):
+        i = int(name.split("-")[1])
+        return dict(lat=f"{i}.5", lon=f"-{i}.25", display_name=name)
+
+    engine = ReplayEngine.from_modules(app)
+    engine.activities["get_geocoding"] = get_geocoding
+    result = await engine.run("weather_batched", dict(names=names, batch_size=2))
+    assert result.status == "Completed", result.error
+    assert result.output == [
+        f"Hi from city-{i} (lat: {i}.5, long: -{i}.25), it's {i}.5°C here!" for i in range(5)
+    ]
+    assert engine.activity_calls == {"get_geocoding": 5, "get_city_weather_batch": 3}
+    assert len(open_meteo.requests) == 3
+
+
+@pytest.mark.parametrize("batch_size", [0, -1, "2", True])
+async def test_weather_batched_invalid_batch_size(app, open_meteo, batch_size):
+    engine = ReplayEngine.from_modules(app)
+    result = await engine.run("weather_batched", dict(names=["city-0"], batch_size=batch_size))
+    assert result.status == "Failed"
+    assert "batch_size" in str(result.error)
+    assert not engine.activity_calls
+
+
+async def test_fan_out_rejects_non_positive_limits(app):
+    engine = ReplayEngine.from_modules(app)
+    result = await engine.run("fan_out", dict(function_name="greet", inputs=["a"], max_in_flight=0))
+    assert result.status == "Failed"
+    assert "must be positive" in str(result.error)
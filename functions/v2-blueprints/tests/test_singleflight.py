@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        return {"lat": "1"}
+
+    callers = [asyncio.ensure_future(flight.do("milan", fetch)) for _ in range(5)]
+    await asyncio.sleep(0)
+    # The leader task is held by the flight, not only by the event loop
+    assert isinstance(flight._flights["milan"].task, asyncio.Task)
+    results = await asyncio.gather(*callers)
+    assert results == [{"lat": "1"}] * 5
+    assert len(calls) == 1
+    assert flight.stats() == dict(calls=5, coalesced=4, errors=0, timeouts=0, in_flight=0)
+    # Later calls start a new flight
+    await flight.do("milan", fetch)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_propagates_errors():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.stats()["errors"] == 1
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_timeout():
+    flight = SingleFlight(timeout=0.01)
+
+    async def fetch():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await flight.do("k", fetch)
+    assert flight.stats()["timeouts"] == 1
+    await asyncio.sleep(0.02)
+    assert flight.in_flight() == 0
@@ -0,0 +1,56 @@
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.startup import check, parse_importtime
+
+
+APP_DIR = Path(__file__).parent.parent
+SINGLE_FILE_DIR = APP_DIR.parent / "v2-single-file"
+
+
+def imports_after_startup(app_dir: Path, expr: str) -> str:
+    code = f"import sys, function_app; print({expr})"
+    return subprocess.run(
+        [sys.executable, "-c", code], cwd=app_dir, capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def test_blueprints_defer_optional_imports_and_validators():
+    out = imports_after_startup(
+        APP_DIR, "'sqlite3' in sys.modules, function_app.activities.GeocodingOut.__pydantic_complete__"
+    )
+    assert out == "False False"
+
+
+@pytest.mark.skipif(not SINGLE_FILE_DIR.exists(), reason="v2-single-file not checked out")
+def test_single_file_defers_httpx():
+    assert imports_after_startup(SINGLE_FILE_DIR, "'httpx' in sys.modules") == "False"
+
+
+def test_parse_importtime():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:      1000 |       1000 |     pydantic.main",
+        "import time:       500 |       1500 |   pydantic",
+        "import time:      2000 |       3500 | models",
+        "import time:       100 |        100 | unrelated",
+    ])
+    assert parse_importtime(stderr, {"models"}) == {"pydantic": 1.5, "models": 2.0}
+
+
+def test_check_flags_regressions_and_new_imports():
+    budget = {"models": 0.5, "pydantic": 2.5}
+    assert check({"models": 11.0, "pydantic": 40.0}, budget, baseline_ms=20, tolerance=1.25, slack_ms=1) == []
+    assert check({"models": 20.0, "httpx": 20.0}, budget, baseline_ms=20, tolerance=1.25, slack_ms=1) == [
+        "httpx: 20.0 ms > budget 0.0 ms (0.0 x baseline)",
+        "models: 20.0 ms > budget 10.0 ms (0.5 x baseline)",
+    ]
+
+
+def test_check_scales_with_the_baseline():
+    budget = {"models": 0.5}
+    assert check({"models": 20.0}, budget, baseline_ms=20, tolerance=1.25, slack_ms=1) != []
+    assert check({"models": 20.0}, budget, baseline_ms=40, tolerance=1.25, slack_ms=1) == []
@@ -0,0 +1,323 @@
+import asyncio
+import json
+import time
+
+import azure.functions as func
+from azure.durable_functions import OrchestrationRuntimeStatus
+from azure.durable_functions.models.DurableOrchestrationStatus import DurableOrchestrationStatus
+import pytest
+
+import metrics
+import triggers
+from triggers import (
+    dedupe_instance_id,
+    http_bulk_raise_event,
+    http_bulk_start,
+    http_trigger,
+    http_wait_for_status,
+    parse_bulk_body,
+)
+
+
+class FakeClient:
+
+    def __init__(self, fail_on=None, statuses=None, outputs=None):
+        self.fail_on = fail_on
+        self.statuses = statuses or {}
+        self.outputs = outputs or {}
+        self.status_queries = 0
+        self.started = []
+        self.raised = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def create_http_management_payload(self, instance_id):
+        base = f"http://localhost:7071/runtime/webhooks/durabletask/instances/{instance_id}"
+        return {
+            "id": instance_id,
+            "statusQueryGetUri": base,
+            "sendEventPostUri": base + "/raiseEvent/{eventName}",
+        }
+
+    def create_check_status_response(self, request, instance_id):
+        return func.HttpResponse(
+            json.dumps(self.create_http_management_payload(instance_id)),
+            status_code=202,
+            mimetype="application/json",
+        )
+
+    async def start_new(self, orchestration_function_name, instance_id=None, client_input=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        if client_input["client_input"].get("destination") == self.fail_on:
+            raise RuntimeError("start failed")
+        if self.statuses.get(instance_id, [None])[0] in ("Pending", "Running"):
+            raise RuntimeError(f"An instance with ID '{instance_id}' already exists")
+        self.started.append((orchestration_function_name, client_input))
+        if instance_id is not None:
+            self.statuses[instance_id] = ["Running"]
+        return instance_id
+
+    async def raise_event(self, instance_id, event_name, event_data=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        if instance_id not in self.statuses:
+            raise Exception(f"No instance with ID '{instance_id}' found.")
+        self.raised.append((instance_id, event_name, event_data))
+
+    async def get_status(self, instance_id):
+        self.status_queries += 1
+        history = self.statuses.get(instance_id)
+        runtime_status = history.pop(0) if history and len(history) > 1 else (history or [None])[0]
+        if runtime_status is None:
+            return DurableOrchestrationStatus(message=f"{instance_id} not found")
+        return DurableOrchestrationStatus(
+            instanceId=instance_id,
+            runtimeStatus=OrchestrationRuntimeStatus(runtime_status),
+            output=self.outputs.get(instance_id),
+            createdTime="2024-01-01T00:00:00Z",
+            lastUpdatedTime="2024-01-01T00:00:01Z",
+        )
+
+
+def client_function(builder):
+    return builder.build().get_user_function().client_function
+
+
+def bulk_request(body: str, params=None) -> func.HttpRequest:
+    return func.HttpRequest(
+        method="POST",
+        url="http://localhost:7071/api/workflow-bulk/trip",
+        route_params={"workflow_name": "trip"},
+        params=params or {},
+        body=body.encode(),
+    )
+
+
+def test_parse_bulk_body():
+    assert parse_bulk_body(b'[{"a": 1}, {"b": 2}]') == [({"a": 1}, None), ({"b": 2}, None)]
+    items = parse_bulk_body(b'{"a": 1}\n\nnot json\n{"b": 2}\n')
+    assert [i for i, _ in items] == [{"a": 1}, None, {"b": 2}]
+    assert items[1][1].startswith("Invalid JSON")
+
+
+@pytest.mark.asyncio
+async def test_bulk_start():
+    client = FakeClient(fail_on="Atlantis")
+    body = "\n".join(json.dumps({"destination": d}) for d in ["Chicago", "Atlantis", "Milan", "Tokyo"])
+    rsp = await client_function(http_bulk_start)(bulk_request(body + "\n[1]", {"concurrency": "2"}), client=client)
+    assert rsp.status_code == 200
+    assert rsp.mimetype == "application/x-ndjson"
+    lines = {line["index"]: line for line in map(json.loads, rsp.get_body().decode().splitlines())}
+    assert sorted(lines) == [0, 1, 2, 3, 4]
+    assert lines[1]["error"] == "RuntimeError: start failed"
+    assert "error" in lines[4]
+    assert all("statusQueryGetUri" in lines[i] for i in (0, 2, 3))
+    assert len(client.started) == 3
+    assert client.max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_bulk_start_invalid_body():
+    rsp = await client_function(http_bulk_start)(bulk_request("[{"), client=FakeClient())
+    assert rsp.status_code == 400
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("concurrency", ["ten", "", "1.5", "0", "-3"])
+async def test_bulk_start_invalid_concurrency(concurrency):
+    client = FakeClient()
+    rsp = await client_function(http_bulk_start)(
+        bulk_request(json.dumps({"destination": "Chicago"}), {"concurrency": concurrency}), client=client
+    )
+    assert rsp.status_code == 400
+    assert not client.started
+
+
+@pytest.mark.asyncio
+async def test_bulk_raise_event():
+    metrics.registry.clear()
+    client = FakeClient(statuses={f"trip-{i}": ["Running"] for i in range(6)})
+    items = [dict(instance_id=f"trip-{i}", payload={"feedback": "ok"}) for i in range(6)]
+    items[2]["event_name"] = "Cancel"
+    items += [dict(instance_id="missing"), dict(payload={}), dict(instance_id="trip-0", event_name={"a": 1})]
+    rsp = await client_function(http_bulk_raise_event)(
+        bulk_request(json.dumps(items), {"concurrency": "3"}), client=client
+    )
+    assert rsp.status_code == 200
+    assert rsp.mimetype == "application/x-ndjson"
+    lines = {line["index"]: line for line in map(json.loads, rsp.get_body().decode().splitlines())}
+    assert sorted(lines) == list(range(9))
+    assert lines[8]["delivered"] is False and "event_name" in lines[8]["error"]
+    assert all(lines[i]["delivered"] for i in range(6))
+    assert lines[6]["delivered"] is False and "missing" in lines[6]["error"]
+    assert "instance_id" in lines[7]["error"]
+    assert all(lines[i]["raise_ms"] > 0 and lines[i]["queued_ms"] >= 0 for i in range(7))
+    assert lines[5]["queued_ms"] > lines[0]["queued_ms"]
+    assert [i for i, _, _ in client.raised] == [f"trip-{i}" for i in range(6)]
+    assert {e for _, e, _ in client.raised} == {"Approval", "Cancel"}
+    assert client.raised[0][2] == {"feedback": "ok"}
+    assert client.max_in_flight == 3
+    labels = {labels for name, labels in metrics.registry.counters if name == "events_raised_total"}
+    assert {dict(l)["event"] for l in labels} == {"Approval", "other"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("concurrency", ["ten", "0"])
+async def test_bulk_raise_event_invalid_concurrency(concurrency):
+    client = FakeClient(statuses={"trip-0": ["Running"]})
+    rsp = await client_function(http_bulk_raise_event)(
+        bulk_request(json.dumps([dict(instance_id="trip-0")]), {"concurrency": concurrency}), client=client
+    )
+    assert rsp.status_code == 400
+    assert not client.raised
+
+
+def wait_request(body: dict) -> func.HttpRequest:
+    return func.HttpRequest(
+        method="POST",
+        url="http://localhost:7071/api/workflow-status/wait",
+        body=json.dumps(body).encode(),
+    )
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(triggers, "STATUS_POLL_INTERVAL", 0.001)
+    monkeypatch.setattr(triggers, "STATUS_POLL_MAX_INTERVAL", 0.002)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_status_change(fast_polling):
+    client = FakeClient(statuses={
+        "a": ["Running", "Running", "Completed"],
+        "b": ["Running"],
+    })
+    rsp = await client_function(http_wait_for_status)(
+        wait_request({"instance_ids": ["a", "b"], "timeout": 5}), client=client
+    )
+    out = json.loads(rsp.get_body())
+    assert out["changed"] == ["a"]
+    assert out["timedOut"] is False
+    assert out["statuses"]["a"]["runtimeStatus"] == "Completed"
+    assert out["statuses"]["b"]["runtimeStatus"] == "Running"
+    assert client.status_queries == 6
+
+
+@pytest.mark.asyncio
+async def test_wait_for_status_known(fast_polling):
+    client = FakeClient(statuses={"a": ["Pending", "Running"], "b": ["Completed"]})
+    rsp = await client_function(http_wait_for_status)(
+        wait_request({"instance_ids": ["a", "b"], "known": {"a": "Pending", "b": "Completed"}}),
+        client=client,
+    )
+    assert json.loads(rsp.get_body())["changed"] == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_wait_for_status_timeout(fast_polling):
+    client = FakeClient(statuses={"a": ["Running"]})
+    rsp = await client_function(http_wait_for_status)(
+        wait_request({"instance_ids": ["a", "missing"], "timeout": 0.01}), client=client
+    )
+    out = json.loads(rsp.get_body())
+    assert out["timedOut"] is True
+    assert out["statuses"]["missing"] is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body", [
+    {"ids": []},
+    ["a"],
+    {"instance_ids": "abc"},
+    {"instance_ids": [["a"]]},
+    {"instance_ids": ["a"], "known": ["a"]},
+    {"instance_ids": ["a"], "known": {"a": 1}},
+    {"instance_ids": ["a"], "timeout": "soon"},
+    {"instance_ids": []},
+    {"instance_ids": ["a"], "timeout": float("nan")},
+    {"instance_ids": ["a"], "timeout": float("inf")},
+    {"instance_ids": ["a"], "timeout": -1},
+])
+async def test_wait_for_status_invalid_body(body):
+    rsp = await client_function(http_wait_for_status)(wait_request(body), client=FakeClient())
+    assert rsp.status_code == 400
+
+
+def start_request(client_input: dict, params=None) -> func.HttpRequest:
+    return func.HttpRequest(
+        method="POST",
+        url="http://localhost:7071/api/workflow/trip",
+        route_params={"workflow_name": "trip"},
+        params=params or {},
+        body=json.dumps(client_input).encode(),
+    )
+
+
+def test_dedupe_instance_id():
+    a = dedupe_instance_id("trip", {"destination": "Chicago", "days": 2}, 300, now=1000)
+    assert a == dedupe_instance_id("trip", {"days": 2, "destination": "Chicago"}, 300, now=1100)
+    assert a != dedupe_instance_id("trip", {"destination": "Milan", "days": 2}, 300, now=1000)
+    assert a != dedupe_instance_id("itinerary", {"destination": "Chicago", "days": 2}, 300, now=1000)
+    assert a != dedupe_instance_id("trip", {"destination": "Chicago", "days": 2}, 300, now=1200)
+
+
+@pytest.mark.asyncio
+async def test_start_without_dedupe():
+    client = FakeClient()
+    for _ in range(2):
+        await client_function(http_trigger)(start_request({"destination": "Chicago"}), client=client)
+    assert len(client.started) == 2
+
+
+@pytest.mark.asyncio
+async def test_dedupe_attaches_to_running_instance():
+    client = FakeClient()
+    params = {"dedupe": "1"}
+    first, second = await asyncio.gather(
+        client_function(http_trigger)(start_request({"destination": "Chicago"}, params), client=client),
+        client_function(http_trigger)(start_request({"destination": "Chicago"}, params), client=client),
+    )
+    third = await client_function(http_trigger)(start_request({"destination": "Chicago"}, params), client=client)
+    assert len(client.started) == 1
+    ids = {json.loads(rsp.get_body())["id"] for rsp in (first, second, third)}
+    assert len(ids) == 1
+    assert {rsp.status_code for rsp in (first, second, third)} == {202}
+
+
+@pytest.mark.asyncio
+async def test_dedupe_reuses_completed_output(monkeypatch):
+    monkeypatch.setattr(triggers, "WORKFLOW_DEDUPE", True)
+    instance_id = dedupe_instance_id("trip", {"destination": "Chicago"}, triggers.WORKFLOW_DEDUPE_WINDOW)
+    client = FakeClient(statuses={instance_id: ["Completed"]}, outputs={instance_id: {"feedback": {"status": "completed"}}})
+    rsp = await client_function(http_trigger)(start_request({"destination": "Chicago"}), client=client)
+    assert rsp.status_code == 200
+    assert rsp.headers["X-Instance-Id"] == instance_id
+    assert json.loads(rsp.get_body())["output"] == {"feedback": {"status": "completed"}}
+    assert client.started == []
+
+
+@pytest.mark.asyncio
+async def test_dedupe_restarts_failed_instance():
+    instance_id = dedupe_instance_id("trip", {"destination": "Chicago"}, triggers.WORKFLOW_DEDUPE_WINDOW)
+    client = FakeClient(statuses={instance_id: ["Failed"]})
+    rsp = await client_function(http_trigger)(start_request({"destination": "Chicago"}, {"dedupe": "true"}), client=client)
+    assert rsp.status_code == 202
+    assert len(client.started) == 1
+
+
+@pytest.mark.asyncio
+async def test_dedupe_attaches_across_window_boundary(monkeypatch):
+    window = triggers.WORKFLOW_DEDUPE_WINDOW
+    boundary = (time.time() // window + 1) * window
+    monkeypatch.setattr(time, "time", lambda: boundary - 1)
+    client = FakeClient()
+    first = await client_function(http_trigger)(start_request({"destination": "Chicago"}, {"dedupe": "1"}), client=client)
+    monkeypatch.setattr(time, "time", lambda: boundary + 1)
+    retry = await client_function(http_trigger)(start_request({"destination": "Chicago"}, {"dedupe": "1"}), client=client)
+    assert len(client.started) == 1
+    assert json.loads(first.get_body())["id"] == json.loads(retry.get_body())["id"]
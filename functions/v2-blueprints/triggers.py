@@ -1,27 +1,334 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import time
+from typing import Optional, Tuple
 from uuid import uuid1
 
 import azure.functions as func
 import azure.durable_functions as df
 
+import metrics
 from models import OrchestratorIn
 
 
 bp = df.Blueprint()
 
+BULK_START_CONCURRENCY = int(os.environ.get("BULK_START_CONCURRENCY", 32))
+BULK_EVENT_CONCURRENCY = int(os.environ.get("BULK_EVENT_CONCURRENCY", 32))
+STATUS_QUERY_CONCURRENCY = int(os.environ.get("STATUS_QUERY_CONCURRENCY", 32))
+STATUS_POLL_INTERVAL = float(os.environ.get("STATUS_POLL_INTERVAL", 0.5))
+STATUS_POLL_MAX_INTERVAL = float(os.environ.get("STATUS_POLL_MAX_INTERVAL", 5))
+STATUS_WAIT_TIMEOUT = float(os.environ.get("STATUS_WAIT_TIMEOUT", 60))
+TERMINAL_STATUSES = {"Completed", "Failed", "Canceled", "Terminated"}
+# Event names kept as metric labels, any other one is counted as "other"
+METRIC_EVENT_NAMES = set(os.environ.get("METRIC_EVENT_NAMES", "Approval,StopMonitor").split(","))
+# Opt-in start deduplication (or per request with ?dedupe=1), see `start_or_attach`
+WORKFLOW_DEDUPE = os.environ.get("WORKFLOW_DEDUPE", "0") == "1"
+WORKFLOW_DEDUPE_WINDOW = float(os.environ.get("WORKFLOW_DEDUPE_WINDOW", 300))
+
+
+async def start_workflow(
+    client: df.DurableOrchestrationClient, wf_name: str, client_input: dict, instance_id: Optional[str] = None
+) -> str:
+    instance_id = instance_id or str(uuid1())
+    wf_mgmt = client.create_http_management_payload(instance_id=instance_id)
+    input_ = OrchestratorIn(
+        callback_uri_template=wf_mgmt["sendEventPostUri"],
+        client_input=client_input,
+    )
+    await client.start_new(wf_name, client_input=input_.model_dump(), instance_id=instance_id)
+    return instance_id
+
+
+def dedupe_instance_id(wf_name: str, client_input, window: float, now: Optional[float] = None) -> str:
+    """The same instance ID for the same workflow and input within a `window` seconds bucket."""
+    canonical = json.dumps([wf_name, client_input], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    digest = hashlib.sha256(canonical.encode()).hexdigest()[:32]
+    bucket = int((time.time() if now is None else now) // window)
+    return f"{wf_name}-{digest}-{bucket}"
+
+
+def startable(status) -> bool:
+    """No such instance, or one that ended without an output to reuse."""
+    runtime_status = status.runtime_status.name if status is not None and status.runtime_status is not None else None
+    return runtime_status is None or runtime_status in TERMINAL_STATUSES - {"Completed"}
+
+
+async def start_or_attach(
+    client: df.DurableOrchestrationClient, wf_name: str, client_input: dict, window: float = WORKFLOW_DEDUPE_WINDOW
+) -> Tuple[str, Optional[dict]]:
+    """
+    Start the workflow under its `dedupe_instance_id`, unless that instance
+    is already running (attach to it) or has completed (reuse its output).
+    Failed or terminated instances are started again. The previous window's
+    instance is checked first, so that a retry just after a window boundary
+    still finds the original (duplicates are caught for at least `window`).
+
+    Returns the instance ID and, when reused, the completed instance status.
+    """
+    now = time.time()
+    labels = (("workflow", wf_name),)
+    previous_id = dedupe_instance_id(wf_name, client_input, window, now=now - window)
+    previous = await client.get_status(previous_id)
+    if not startable(previous):
+        return attach(previous_id, previous, labels)
+    instance_id = dedupe_instance_id(wf_name, client_input, window, now=now)
+    status = await client.get_status(instance_id)
+    if startable(status):
+        try:
+            await start_workflow(client, wf_name, client_input, instance_id=instance_id)
+            metrics.registry.inc("workflow_starts_total", labels + (("outcome", "started"),))
+            return instance_id, None
+        except Exception:
+            # A concurrent duplicate may have started it first
+            status = await client.get_status(instance_id)
+            if startable(status):
+                raise
+    return attach(instance_id, status, labels)
+
+
+def attach(instance_id: str, status, labels) -> Tuple[str, Optional[dict]]:
+    if status.runtime_status.name == "Completed":
+        metrics.registry.inc("workflow_starts_total", labels + (("outcome", "reused"),))
+        return instance_id, status.to_json()
+    metrics.registry.inc("workflow_starts_total", labels + (("outcome", "attached"),))
+    return instance_id, None
+
+
+def dedupe_requested(req: func.HttpRequest) -> bool:
+    return req.params.get("dedupe", "1" if WORKFLOW_DEDUPE else "0").lower() in ("1", "true")
+
 
 @bp.route(route="workflow/{workflow_name}")
 @bp.durable_client_input(client_name="client")
+@metrics.instrument("http")
 async def http_trigger(
     req: func.HttpRequest, client: df.DurableOrchestrationClient
 ):
     wf_name = req.route_params.get("workflow_name")
     client_input: dict = req.get_json()
-    instance_id = str(uuid1())
-    wf_mgmt = client.create_http_management_payload(instance_id=instance_id)
-    input_ = OrchestratorIn(
-        callback_uri_template=wf_mgmt["sendEventPostUri"],
-        client_input=client_input,
-    )
-    await client.start_new(wf_name, client_input=input_.model_dump(), instance_id=instance_id)
+    if not dedupe_requested(req):
+        instance_id = await start_workflow(client, wf_name, client_input)
+        return client.create_check_status_response(req, instance_id)
+    instance_id, completed = await start_or_attach(client, wf_name, client_input)
+    if completed is not None:
+        return func.HttpResponse(
+            json.dumps(completed, default=str),
+            status_code=200,
+            mimetype="application/json",
+            headers={"X-Instance-Id": instance_id},
+        )
     rsp = client.create_check_status_response(req, instance_id)
-    return rsp
\ No newline at end of file
+    return rsp
+
+
+def parse_bulk_body(body: bytes) -> list:
+    """
+    Parse a JSON array or NDJSON body into a list of (input, error) pairs,
+    so that a malformed line only fails that line.
+    """
+    text = body.decode("utf-8")
+    if text.lstrip().startswith("["):
+        return [(item, None) for item in json.loads(text)]
+    items = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append((json.loads(line), None))
+        except json.JSONDecodeError as e:
+            items.append((None, f"Invalid JSON: {e}"))
+    return items
+
+
+def positive_int_param(req: func.HttpRequest, name: str, default: int) -> int:
+    """`?name=` as a positive int; ValueError if it isn't one."""
+    value = int(req.params.get(name, default))
+    if value < 1:
+        raise ValueError(f"{name} must be positive, got {value}")
+    return value
+
+
+@bp.route(route="workflow-bulk/{workflow_name}", methods=["POST"])
+@bp.durable_client_input(client_name="client")
+@metrics.instrument("http")
+async def http_bulk_start(
+    req: func.HttpRequest, client: df.DurableOrchestrationClient
+):
+    """
+    Start one orchestration per workflow input in the body (NDJSON or a JSON
+    array), at most `concurrency` at a time. Responds with NDJSON, one line
+    per input in completion order: the management payload, or the error.
+    """
+    wf_name = req.route_params.get("workflow_name")
+    try:
+        items = parse_bulk_body(req.get_body())
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        return func.HttpResponse(f"Invalid body: {e}", status_code=400)
+    try:
+        concurrency = positive_int_param(req, "concurrency", BULK_START_CONCURRENCY)
+    except ValueError as e:
+        return func.HttpResponse(f"Invalid concurrency: {e}", status_code=400)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def start(index: int, client_input, error):
+        if error is not None:
+            return dict(index=index, error=error)
+        if not isinstance(client_input, dict):
+            return dict(index=index, error="Workflow input must be a JSON object")
+        async with semaphore:
+            try:
+                instance_id = await start_workflow(client, wf_name, client_input)
+            except Exception as e:
+                return dict(index=index, error=f"{type(e).__name__}: {e}")
+        return dict(index=index, **client.create_http_management_payload(instance_id=instance_id))
+
+    tasks = [start(i, client_input, error) for i, (client_input, error) in enumerate(items)]
+    lines = [json.dumps(await line) for line in asyncio.as_completed(tasks)]
+    return func.HttpResponse(
+        "".join(line + "\n" for line in lines),
+        status_code=200,
+        mimetype="application/x-ndjson",
+    )
+
+
+@bp.route(route="workflow-events/bulk", methods=["POST"])
+@bp.durable_client_input(client_name="client")
+@metrics.instrument("http")
+async def http_bulk_raise_event(
+    req: func.HttpRequest, client: df.DurableOrchestrationClient
+):
+    """
+    Raise one external event per item in the body (NDJSON or a JSON array of
+    `{"instance_id": ..., "event_name": ..., "payload": ...}`; `event_name`
+    defaults to `?event_name=`, else "Approval"), at most `concurrency` at a
+    time and in body order. Responds with NDJSON, one line per item in
+    completion order, with the time spent waiting for a slot and raising.
+    """
+    try:
+        items = parse_bulk_body(req.get_body())
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        return func.HttpResponse(f"Invalid body: {e}", status_code=400)
+    try:
+        concurrency = positive_int_param(req, "concurrency", BULK_EVENT_CONCURRENCY)
+    except ValueError as e:
+        return func.HttpResponse(f"Invalid concurrency: {e}", status_code=400)
+    default_event_name = req.params.get("event_name", "Approval")
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    received = loop.time()
+
+    async def raise_event(index: int, item, error):
+        if error is None and not (isinstance(item, dict) and isinstance(item.get("instance_id"), str)):
+            error = "Item must be a JSON object with an instance_id"
+        if error is None and not isinstance(item.get("event_name", default_event_name), str):
+            error = "event_name must be a string"
+        if error is not None:
+            return dict(index=index, delivered=False, error=error)
+        instance_id, event_name = item["instance_id"], item.get("event_name", default_event_name)
+        line = dict(index=index, instance_id=instance_id, event_name=event_name)
+        label = event_name if event_name in METRIC_EVENT_NAMES else "other"
+        async with semaphore:
+            started = loop.time()
+            try:
+                await client.raise_event(instance_id, event_name, item.get("payload"))
+                line.update(delivered=True)
+            except Exception as e:
+                line.update(delivered=False, error=f"{type(e).__name__}: {e}")
+            finished = loop.time()
+        outcome = "delivered" if line["delivered"] else "failed"
+        metrics.registry.inc("events_raised_total", (("event", label), ("outcome", outcome)))
+        metrics.registry.observe("event_raise_seconds", (("event", label),), finished - started)
+        return dict(
+            line, queued_ms=round((started - received) * 1000, 3), raise_ms=round((finished - started) * 1000, 3)
+        )
+
+    # Scheduled here, so that slots are taken in body order
+    tasks = [asyncio.ensure_future(raise_event(i, item, error)) for i, (item, error) in enumerate(items)]
+    lines = [json.dumps(await line) for line in asyncio.as_completed(tasks)]
+    return func.HttpResponse(
+        "".join(line + "\n" for line in lines),
+        status_code=200,
+        mimetype="application/x-ndjson",
+    )
+
+
+async def get_statuses(client: df.DurableOrchestrationClient, instance_ids: list, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get_status(instance_id: str):
+        async with semaphore:
+            status = await client.get_status(instance_id)
+        return status.to_json() if status.runtime_status is not None else None
+
+    results = await asyncio.gather(*(get_status(i) for i in instance_ids))
+    return dict(zip(instance_ids, results))
+
+
+def has_changed(status: dict, known_status: str) -> bool:
+    runtime_status = status["runtimeStatus"] if status else None
+    if known_status is None:
+        return runtime_status in TERMINAL_STATUSES
+    return runtime_status != known_status
+
+
+@bp.route(route="workflow-status/wait", methods=["POST"])
+@bp.durable_client_input(client_name="client")
+@metrics.instrument("http")
+async def http_wait_for_status(
+    req: func.HttpRequest, client: df.DurableOrchestrationClient
+):
+    """
+    Long-poll a set of instances.
+
+    Body: `{"instance_ids": [...], "known": {id: runtimeStatus}, "timeout": s}`.
+    Returns as soon as any instance's runtime status differs from `known`
+    (or, for ids not in `known`, reaches a terminal state), or when the
+    timeout expires, with the current status of every instance.
+    """
+    try:
+        body = req.get_json()
+        instance_ids = body["instance_ids"]
+        if not isinstance(instance_ids, list) or not all(isinstance(i, str) for i in instance_ids):
+            raise TypeError("instance_ids must be a list of strings")
+        if not instance_ids:
+            raise ValueError("instance_ids is empty")
+        instance_ids = list(dict.fromkeys(instance_ids))
+        known = body.get("known") or {}
+        if not isinstance(known, dict) or not all(isinstance(s, str) for s in known.values()):
+            raise TypeError("known must map instance ids to runtime statuses")
+        timeout = float(body.get("timeout", STATUS_WAIT_TIMEOUT))
+        if not (math.isfinite(timeout) and timeout >= 0):
+            raise ValueError(f"timeout must be a non-negative number, got {timeout}")
+        timeout = min(timeout, STATUS_WAIT_TIMEOUT)
+    except (ValueError, KeyError, TypeError) as e:
+        return func.HttpResponse(f"Invalid body: {e!r}", status_code=400)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    interval = STATUS_POLL_INTERVAL
+    while True:
+        statuses = await get_statuses(client, instance_ids, STATUS_QUERY_CONCURRENCY)
+        changed = [i for i in instance_ids if has_changed(statuses[i], known.get(i))]
+        remaining = deadline - loop.time()
+        if changed or remaining <= 0:
+            break
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 2, STATUS_POLL_MAX_INTERVAL)
+    return func.HttpResponse(
+        json.dumps(dict(changed=changed, timedOut=not changed, statuses=statuses), default=str),
+        status_code=200,
+        mimetype="application/json",
+    )
+
+
+@bp.route(route="metrics", methods=["GET"])
+def http_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """Metrics of this worker process, in the Prometheus text format."""
+    return func.HttpResponse(
+        metrics.render(),
+        status_code=200,
+        mimetype="text/plain; version=0.0.4",
+    )
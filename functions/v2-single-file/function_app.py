@@ -1,8 +1,14 @@
 import asyncio
+import atexit
+from collections import OrderedDict
 from datetime import timedelta
+import hashlib
 import json
 import logging
+import math
+import os
 import random
+import time
 from typing import Dict
 from uuid import uuid1
 
@@ -22,12 +28,78 @@ async def http_start(req: func.HttpRequest, client: df.DurableOrchestrationClien
     return response
 
 
+### Bounded fan-out ###
+FANOUT_MAX_IN_FLIGHT = int(os.environ.get("FANOUT_MAX_IN_FLIGHT", 100))
+FANOUT_CHUNK_SIZE = int(os.environ.get("FANOUT_CHUNK_SIZE", 1000))
+
+
+def windowed(context: df.DurableOrchestrationContext, factories: list, max_in_flight: int):
+    """Run `factories` (task constructors) with a sliding window of `max_in_flight`."""
+    results = [None] * len(factories)
+    pending = {}
+    next_index = 0
+    while next_index < len(factories) or pending:
+        while next_index < len(factories) and len(pending) < max_in_flight:
+            pending[factories[next_index]()] = next_index
+            next_index += 1
+        done = yield context.task_any(list(pending))
+        index = pending.pop(done)
+        if isinstance(done.result, Exception):
+            raise done.result
+        results[index] = done.result
+    return results
+
+
+def bounded_fan_out(
+    context: df.DurableOrchestrationContext,
+    function_name: str,
+    inputs: list,
+    max_in_flight: int = FANOUT_MAX_IN_FLIGHT,
+    chunk_size: int = FANOUT_CHUNK_SIZE,
+    sub_orchestrator: bool = False,
+):
+    """
+    Call `function_name` once per input, at most `max_in_flight` at a time.
+    Inputs larger than `chunk_size` are split across `fan_out`
+    sub-orchestrations. Results come back in input order.
+    """
+    if max_in_flight <= 0 or chunk_size <= 0:
+        raise ValueError("max_in_flight and chunk_size must be positive")
+    if len(inputs) > chunk_size:
+        groups = min(chunk_size, math.ceil(len(inputs) / chunk_size))
+        size = math.ceil(len(inputs) / groups)
+        factories = [
+            lambda chunk=inputs[i : i + size]: context.call_sub_orchestrator(
+                "fan_out",
+                dict(
+                    function_name=function_name,
+                    inputs=chunk,
+                    max_in_flight=max_in_flight,
+                    chunk_size=chunk_size,
+                    sub_orchestrator=sub_orchestrator,
+                ),
+            )
+            for i in range(0, len(inputs), size)
+        ]
+        results = yield from windowed(context, factories, max_in_flight)
+        return [r for chunk in results for r in chunk]
+    call = context.call_sub_orchestrator if sub_orchestrator else context.call_activity
+    factories = [lambda input_=input_: call(function_name, input_) for input_ in inputs]
+    results = yield from windowed(context, factories, max_in_flight)
+    return results
+
+
+@app.orchestration_trigger(context_name="context")
+def fan_out(context: df.DurableOrchestrationContext):
+    results = yield from bounded_fan_out(context, **context.get_input())
+    return results
+
+
 ### Hello world ###
 @app.orchestration_trigger(context_name="context")
 def hello_world(context: df.DurableOrchestrationContext):
     names = context.get_input()
-    tasks = [context.call_activity("greet", n) for n in names]
-    results = yield context.task_all(tasks)
+    results = yield from bounded_fan_out(context, "greet", names)
     return results
 
 
@@ -81,21 +153,52 @@ def get_weather(context: df.DurableOrchestrationContext):
 @app.orchestration_trigger(context_name="context")
 def weather(context: df.DurableOrchestrationContext):
     names = context.get_input()
-    tasks = [
-        context.call_sub_orchestrator(name="get_weather", input_={"name": n})
-        for n in names
-    ]
-    results = yield context.task_all(tasks)
+    results = yield from bounded_fan_out(
+        context, "get_weather", [{"name": n} for n in names], sub_orchestrator=True
+    )
     return results
 
 
+WEATHER_BATCH_SIZE = int(os.environ.get("WEATHER_BATCH_SIZE", 100))
+
+
+@app.orchestration_trigger(context_name="context")
+def weather_batched(context: df.DurableOrchestrationContext):
+    """
+    Same output as `weather`, with one `get_city_weather_batch` activity per
+    `batch_size` cities instead of one sub-orchestration per city.
+    """
+    input_ = context.get_input()
+    if isinstance(input_, dict):
+        names = input_["names"]
+        batch_size = input_.get("batch_size", WEATHER_BATCH_SIZE)
+    else:
+        names, batch_size = input_, WEATHER_BATCH_SIZE
+    if not isinstance(batch_size, int) or isinstance(batch_size, bool) or batch_size <= 0:
+        raise ValueError(f"batch_size must be a positive integer, got {batch_size!r}")
+    geocodings = yield from bounded_fan_out(context, "get_geocoding", names)
+    locations = [WeatherIn(lat=g["lat"], lon=g["lon"]).model_dump() for g in geocodings]
+    batches = yield from bounded_fan_out(
+        context,
+        "get_city_weather_batch",
+        [locations[i : i + batch_size] for i in range(0, len(locations), batch_size)],
+    )
+    weathers = [w for batch in batches for w in batch]
+    return [
+        f"Hi from {name} (lat: {g['lat']}, long: {g['lon']}), "
+        f"it's {w.current.temperature}{w.current_units.temperature} here!"
+        for name, g, w in zip(names, geocodings, weathers)
+    ]
+
+
 ### Handle Feedback
-import httpx
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 #### Serializable Payloads
 class JsonSerializable(BaseModel):
-        
+    # Validators are built on first use rather than at import (cold start)
+    model_config = ConfigDict(defer_build=True)
+
     def to_json(self):
         return self.model_dump_json()
 
@@ -119,12 +222,14 @@ class WeatherIn(JsonSerializable):
 
 
 class WeatherCurrentUnits(BaseModel):
+    model_config = ConfigDict(defer_build=True)
     time: str
     interval: str
     temperature: str
 
 
 class WeatherCurrent(BaseModel):
+    model_config = ConfigDict(defer_build=True)
     time: str
     interval: int
     temperature: float
@@ -183,6 +288,125 @@ class OrchesratorOut(JsonSerializable):
         return OrchesratorOut.model_validate_json(obj)
 
 
+#### Shared HTTP client
+class HttpPool:
+    """
+    Shared `httpx.AsyncClient`, created lazily on the running event loop, with
+    bounded connections and request metrics.
+
+    httpx is imported on first use, so functions that make no HTTP calls
+    (e.g. hello_world) don't pay for it on cold start.
+    """
+
+    def __init__(self):
+        self.max_connections = int(os.environ.get("HTTP_POOL_LIMIT", 100))
+        self.max_keepalive_connections = int(os.environ.get("HTTP_POOL_KEEPALIVE", 20))
+        self.keepalive_expiry = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", 30))
+        self.total_timeout = float(os.environ.get("HTTP_TIMEOUT", 30))
+        self.connect_timeout = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+        self.metrics = dict(in_flight=0, requests=0, errors=0, request_time_total=0.0)
+        self._client = None
+        self._loop = None
+
+    def client(self) -> "httpx.AsyncClient":
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.total_timeout, connect=self.connect_timeout),
+            )
+            self._loop = loop
+        return self._client
+
+    async def get(self, url: str, **kwargs) -> "httpx.Response":
+        import httpx
+
+        started = time.perf_counter()
+        self.metrics["in_flight"] += 1
+        self.metrics["requests"] += 1
+        try:
+            rsp = await self.client().get(url, **kwargs)
+        except httpx.HTTPError:
+            self.metrics["errors"] += 1
+            raise
+        finally:
+            self.metrics["in_flight"] -= 1
+            self.metrics["request_time_total"] += time.perf_counter() - started
+        if rsp.status_code >= 400:
+            self.metrics["errors"] += 1
+        return rsp
+
+    def stats(self) -> dict:
+        return dict(self.metrics)
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    def close_sync(self):
+        """Shutdown hook: close the client if its event loop is still usable."""
+        loop = self._loop
+        if self._client is None or loop is None or loop.is_closed() or loop.is_running():
+            return
+        loop.run_until_complete(self.close())
+
+
+http_pool = HttpPool()
+atexit.register(http_pool.close_sync)
+
+
+#### Caching
+class TTLCache:
+    """Bounded LRU cache with a per-entry time to live."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl: float = None):
+        self._data[key] = (value, time.time() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return dict(size=len(self._data), hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+
+geocoding_cache = TTLCache(
+    maxsize=int(os.environ.get("GEOCODING_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("GEOCODING_CACHE_TTL", 7 * 24 * 3600)),
+)
+
+
+WORKFLOW_DEDUPE = os.environ.get("WORKFLOW_DEDUPE", "0") == "1"
+WORKFLOW_DEDUPE_WINDOW = float(os.environ.get("WORKFLOW_DEDUPE_WINDOW", 300))
+
+
 @app.route(route="workflow-with-feedback/{workflow_name}")
 @app.durable_client_input(client_name="client")
 async def http_start_with_feedback(
@@ -191,12 +415,36 @@ async def http_start_with_feedback(
     wf_name = req.route_params.get("workflow_name")
     client_input: dict = req.get_json()
     instance_id = str(uuid1())
+    dedupe = req.params.get("dedupe", "1" if WORKFLOW_DEDUPE else "0").lower() in ("1", "true")
+    if dedupe:
+        # Same workflow and input within the window (or the previous one, for
+        # retries just after a boundary): same instance, running or completed
+        canonical = json.dumps([wf_name, client_input], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        digest = hashlib.sha256(canonical.encode()).hexdigest()[:32]
+        bucket = int(time.time() // WORKFLOW_DEDUPE_WINDOW)
+        for instance_id in (f"{wf_name}-{digest}-{bucket - 1}", f"{wf_name}-{digest}-{bucket}"):
+            status = await client.get_status(instance_id)
+            runtime_status = status.runtime_status.name if status.runtime_status is not None else None
+            if runtime_status == "Completed":
+                return func.HttpResponse(
+                    json.dumps(status.to_json(), default=str),
+                    status_code=200,
+                    mimetype="application/json",
+                    headers={"X-Instance-Id": instance_id},
+                )
+            if runtime_status in ("Pending", "Running", "ContinuedAsNew", "Suspended"):
+                return client.create_check_status_response(req, instance_id)
     wf_mgmt = client.create_http_management_payload(instance_id=instance_id)
     input_ = OrchestratorIn(
         callback_uri_template=wf_mgmt["sendEventPostUri"],
         client_input=client_input,
     )
-    await client.start_new(wf_name, client_input=input_.model_dump(), instance_id=instance_id)
+    try:
+        await client.start_new(wf_name, client_input=input_.model_dump(), instance_id=instance_id)
+    except Exception:
+        # A concurrent duplicate started it first
+        if not dedupe or (await client.get_status(instance_id)).runtime_status is None:
+            raise
     rsp = client.create_check_status_response(req, instance_id)
     return rsp
 
@@ -249,8 +497,11 @@ def trip(context: df.DurableOrchestrationContext):
 
 @app.activity_trigger(input_name="name")
 async def get_geocoding(name: str):
-    async with httpx.AsyncClient(base_url="https://geocode.maps.co") as client:
-        rsp = await client.get(url=f"/search", params=dict(city=name))
+    key = " ".join(name.casefold().split())
+    cached = geocoding_cache.get(key)
+    if cached is not None:
+        return cached
+    rsp = await http_pool.get(url="https://geocode.maps.co/search", params=dict(city=name))
     if rsp.status_code < 200 or rsp.status_code >= 300:
         raise ConnectionError(f"Could not fetch geocoding info")
     weather_response_payload = json.loads(rsp.content)
@@ -258,6 +509,8 @@ async def get_geocoding(name: str):
         raise RuntimeError(f"Could not fetch geocoding for {name}")
     resp = weather_response_payload[0]
     logging.warning(f"{name} geocoding: {resp}")
+    geocoding_cache.set(key, resp)
+    logging.info(f"Geocoding cache: {geocoding_cache.stats()}")
     return resp
     
 
@@ -269,8 +522,7 @@ async def get_city_weather(latlon: dict) -> WeatherOut:
         longitude=round(float(latlon.lon), 3),
         current="temperature",
     )
-    async with httpx.AsyncClient(base_url="https://api.open-meteo.com") as client:
-        rsp = await client.get(url="/v1/forecast", params=query_params)
+    rsp = await http_pool.get(url="https://api.open-meteo.com/v1/forecast", params=query_params)
     if rsp.status_code < 200 or rsp.status_code >= 300:
         raise ConnectionError(f"Could not fetch weather info")
     out = WeatherOut.model_validate_json(rsp.content)
@@ -278,6 +530,36 @@ async def get_city_weather(latlon: dict) -> WeatherOut:
     return out
 
 
+@app.activity_trigger(input_name="locations")
+async def get_city_weather_batch(locations: list) -> list:
+    """open-meteo accepts comma-separated coordinates: one request per chunk."""
+    locations = [WeatherIn.model_validate(l) for l in locations]
+    chunks = [
+        locations[i : i + WEATHER_BATCH_SIZE]
+        for i in range(0, len(locations), WEATHER_BATCH_SIZE)
+    ]
+
+    async def fetch(chunk: list) -> list:
+        query_params = dict(
+            latitude=",".join(str(round(float(l.lat), 3)) for l in chunk),
+            longitude=",".join(str(round(float(l.lon), 3)) for l in chunk),
+            current="temperature",
+        )
+        rsp = await http_pool.get(url="https://api.open-meteo.com/v1/forecast", params=query_params)
+        if rsp.status_code < 200 or rsp.status_code >= 300:
+            raise ConnectionError(f"Could not fetch weather info")
+        payload = json.loads(rsp.content)
+        # A single location comes back as an object, several as a list
+        if isinstance(payload, dict):
+            payload = [payload]
+        return [WeatherOut.model_validate(p) for p in payload]
+
+    results = await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+    out = [w for chunk in results for w in chunk]
+    logging.warning(f"Weather batch: {len(out)} locations in {len(chunks)} requests")
+    return out
+
+
 @app.activity_trigger(input_name="req")
 async def ask_for_feedback(req: dict) -> bool:
     req = FeedbackReq.model_validate(req)
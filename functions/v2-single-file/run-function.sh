@@ -8,8 +8,13 @@ curl --request POST http://localhost:7071/api/workflow/hello_world --data '{"nam
 ### Sub-orchestrator
 curl --request POST http://localhost:7071/api/workflow/weather --data '{"names": ["New York", "Chicago"]}' | jq ".statusQueryGetUri"
 
+### Batched weather
+curl --request POST http://localhost:7071/api/workflow/weather_batched --data '{"names": ["New York", "Chicago"], "batch_size": 50}' | jq ".statusQueryGetUri"
+
 ### External Feedback
 curl -o - --request POST http://localhost:7071/api/workflow-with-feedback/trip --data '{"destination":"Chicago"}' | jq ".statusQueryGetUri"
+# Deduplicated: repeats within WORKFLOW_DEDUPE_WINDOW attach to the same instance, or get its output once completed
+curl -o - --request POST "http://localhost:7071/api/workflow-with-feedback/trip?dedupe=1" --data '{"destination":"Chicago"}' | jq
 
 #### Feedback
 # Use the callback uri from the get_feedback logging